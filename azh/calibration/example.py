@@ -9,18 +9,28 @@ from columnflow.production.cms.seeds import deterministic_seeds
 from columnflow.util import maybe_import
 from columnflow.columnar_util import set_ak_column
 
+from azh.calibration.met import met_type1
+from azh.util import flat_jagged_view
+
 np = maybe_import("numpy")
 ak = maybe_import("awkward")
 
 
+# type-1 MET propagation of the fake jec variations below
+met_type1_example = met_type1.derive(
+    "met_type1_example",
+    cls_dict={"jet_variations": ["jec_up", "jec_down"]},
+)
+
+
 @calibrator(
     uses={
-        deterministic_seeds,
-        "Jet.pt", "Jet.mass",
+        deterministic_seeds, met_type1_example,
+        "Jet.pt", "Jet.mass", "Jet.rawFactor",
     },
     produces={
-        deterministic_seeds,
-        "Jet.pt", "Jet.mass",
+        deterministic_seeds, met_type1_example,
+        "Jet.pt", "Jet.mass", "Jet.pt_raw",
         "Jet.pt_jec_up", "Jet.mass_jec_up",
         "Jet.pt_jec_down", "Jet.mass_jec_down",
     },
@@ -28,18 +38,26 @@ ak = maybe_import("awkward")
 def example(self: Calibrator, events: ak.Array, **kwargs) -> ak.Array:
     # a) "correct" Jet.pt by scaling four momenta by 1.1 (pt<30) or 0.9 (pt<=30)
     # b) add 4 new columns faking the effect of JEC variations
+    # c) propagate the nominal correction and all variations to MET
 
     # add deterministic seeds that could (e.g.) be used for smearings
     events = self[deterministic_seeds](events, **kwargs)
 
+    # store the raw jet pt before any correction (as jec calibrators do) as reference for the MET
+    # propagation, so that MET includes the nano jec on top of which the example applies its own
+    events = set_ak_column(events, "Jet.pt_raw", events.Jet.pt * (1.0 - events.Jet.rawFactor))
+
     # a)
-    pt_mask = ak.flatten(events.Jet.pt < 30)
-    n_jet_pt = np.asarray(ak.flatten(events.Jet.pt))
-    n_jet_mass = np.asarray(ak.flatten(events.Jet.mass))
+    # (jet columns are read from the input, so copy them once instead of writing to their buffers)
+    n_jet_pt, wrap_pt = flat_jagged_view(events.Jet.pt, force_copy=True)
+    n_jet_mass, wrap_mass = flat_jagged_view(events.Jet.mass, force_copy=True)
+    pt_mask = n_jet_pt < 30
     n_jet_pt[pt_mask] *= 1.1
     n_jet_pt[~pt_mask] *= 0.9
     n_jet_mass[pt_mask] *= 1.1
     n_jet_mass[~pt_mask] *= 0.9
+    events = set_ak_column(events, "Jet.pt", wrap_pt())
+    events = set_ak_column(events, "Jet.mass", wrap_mass())
 
     # b)
     events = set_ak_column(events, "Jet.pt_jec_up", events.Jet.pt * 1.05)
@@ -47,4 +65,7 @@ def example(self: Calibrator, events: ak.Array, **kwargs) -> ak.Array:
     events = set_ak_column(events, "Jet.pt_jec_down", events.Jet.pt * 0.95)
     events = set_ak_column(events, "Jet.mass_jec_down", events.Jet.mass * 0.95)
 
+    # c)
+    events = self[met_type1_example](events, **kwargs)
+
     return events
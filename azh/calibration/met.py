@@ -0,0 +1,114 @@
+# coding: utf-8
+
+"""
+Calibration methods propagating jet corrections to MET.
+"""
+
+from __future__ import annotations
+
+from columnflow.calibration import Calibrator, calibrator
+from columnflow.util import maybe_import
+from columnflow.columnar_util import set_ak_column
+
+from azh.config.routing import get_routing_index
+
+np = maybe_import("numpy")
+ak = maybe_import("awkward")
+
+
+def segmented_sum(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Sums the rows of a 2D array *values* (flat jets x variations) within segments defined by
+    *offsets* (one more entry than events) and returns an array of shape (events, variations).
+    Empty segments are handled naturally by differences of the cumulative sum.
+    """
+    csum = np.zeros((values.shape[0] + 1, values.shape[1]), dtype=np.float64)
+    np.cumsum(values, axis=0, out=csum[1:])
+    return csum[offsets[1:]] - csum[offsets[:-1]]
+
+
+@calibrator(
+    uses={
+        "Jet.pt", "Jet.phi", "Jet.rawFactor",
+        "RawMET.pt", "RawMET.phi",
+    },
+    produces={
+        "MET.pt", "MET.phi",
+    },
+    # names of jet variations to propagate, e.g. "jec_Total_up", inferred from the config when None
+    jet_variations=None,
+    # minimum corrected jet pt for the type-1 correction
+    min_jet_pt=15.0,
+)
+def met_type1(self: Calibrator, events: ak.Array, **kwargs) -> ak.Array:
+    """
+    Type-1 MET correction for the nominal jet calibration and all jet variations in
+    *jet_variations* at once. Corrected and varied jet pts are stacked into a single
+    (jets x variations) array whose per-event differences to the raw jet pt are summed in one
+    segmented pass, yielding "MET.pt"/"MET.phi" as well as "MET.pt_{var}"/"MET.phi_{var}".
+    """
+    # flat jet columns and offsets
+    counts = np.asarray(ak.num(events.Jet.pt, axis=1))
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    phi = np.asarray(ak.flatten(events.Jet.phi), dtype=np.float64)
+
+    # raw jet pt before any correction, preferring the column stored by jet calibrators over the
+    # nano raw factor, so that the full correction is propagated relative to RawMET
+    if "pt_raw" in events.Jet.fields:
+        pt_raw = events.Jet.pt_raw
+    else:
+        pt_raw = events.Jet.pt * (1.0 - events.Jet.rawFactor)
+    pt_raw = np.asarray(ak.flatten(pt_raw), dtype=np.float64)
+
+    # corrected pts for nominal (first column) and all variations
+    pt = np.stack(
+        [np.asarray(ak.flatten(events.Jet.pt), dtype=np.float64)] + [
+            np.asarray(ak.flatten(events.Jet[f"pt_{var}"]), dtype=np.float64)
+            for var in self.jet_variations
+        ],
+        axis=1,
+    )
+
+    # pt differences of jets entering the correction
+    delta_pt = np.where(pt > self.min_jet_pt, pt - pt_raw[:, None], 0.0)
+
+    # per-event sums of the x and y components in a single pass
+    sum_dpx = segmented_sum(delta_pt * np.cos(phi)[:, None], offsets)
+    sum_dpy = segmented_sum(delta_pt * np.sin(phi)[:, None], offsets)
+
+    # correct the raw MET
+    met_pt_raw = np.asarray(events.RawMET.pt, dtype=np.float64)
+    met_phi_raw = np.asarray(events.RawMET.phi, dtype=np.float64)
+    met_px = (met_pt_raw * np.cos(met_phi_raw))[:, None] - sum_dpx
+    met_py = (met_pt_raw * np.sin(met_phi_raw))[:, None] - sum_dpy
+    met_pt = np.sqrt(met_px**2 + met_py**2).astype(np.float32)
+    met_phi = np.arctan2(met_py, met_px).astype(np.float32)
+
+    # store columns
+    events = set_ak_column(events, "MET.pt", met_pt[:, 0])
+    events = set_ak_column(events, "MET.phi", met_phi[:, 0])
+    for i, var in enumerate(self.jet_variations, 1):
+        events = set_ak_column(events, f"MET.pt_{var}", met_pt[:, i])
+        events = set_ak_column(events, f"MET.phi_{var}", met_phi[:, i])
+
+    return events
+
+
+@met_type1.init
+def met_type1_init(self: Calibrator) -> None:
+    jet_variations = self.jet_variations
+    if jet_variations is None:
+        jet_variations = []
+        if getattr(self, "config_inst", None):
+            # all shifts that alias the jet pt to a varied column
+            index = get_routing_index(self.config_inst)
+            jet_variations = sorted(
+                shift_name
+                for shift_name in index.shifts_aliasing("Jet.pt")
+                if index.resolve("Jet.pt", shift_name) == f"Jet.pt_{shift_name}"
+            )
+
+    self.jet_variations = list(jet_variations)
+    self.uses |= {f"Jet.pt_{var}" for var in self.jet_variations}
+    self.produces |= {f"MET.{field}_{var}" for field in ["pt", "phi"] for var in self.jet_variations}
@@ -4,8 +4,15 @@
 Collection of patches of underlying columnflow tasks.
 """
 
+from __future__ import annotations
+
 import os
+import inspect
+import functools
+import itertools
+import contextlib
 
+import luigi
 import law
 from columnflow.util import memoize
 
@@ -34,6 +41,739 @@ def patch_bundle_repo_exclude_files():
     logger.debug("patched exclude_files of cf.BundleRepo")
 
 
+def _estimate_source(source):
+    # extract what the chunker can estimate from chunked io sources, which can be paths, targets,
+    # opened uproot files (e.g. remote nano files) or tuples of one of these and a source type
+    if isinstance(source, (tuple, list)) and source:
+        source = source[0]
+    if isinstance(source, str):
+        return source
+    if hasattr(source, "keys") and hasattr(source, "file_path"):
+        return source
+    for attr in ("abspath", "path"):
+        path = getattr(source, attr, None)
+        if isinstance(path, str) and os.path.exists(path):
+            return path
+    return None
+
+
+def _source_name(source) -> str:
+    return os.path.basename(source if isinstance(source, str) else str(source.file_path))
+
+
+def _flat_columns(columns) -> list[str]:
+    # flatten read columns, which are either a set of columns or one set per source
+    flat = []
+    for c in law.util.make_list(columns or []):
+        if isinstance(c, (set, list, tuple)):
+            flat.extend(_flat_columns(c))
+        else:
+            flat.append(str(c))
+    return flat
+
+
+def _run_body(task_cls):
+    # undecorated body of the run method of *task_cls*, i.e., without the law decorators that
+    # localize outputs and remove them on errors
+    return inspect.unwrap(task_cls.run)
+
+
+@memoize
+def patch_chunked_io_adaptive_chunk_size():
+    from columnflow.columnar_util import ChunkedIOHandler
+    from azh.io.chunking import AdaptiveChunker, iter_split_chunks
+
+    orig_init = ChunkedIOHandler.__init__
+
+    @functools.wraps(orig_init)
+    def __init__(self, source, *args, **kwargs):
+        # derive the chunk size from the target rss when not set explicitly
+        chunker = None
+        if len(args) < 2 and kwargs.get("chunk_size") is None:
+            try:
+                sources = source if isinstance(source, list) else [source]
+                sources = [s for s in map(_estimate_source, sources) if s is not None]
+                columns = _flat_columns(kwargs.get("read_columns")) or None
+                chunker = AdaptiveChunker.from_law_config(
+                    sources,
+                    columns=columns,
+                    name=", ".join(map(_source_name, sources)),
+                    key=",".join(sorted(columns or ["*"])),
+                )
+                if chunker is not None:
+                    kwargs["chunk_size"] = chunker.size
+            except Exception as e:
+                # never fail the io handler, but fall back to the default chunk size
+                logger.warning(f"adaptive chunk sizing failed, using default chunk size: {e}")
+                chunker = None
+
+        orig_init(self, source, *args, **kwargs)
+        self._azh_chunker = chunker
+
+    orig_iter = ChunkedIOHandler.__iter__
+
+    @functools.wraps(orig_iter)
+    def __iter__(self):
+        chunker = getattr(self, "_azh_chunker", None)
+        if chunker is None:
+            yield from orig_iter(self)
+            return
+
+        # entry ranges are fixed at this point, so chunks are split when the rss right before
+        # processing them is too high, and measurements after each processed chunk refine the
+        # estimate used by subsequent handlers in this process
+        yield from iter_split_chunks(orig_iter(self), chunker)
+        chunker._log(chunker.summary())
+
+    ChunkedIOHandler.__init__ = __init__
+    ChunkedIOHandler.__iter__ = __iter__
+
+    logger.debug("patched __init__ and __iter__ of ChunkedIOHandler for adaptive chunk sizes")
+
+
+@memoize
+def patch_parquet_writer():
+    import columnflow.columnar_util
+    from azh.io.storage import get_active_policy
+    from azh.io.writer import write
+
+    row_group_size = law.config.get_expanded_int("analysis", "parquet_row_group_size", None)
+
+    orig_to_parquet = columnflow.columnar_util.sorted_ak_to_parquet
+
+    @functools.wraps(orig_to_parquet)
+    def sorted_ak_to_parquet(ak_array, *args, **kwargs):
+        # bounded row groups with min/max statistics allow readers to skip row groups
+        # (see azh/io/parquet.py)
+        if row_group_size:
+            kwargs.setdefault("row_group_size", row_group_size)
+        kwargs.setdefault("parquet_metadata_statistics", True)
+
+        # per-column dtypes and codecs of the running task (see azh/io/storage.py)
+        policy = get_active_policy()
+
+        def _write():
+            arr = ak_array
+            if policy is not None:
+                arr = policy.apply(arr)
+                for key, value in policy.writer_kwargs(arr).items():
+                    kwargs.setdefault(key, value)
+            orig_to_parquet(arr, *args, **kwargs)
+
+        # write in the background when the running task has an active writer (see azh/io/writer.py)
+        write(_write)
+
+    columnflow.columnar_util.sorted_ak_to_parquet = sorted_ak_to_parquet
+
+    logger.debug(
+        "patched sorted_ak_to_parquet for row group sizes, column storage policies and "
+        "background writing",
+    )
+
+
+@memoize
+def patch_merge_parquet_flush():
+    law.contrib.load("pyarrow")
+    from azh.io.writer import get_active_writer
+
+    orig_merge = law.pyarrow.merge_parquet_task
+
+    @functools.wraps(orig_merge)
+    def merge_parquet_task(*args, **kwargs):
+        # chunk files must be completely written before merging
+        writer = get_active_writer()
+        if writer is not None:
+            writer.flush()
+        return orig_merge(*args, **kwargs)
+
+    law.pyarrow.merge_parquet_task = merge_parquet_task
+
+    logger.debug("patched law.pyarrow.merge_parquet_task to flush background writers")
+
+
+@memoize
+def patch_background_writer():
+    from columnflow.tasks.selection import SelectEvents
+    from columnflow.tasks.reduction import ReduceEvents
+    from columnflow.tasks.production import ProduceColumns
+    from azh.io.writer import with_background_writer
+
+    max_pending = law.config.get_expanded_int("analysis", "background_writer_max_pending", 0)
+    if max_pending < 1:
+        return
+
+    def patch_run(task_cls):
+        # pending writes must be done before outputs are localized, and failed writes must be raised
+        # while outputs are still removed on errors, so wrap the undecorated body and decorate it
+        # like the columnflow implementations
+        orig_body = _run_body(task_cls)
+
+        @law.decorator.log
+        @law.decorator.localize(input=False)
+        @law.decorator.safe_output
+        @functools.wraps(orig_body)
+        def run(self, *args, **kwargs):
+            # merging requires pyarrow, so only patch it when running in the sandbox
+            patch_merge_parquet_flush()
+            body = with_background_writer(orig_body, max_pending=max_pending, name=self.task_family)
+            return body(self, *args, **kwargs)
+
+        task_cls.run = run
+
+    for task_cls in [SelectEvents, ReduceEvents, ProduceColumns]:
+        patch_run(task_cls)
+
+    logger.debug(
+        "patched run of selection, reduction and production tasks to write in the background",
+    )
+
+
+@memoize
+def patch_chunk_pool():
+    from columnflow.tasks.selection import SelectEvents
+    from columnflow.tasks.production import ProduceColumns
+    from columnflow.columnar_util import mandatory_coffea_columns, update_ak_array, add_ak_aliases
+    from azh.io.parallel import ChunkPool, ChunkLookahead, pooled_calls, array_function_factory
+
+    n_workers = law.config.get_expanded_int("analysis", "chunk_pool_workers", 0)
+    if n_workers < 2:
+        return
+
+    def patch_task(task_cls, kind, get_output_columns):
+        orig_run = task_cls.run
+        orig_iter = task_cls.iter_chunked_io
+
+        @functools.wraps(orig_run)
+        def run(self, *args, **kwargs):
+            inst = getattr(self, f"{kind}_inst")
+            factory = array_function_factory(
+                getattr(self, kind),
+                kind,
+                self.config_inst,
+                self.dataset_inst,
+                self.global_shift_inst,
+                setup_inputs=self.input().get(kind),
+                output_columns=get_output_columns(inst),
+            )
+            with ChunkPool(factory, n_workers=n_workers) as pool:
+                self._chunk_pool = pool
+                try:
+                    return orig_run(self, *args, **kwargs)
+                finally:
+                    self._chunk_pool = None
+
+        @functools.wraps(orig_iter)
+        def iter_chunked_io(self, *args, **kwargs):
+            pool = getattr(self, "_chunk_pool", None)
+            if pool is None:
+                yield from orig_iter(self, *args, **kwargs)
+                return
+
+            aliases = self.local_shift_inst.x("column_aliases", {})
+
+            def prepare(chunk):
+                # same steps as in the chunk loop before the selector or producer is called
+                events, *columns = chunk if isinstance(chunk, (list, tuple)) else (chunk,)
+                events = update_ak_array(events, *columns)
+                events = add_ak_aliases(
+                    events,
+                    aliases,
+                    remove_src=True,
+                    missing_strategy=self.missing_column_alias_strategy,
+                )
+                # empty chunks are handled by the loop itself
+                return events if len(events) else None
+
+            lookahead = ChunkLookahead(
+                pool,
+                orig_iter(self, *args, **kwargs),
+                prepare,
+                stats=kind == "selector",
+            )
+            with pooled_calls(getattr(self, f"{kind}_inst"), lookahead):
+                yield from lookahead
+
+        task_cls.run = run
+        task_cls.iter_chunked_io = iter_chunked_io
+
+    # workers only return the columns that the tasks write
+    patch_task(
+        SelectEvents,
+        "selector",
+        lambda inst: mandatory_coffea_columns | inst.produced_columns,
+    )
+    patch_task(ProduceColumns, "producer", lambda inst: inst.produced_columns)
+
+    logger.debug(
+        f"patched chunk loops of cf.SelectEvents and cf.ProduceColumns to run in {n_workers} "
+        "worker processes",
+    )
+
+
+@memoize
+def patch_reduce_events_storage_policy():
+    from columnflow.tasks.reduction import ReduceEvents
+    from azh.io.storage import ColumnStoragePolicy, active_policy
+
+    orig_run = ReduceEvents.run
+
+    @functools.wraps(orig_run)
+    def run(self, *args, **kwargs):
+        policy = ColumnStoragePolicy.from_config(self.config_inst, self.task_family)
+        with active_policy(policy):
+            return orig_run(self, *args, **kwargs)
+
+    ReduceEvents.run = run
+
+    logger.debug("patched run of cf.ReduceEvents to apply column storage policies")
+
+
+@memoize
+def patch_reduce_events_selection_index():
+    from columnflow.columnar_util import ChunkedIOHandler
+    from columnflow.tasks.reduction import ReduceEvents
+    from azh.io.selection_index import (
+        SelectionIndex, active_selection_index, get_active_selection_index, read_selected_chunk,
+    )
+
+    if not law.config.get_expanded_boolean("analysis", "reduce_selected_clusters", True):
+        return
+
+    def cluster_offsets(source_object):
+        # coffea sources are opened files, uproot sources trees
+        tree = source_object
+        if hasattr(tree, "keys") and "Events" in tree:
+            tree = tree["Events"]
+        if not hasattr(tree, "common_entry_offsets"):
+            return None
+        return tree.common_entry_offsets()
+
+    def patch_read(attr, root):
+        if not hasattr(ChunkedIOHandler, attr):
+            logger.debug(f"ChunkedIOHandler has no {attr}, skip selection index patch")
+            return
+
+        orig_read = getattr(ChunkedIOHandler, attr).__func__
+
+        @functools.wraps(orig_read)
+        def read(cls, source_object, chunk_pos, *args, **kwargs):
+            active = get_active_selection_index()
+            if active is None:
+                return orig_read(cls, source_object, chunk_pos, *args, **kwargs)
+
+            # sources defining the event mask must be read as they are
+            path = getattr(source_object, "path", None)
+            if not root and path is None:
+                raise RuntimeError(
+                    f"cannot identify the source of {source_object!r} to read selected entries, "
+                    "set reduce_selected_clusters to False in the law config",
+                )
+            if path in active[1]:
+                return orig_read(cls, source_object, chunk_pos, *args, **kwargs)
+
+            # root files are read per cluster with selected entries, other sources entirely
+            offsets = cluster_offsets(source_object) if root else None
+            if root and offsets is None:
+                return orig_read(cls, source_object, chunk_pos, *args, **kwargs)
+            return read_selected_chunk(
+                lambda pos: orig_read(cls, source_object, pos, *args, **kwargs),
+                chunk_pos,
+                active[0],
+                offsets=offsets,
+            )
+
+        setattr(ChunkedIOHandler, attr, classmethod(read))
+
+    for attr, root in [
+        ("read_coffea_root", True),
+        ("read_uproot_root", True),
+        ("read_awkward_parquet", False),
+    ]:
+        patch_read(attr, root)
+
+    orig_run = ReduceEvents.run
+
+    @functools.wraps(orig_run)
+    def run(self, *args, **kwargs):
+        # the index reflects the full event selection, not a subset of selector steps
+        if self.selector_steps:
+            return orig_run(self, *args, **kwargs)
+
+        import awkward as ak
+
+        results = self.input()["selection"]["results"]
+        mask = ak.from_parquet(results.path, columns=["event"])["event"]
+        index = SelectionIndex.from_mask(mask)
+        self.publish_message(
+            f"reading {index.n_selected} of {index.n_entries} entries in {len(index.ranges)} "
+            "selected ranges",
+        )
+        with active_selection_index(index, skip_paths=[results.path]):
+            return orig_run(self, *args, **kwargs)
+
+    ReduceEvents.run = run
+
+    logger.debug("patched chunk reading of cf.ReduceEvents to read clusters with selected entries")
+
+
+@memoize
+def patch_chunked_io_upcast():
+    from columnflow.columnar_util import ChunkedIOHandler
+    from azh.io.storage import upcast
+
+    if not hasattr(ChunkedIOHandler, "read_awkward_parquet"):
+        logger.debug("ChunkedIOHandler has no read_awkward_parquet, skip upcast patch")
+        return
+
+    orig_read = ChunkedIOHandler.read_awkward_parquet.__func__
+
+    @functools.wraps(orig_read)
+    def read_awkward_parquet(cls, *args, **kwargs):
+        # restore standard widths of columns narrowed by storage policies (see azh/io/storage.py)
+        return upcast(orig_read(cls, *args, **kwargs))
+
+    ChunkedIOHandler.read_awkward_parquet = classmethod(read_awkward_parquet)
+
+    logger.debug("patched read_awkward_parquet of ChunkedIOHandler to upcast narrow columns")
+
+
+@memoize
+def patch_nano_sampling():
+    from columnflow.columnar_util import ChunkedIOHandler
+    from columnflow.tasks.calibration import CalibrateEvents
+    from columnflow.tasks.selection import SelectEvents
+    from columnflow.tasks.reduction import ReduceEvents
+    from azh.io.sampling import (
+        active_sampling, get_active_sampling, get_sampling_fraction, sampled_entries,
+    )
+
+    def patch_open(attr):
+        if not hasattr(ChunkedIOHandler, attr):
+            logger.debug(f"ChunkedIOHandler has no {attr}, skip sampling patch")
+            return
+
+        orig_open = getattr(ChunkedIOHandler, attr).__func__
+
+        @functools.wraps(orig_open)
+        def open_source(cls, *args, **kwargs):
+            # cap the number of entries so that only the leading sampled entries are read
+            source_object, n_entries = orig_open(cls, *args, **kwargs)
+            return source_object, sampled_entries(n_entries, get_active_sampling())
+
+        setattr(ChunkedIOHandler, attr, classmethod(open_source))
+
+    def patch_run(task_cls):
+        orig_run = task_cls.run
+
+        @functools.wraps(orig_run)
+        def run(self, *args, **kwargs):
+            with active_sampling(get_sampling_fraction(self)):
+                return orig_run(self, *args, **kwargs)
+
+        task_cls.run = run
+
+    for attr in ["open_coffea_root", "open_uproot_root"]:
+        patch_open(attr)
+
+    # all tasks reading nano files must sample identically to keep their outputs aligned
+    for task_cls in [CalibrateEvents, SelectEvents, ReduceEvents]:
+        patch_run(task_cls)
+
+    logger.debug("patched opening of nano files and tasks reading them for event sampling")
+
+
+@memoize
+def patch_iter_nano_files_prefetch():
+    import tempfile
+    import getpass
+    from columnflow.tasks.external import GetDatasetLFNs
+    from azh.io.prefetch import Prefetcher, StageArea, fetch_source
+
+    n_ahead = law.config.get_expanded_int("analysis", "nano_prefetch_files", 0)
+    if n_ahead < 1:
+        return
+
+    max_size = law.config.get_expanded("analysis", "nano_prefetch_max_size", None)
+    max_bytes = None
+    if max_size not in (None, "", "None"):
+        max_bytes = law.util.parse_bytes(max_size, unit="bytes")
+    stage_dir = law.config.get_expanded("analysis", "nano_prefetch_dir", None)
+    if not stage_dir:
+        # shared by all processes of the user on this node
+        tmp_base = law.config.get_expanded("target", "tmp_dir", None) or tempfile.gettempdir()
+        stage_dir = os.path.join(tmp_base, f"azh_nano_stage_{getpass.getuser()}")
+
+    # files of the next branch, staged while the current branch is processed
+    stage_area = StageArea(stage_dir, max_bytes=max_bytes)
+
+    orig_iter = GetDatasetLFNs.iter_nano_files
+
+    def stage_next_branch(lfn_task, branch_task, *args, **kwargs):
+        if not branch_task.is_branch() or branch_task.branch + 1 not in branch_task.branch_map:
+            return
+        next_task = branch_task.req(branch_task, branch=branch_task.branch + 1)
+
+        def sources():
+            for _, target in orig_iter(lfn_task, next_task, *args, **kwargs):
+                if getattr(getattr(target, "fs", None), "cache", None) is None:
+                    yield target.path, target
+
+        stage_area.stage(sources)
+
+    def fetch(target, dst):
+        # use files staged by a previous branch
+        path = stage_area.claim(target.path)
+        if path is None:
+            fetch_source(target, dst)
+        else:
+            os.replace(path, dst)
+
+    @functools.wraps(orig_iter)
+    def iter_nano_files(self, branch_task, *args, **kwargs):
+        # files of this branch were staged by the previous one, then start with the next branch
+        stage_area.wait()
+        stage_next_branch(self, branch_task, *args, **kwargs)
+        items = orig_iter(self, branch_task, *args, **kwargs)
+
+        # file systems with an active cache stage files themselves, so only staged files of
+        # previous branches are used, and more than one file are required for overlapping
+        head = list(itertools.islice(items, 2))
+        fs = getattr(head[0][1], "fs", None) if head else None
+        if n_ahead < 2 or len(head) < 2 or getattr(fs, "cache", None) is not None:
+            for index, target in itertools.chain(head, items):
+                path = stage_area.claim(target.path)
+                if path is None:
+                    yield index, target
+                    continue
+                try:
+                    yield index, law.LocalFileTarget(path)
+                finally:
+                    os.remove(path)
+            return
+
+        # remember indices of the lfns while their targets are staged ahead of time
+        indices = []
+
+        def targets():
+            for index, target in itertools.chain(head, items):
+                indices.append(index)
+                yield target
+
+        tmp_dir = law.LocalDirectoryTarget(is_tmp=True)
+        tmp_dir.touch()
+        prefetcher = Prefetcher(
+            targets(),
+            tmp_dir.abspath,
+            n_ahead=n_ahead,
+            max_bytes=max_bytes,
+            fetch=fetch,
+        )
+        staged = iter(prefetcher)
+        try:
+            for i, (_, path) in enumerate(staged):
+                yield indices[i], law.LocalFileTarget(path)
+        finally:
+            # stop the prefetcher, removing staged and partial files, before the staging directory
+            staged.close()
+            tmp_dir.remove()
+
+    GetDatasetLFNs.iter_nano_files = iter_nano_files
+
+    logger.debug(
+        f"patched iter_nano_files of cf.GetDatasetLFNs to stage files of the next branch in "
+        f"{stage_dir} and to prefetch {n_ahead} files of multi-file branches",
+    )
+
+
+@memoize
+def patch_merge_reduced_events_streaming():
+    from columnflow.tasks.reduction import MergeReducedEvents
+    from azh.io.merge import stream_merge_parquet
+    from azh.io.storage import ColumnStoragePolicy
+
+    max_buffered = law.config.get_expanded_int("analysis", "merge_max_buffered_row_groups", 0)
+    if max_buffered < 1:
+        return
+
+    row_group_size = law.config.get_expanded_int("analysis", "parquet_row_group_size", None)
+
+    def get_events(target):
+        # inputs and outputs are either event targets or dicts containing them
+        return target["events"] if isinstance(target, dict) else target
+
+    def merge(self, inputs, output):
+        inputs = [get_events(inp) for inp in inputs]
+        output = get_events(output)
+
+        writer_opts = None
+        if hasattr(self, "get_parquet_writer_opts"):
+            writer_opts = self.get_parquet_writer_opts()
+
+        # keep the per-column codecs the reduced files were written with
+        policy = ColumnStoragePolicy.from_config(self.config_inst, "cf.ReduceEvents")
+
+        with contextlib.ExitStack() as stack:
+            src_paths = [stack.enter_context(inp.localize("r")).abspath for inp in inputs]
+            tmp_output = stack.enter_context(output.localize("w"))
+            n_rows = stream_merge_parquet(
+                src_paths,
+                tmp_output.abspath,
+                row_group_size=row_group_size,
+                max_buffered_row_groups=max_buffered,
+                writer_opts=writer_opts,
+                policy=policy,
+            )
+
+        self.publish_message(f"merged {len(inputs)} files with {n_rows} events")
+
+    MergeReducedEvents.merge = merge
+
+    logger.debug(
+        "patched merge of cf.MergeReducedEvents to merge row groups in a streaming fashion",
+    )
+
+
+@memoize
+def patch_correctionlib_cache():
+    try:
+        import correctionlib  # noqa: F401
+    except ImportError:
+        # not available outside of columnar sandboxes
+        return
+
+    from azh.io.corrections import install
+
+    install()
+
+    logger.debug("patched correctionlib.CorrectionSet to cache compiled correction sets")
+
+
+@memoize
+def patch_bundle_external_files_mirror():
+    from columnflow.tasks.external import BundleExternalFiles
+    from azh.io.mirror import get_mirror, mirrored_external_files
+
+    if get_mirror() is None:
+        return
+
+    if not hasattr(BundleExternalFiles, "create_unique_basename"):
+        logger.debug("BundleExternalFiles has no create_unique_basename, skip mirror patch")
+        return
+
+    # local paths of mirrored files mapped to their original sources while fetching
+    local_sources = {}
+
+    orig_basename = BundleExternalFiles.create_unique_basename.__func__
+
+    @functools.wraps(orig_basename)
+    def create_unique_basename(cls, path):
+        # name bundled files after their original sources, independent of the mirror location
+        if isinstance(path, tuple) and path and path[0] in local_sources:
+            path = (local_sources[path[0]],) + path[1:]
+        elif isinstance(path, str) and path in local_sources:
+            path = local_sources[path]
+        return orig_basename(cls, path)
+
+    orig_run = BundleExternalFiles.run
+
+    @functools.wraps(orig_run)
+    def run(self, *args, **kwargs):
+        # the hash of the bundle is based on the original sources, so create and cache it before
+        # fetching
+        getattr(self, "files_hash", None)
+        self.output()
+        with mirrored_external_files(self.config_inst) as sources:
+            local_sources.update(sources)
+            try:
+                return orig_run(self, *args, **kwargs)
+            finally:
+                local_sources.clear()
+
+    BundleExternalFiles.create_unique_basename = classmethod(create_unique_basename)
+    BundleExternalFiles.run = run
+
+    logger.debug("patched cf.BundleExternalFiles to fetch external files from the local mirror")
+
+
+@memoize
+def patch_create_histograms_producer_ipc():
+    from columnflow.tasks.histograms import CreateHistograms
+    from azh.tasks.columns import ProduceColumnsIPC
+
+    def patch_requires(attr):
+        orig_requires = getattr(CreateHistograms, attr)
+
+        @functools.wraps(orig_requires)
+        def requires(self):
+            # read produced columns from memory-mapped ipc files instead of parquet files
+            reqs = orig_requires(self)
+            if reqs.get("producers"):
+                reqs["producers"] = [ProduceColumnsIPC.req(task) for task in reqs["producers"]]
+            return reqs
+
+        setattr(CreateHistograms, attr, requires)
+
+    patch_requires("workflow_requires")
+    patch_requires("requires")
+
+    logger.debug("patched requirements of cf.CreateHistograms to read produced columns from ipc")
+
+
+@memoize
+def patch_create_histograms_fused():
+    from columnflow.tasks.histograms import CreateHistograms
+    from azh.histogramming.fused import fused_variable_names, create_histograms_fused
+
+    if not law.config.get_expanded_boolean("analysis", "fused_histograms", True):
+        return
+    producer_ipc = law.config.get_expanded_boolean("analysis", "histograms_producer_ipc", False)
+
+    orig_body = _run_body(CreateHistograms)
+
+    @law.decorator.log
+    @law.decorator.localize(input=True, output=False)
+    @law.decorator.safe_output
+    def run(self):
+        # multi-dimensional variables are only supported by the columnflow implementation
+        if fused_variable_names(self) is None:
+            return orig_body(self)
+        return create_histograms_fused(self, producer_ipc=producer_ipc)
+
+    CreateHistograms.run = run
+
+    logger.debug("patched run of cf.CreateHistograms to fill all variables in a single pass")
+
+
+@memoize
+def patch_task_modules():
+    # replaces run methods by their decorated bodies, so it must precede patches wrapping them
+    patch_background_writer()
+    patch_chunked_io_adaptive_chunk_size()
+    patch_parquet_writer()
+    patch_reduce_events_storage_policy()
+    patch_chunked_io_upcast()
+    patch_reduce_events_selection_index()
+    patch_nano_sampling()
+    patch_iter_nano_files_prefetch()
+    patch_chunk_pool()
+    patch_merge_reduced_events_streaming()
+    patch_create_histograms_fused()
+    patch_correctionlib_cache()
+    patch_bundle_external_files_mirror()
+
+
 @memoize
 def patch_all():
     patch_bundle_repo_exclude_files()
+
+    # requirements are resolved before any task starts, so they must be patched right away, which
+    # imports columnflow task modules and is therefore only done when enabled
+    if law.config.get_expanded_boolean("analysis", "histograms_producer_ipc", False):
+        patch_create_histograms_producer_ipc()
+
+    # the remaining patches import columnflow task modules and sandbox-only packages, so apply them
+    # only once the first task starts running (in the process that runs it, e.g. in a sandbox) to
+    # keep "import azh" and "law index" fast
+    @luigi.Task.event_handler(luigi.Event.START)
+    def on_start(task):
+        patch_task_modules()
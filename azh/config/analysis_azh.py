@@ -5,6 +5,7 @@ Configuration of the AZH analysis.
 """
 
 import functools
+import importlib
 
 
 import law
@@ -65,33 +66,68 @@ analysis_azh.set_aux("config_groups", {})
 # setup configs
 #
 
-# an example config is setup below, based on cms NanoAOD v9 for Run2 2017, focussing on
-# ttbar and single top MCs, plus single muon data
-# update this config or add additional ones to accomodate the needs of your analysis
-from azh.config.config_run2 import add_config
-# from cmsdb.campaigns.run2_2017_nano_v9 import campaign_run2_2017_nano_v9
-import cmsdb.campaigns.run2_2017_nano_v9
-campaign_run2_2017_nano_v9 = cmsdb.campaigns.run2_2017_nano_v9.campaign_run2_2017_nano_v9
-
-# copy the campaign
-# (creates copies of all linked datasets, processes, etc. to allow for encapsulated customization)
-# campaign = campaign_run2_2017_nano_v9.copy()
-config_2017 = add_config(
-    analysis_azh,
-    campaign_run2_2017_nano_v9.copy(),
+# configs are registered as lazy factories, so that the campaign is only loaded and copied and
+# add_config is only run once a config is actually requested via analysis_azh.get_config(name)
+def add_lazy_config(
+    campaign_module: str,
+    campaign_attr: str,
+    config_name: str,
+    config_id: int,
+    **kwargs,
+) -> None:
+    def build() -> od.Config:
+        # import the campaign
+        mod = importlib.import_module(campaign_module)
+        campaign = getattr(mod, campaign_attr)
+
+        # copy only the datasets and process trees used in the config
+        # (creates copies to allow for encapsulated customization)
+        from azh.config.config_run2 import add_config, dataset_names
+        from azh.util import copy_campaign_subset
+        return add_config(
+            analysis_azh,
+            copy_campaign_subset(campaign, dataset_names),
+            config_name=config_name,
+            config_id=config_id,
+            **kwargs,
+        )
+
+    def factory(configs: od.UniqueObjectIndex) -> od.Config:
+        # load from a persistent snapshot when available (see azh/config/snapshot.py)
+        from azh.config.snapshot import load_or_build_config
+        return load_or_build_config(
+            analysis_azh,
+            build,
+            campaign_module=f"{campaign_module}.{campaign_attr}",
+            config_name=config_name,
+            config_id=config_id,
+            **kwargs,
+        )
+
+    analysis_azh.configs.add_lazy_factory(config_name, factory)
+
+
+# 2017
+add_lazy_config(
+    campaign_module="cmsdb.campaigns.run2_2017_nano_v9",
+    campaign_attr="campaign_run2_2017_nano_v9",
     config_name="config_2017",
     config_id=1,
 )
-config_2017_limited = add_config(
-    analysis_azh,
-    campaign_run2_2017_nano_v9.copy(),
+add_lazy_config(
+    campaign_module="cmsdb.campaigns.run2_2017_nano_v9",
+    campaign_attr="campaign_run2_2017_nano_v9",
     config_name="config_2017_limited",
     config_id=12,
     limit_dataset_files=1,
 )
-print(config_2017.name)
-print(type(config_2017))
-print("Config done")
+add_lazy_config(
+    campaign_module="cmsdb.campaigns.run2_2017_nano_v9",
+    campaign_attr="campaign_run2_2017_nano_v9",
+    config_name="config_2017_sampled",
+    config_id=13,
+    event_sampling_fraction=0.01,
+)
 
 # # get all root processes
 # procs = get_root_processes_from_campaign(campaign)
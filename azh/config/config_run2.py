@@ -15,10 +15,10 @@ import order as od
 from columnflow.util import DotDict
 import functools
 # from dijet.config.datasets import get_dataset_lfns
-from azh.config.analysis_azh import analysis_azh
 from azh.config.categories import add_categories_selection
 from azh.config.variables import add_variables
 from azh.config.cutflow_variables import add_cutflow_variables
+from azh.config.routing import invalidate_routing_index
 from columnflow.config_util import (
     get_root_processes_from_campaign, add_shift_aliases, get_shifts_from_sources, add_category,
     verify_config_processes,
@@ -27,6 +27,26 @@ from columnflow.config_util import (
 
 thisdir = os.path.dirname(os.path.abspath(__file__))
 
+# processes and datasets used in configs
+# (also used to only copy the required parts of a campaign, see azh.util.copy_campaign_subset)
+process_names = [
+    "tt",
+    "dy",
+]
+
+dataset_names = [
+    "tt_sl_powheg",
+    # "st_tchannel_t_powheg",
+    "dy_lep_m50_ht70to100_madgraph",
+    "dy_lep_m50_ht100to200_madgraph",
+    "dy_lep_m50_ht200to400_madgraph",
+    "dy_lep_m50_ht400to600_madgraph",
+    "dy_lep_m50_ht600to800_madgraph",
+    "dy_lep_m50_ht800to1200_madgraph",
+    "dy_lep_m50_ht1200to2500_madgraph",
+    "dy_lep_m50_ht2500_madgraph",
+]
+
 
 def add_config(
     analysis: od.Analysis,
@@ -34,6 +54,7 @@ def add_config(
     config_name: str | None = None,
     config_id: int | None = None,
     limit_dataset_files: int | None = None,
+    event_sampling_fraction: float | None = None,
 ) -> od.Config:
     # validations
     assert campaign.x.year in [2016, 2017, 2018]
@@ -52,42 +73,20 @@ def add_config(
     procs = get_root_processes_from_campaign(campaign)
 
     # create a config by passing the campaign, so id and name will be identical
-    print("Begin campaign")
-    print(campaign)
-    print(config_name)
-    cfg = analysis_azh.add_config(campaign, name=config_name, id=config_id)
-    print(cfg)
+    cfg = analysis.add_config(campaign, name=config_name, id=config_id)
     # use custom get_dataset_lfns function
     # cfg.x.get_dataset_lfns = get_dataset_lfns
 
-    # add processes we are interested in
-
     # set color of some processes
     # stylize_processes(cfg)
 
-    # add datasets we need to study
-    process_names = [
-        "tt",
-        "dy",
-    ]
+    # add processes we are interested in
     for process_name in process_names:
         cfg.add_process(procs.get(process_name))
 
-    dataset_names = [
-        "tt_sl_powheg",
-        # "st_tchannel_t_powheg",
-        "dy_lep_m50_ht70to100_madgraph",
-        "dy_lep_m50_ht100to200_madgraph",
-        "dy_lep_m50_ht200to400_madgraph",
-        "dy_lep_m50_ht400to600_madgraph",
-        "dy_lep_m50_ht600to800_madgraph",
-        "dy_lep_m50_ht800to1200_madgraph",
-        "dy_lep_m50_ht1200to2500_madgraph",
-        "dy_lep_m50_ht2500_madgraph", 
-    ]
+    # add datasets we need to study
     for dataset_name in dataset_names:
         dataset = cfg.add_dataset(campaign.get_dataset(dataset_name))
-        print(dataset)
         if limit_dataset_files:
             # apply optional limit on the max. number of files per dataset
             for info in dataset.info.values():
@@ -208,6 +207,11 @@ def add_config(
     # https://twiki.cern.ch/twiki/bin/view/CMS/PileupJSONFileforData?rev=45#Recommended_cross_section
     cfg.x.minbias_xs = Number(69.2, 0.046j)
 
+    # fraction of mc events to process, read deterministically from all files of each dataset
+    # (applied when reading nano files, see azh/io/sampling.py, normalization is scaled accordingly
+    # through the stats, data is not sampled since its luminosity cannot be rescaled)
+    cfg.x.event_sampling_fraction = event_sampling_fraction
+
     # whether to validate the number of obtained LFNs in GetDatasetLFNs
     cfg.x.validate_dataset_lfns = limit_dataset_files is None
 
@@ -387,13 +391,23 @@ def add_config(
         cfg.add_shift(name=f"jec_{jec_source}_down", id=5001 + 2 * idx, type="shape")
         add_aliases(
             f"jec_{jec_source}",
-            {"Jet.pt": "Jet.pt_{name}", "Jet.mass": "Jet.mass_{name}"},
+            {
+                "Jet.pt": "Jet.pt_{name}", "Jet.mass": "Jet.mass_{name}",
+                "MET.pt": "MET.pt_{name}", "MET.phi": "MET.phi_{name}",
+            },
             selection_dependent=True,
         )
 
     cfg.add_shift(name="jer_up", id=6000, type="shape", tags={"selection_dependent"})
     cfg.add_shift(name="jer_down", id=6001, type="shape", tags={"selection_dependent"})
-    add_aliases("jer", {"Jet.pt": "Jet.pt_{name}", "Jet.mass": "Jet.mass_{name}"}, selection_dependent=True)
+    add_aliases(
+        "jer",
+        {
+            "Jet.pt": "Jet.pt_{name}", "Jet.mass": "Jet.mass_{name}",
+            "MET.pt": "MET.pt_{name}", "MET.phi": "MET.phi_{name}",
+        },
+        selection_dependent=True,
+    )
 
     def make_jme_filename(jme_aux, sample_type, name, era=None):
         """
@@ -464,7 +478,7 @@ def add_config(
             # general event information
             "run", "luminosityBlock", "event",
             # columns added during selection, required in general
-            "mc_weight", "PV.npvs", "process_id", "category_ids", "deterministic_seed",
+            "mc_weight", "PV.npvs", "process_id", "category_ids", "deterministic_seed", "n_jet",
             # weight-related columns
             "pu_weight*", "pdf_weight*",
             "murf_envelope_weight*", "mur_weight*", "muf_weight*",
@@ -497,6 +511,23 @@ def add_config(
         )
     )
 
+    # target file size after MergeReducedEvents in MB
+    cfg.x.reduced_file_size = 512.0
+
+    # per-column storage policies applied when writing outputs of tasks, see azh/io/storage.py
+    # (for each option, the first matching pattern is used; narrowed columns are upcast when read)
+    cfg.x.column_storage = {
+        "cf.ReduceEvents": [
+            ("*.pdgId", {"dtype": "int8"}),
+            ("*.genJetIdx", {"dtype": "int16"}),
+            # float16 precision, but stored as float32 since not all parquet writers support float16
+            ("*.eta", {"mantissa_bits": 10}),
+            ("*.phi", {"mantissa_bits": 10}),
+            ("*weight*", {"dtype": "float32", "codec": "zstd", "level": 9}),
+            ("*", {"codec": "zstd", "level": 3}),
+        ],
+    }
+
     # event weight columns as keys in an ordered dict, mapped to shift instances they depend on
     # get_shifts = lambda *keys: sum(([cfg.get_shift(f"{k}_up"), cfg.get_shift(f"{k}_down")] for k in keys), [])
     get_shifts = functools.partial(get_shifts_from_sources, cfg)
@@ -641,6 +672,14 @@ def add_config(
     add_categories_selection(cfg)
     add_cutflow_variables(cfg)
 
-    # only produce cutflow features when number of dataset_files is limited (used in selection module)
-    cfg.x.do_cutflow_features = bool(limit_dataset_files) and limit_dataset_files <= 10
+    # only produce cutflow features when number of dataset_files is limited or events are sampled
+    # (used in selection module)
+    cfg.x.do_cutflow_features = (
+        (bool(limit_dataset_files) and limit_dataset_files <= 10) or
+        (event_sampling_fraction is not None and event_sampling_fraction <= 0.1)
+    )
+
+    # drop a routing index built while shifts, weights or keep_columns were still being added
+    invalidate_routing_index(cfg)
+
     return cfg
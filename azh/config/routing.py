@@ -0,0 +1,167 @@
+# coding: utf-8
+
+"""
+Per-config index for routing columns, compiling keep_columns patterns, shift column aliases and
+event weight columns once into direct lookups.
+"""
+
+from __future__ import annotations
+
+import re
+import fnmatch
+from collections import defaultdict
+from typing import Iterable
+
+import order as od
+
+
+class ColumnRoutingIndex(object):
+    """
+    Index built once per *config* that resolves
+
+        - whether columns are kept by the patterns in ``config.x.keep_columns`` per task family,
+        - the column aliases of shifts, in both directions, and
+        - the event weight columns of the config and its datasets,
+
+    via set and dictionary lookups. Results of pattern matching are cached per column name, so
+    repeated resolution per task and chunk does not repeat any matching.
+
+    The index reflects the config at construction time. :py:func:`get_routing_index` rebuilds it
+    when shifts were added since then, other changes require :py:func:`invalidate_routing_index`.
+    """
+
+    def __init__(self, config: od.Config) -> None:
+        super().__init__()
+
+        self.config = config
+        self.n_shifts = len(config.shifts)
+
+        # keep_columns per task family, split into literal names, a compiled pattern and
+        # non-string flags (such as ColumnCollection members)
+        self._keep_literals = {}
+        self._keep_patterns = {}
+        self._keep_flags = {}
+        self._keep_cache = defaultdict(dict)
+        for task_family, columns in config.x("keep_columns", {}).items():
+            literals, patterns, flags = set(), [], set()
+            for column in columns:
+                if not isinstance(column, str):
+                    flags.add(column)
+                elif any(c in column for c in "*?["):
+                    patterns.append(fnmatch.translate(column))
+                else:
+                    literals.add(column)
+            self._keep_literals[task_family] = frozenset(literals)
+            self._keep_patterns[task_family] = re.compile("|".join(patterns)) if patterns else None
+            self._keep_flags[task_family] = frozenset(flags)
+
+        # column aliases per shift, for all and for selection dependent aliases only
+        self._aliases = {}
+        self._aliases_selection_dependent = {}
+        self._shifts_per_column = defaultdict(set)
+        for shift_inst in config.shifts:
+            aliases = dict(shift_inst.x("column_aliases", {}))
+            aliases_sel = dict(shift_inst.x("column_aliases_selection_dependent", {}))
+            aliases.update(aliases_sel)
+            if not aliases:
+                continue
+            self._aliases[shift_inst.name] = aliases
+            self._aliases_selection_dependent[shift_inst.name] = aliases_sel
+            for column in aliases:
+                self._shifts_per_column[column].add(shift_inst.name)
+
+        # event weight columns of the config
+        self._weight_columns = frozenset(config.x("event_weights", {}).keys())
+
+    #
+    # keep_columns
+    #
+
+    def keep_flags(self, task_family: str) -> frozenset:
+        """
+        Returns the non-string entries of the keep_columns of *task_family*.
+        """
+        return self._keep_flags.get(task_family, frozenset())
+
+    def keeps(self, task_family: str, column: str) -> bool:
+        """
+        Returns whether *column* is kept in *task_family* according to the config's keep_columns.
+        """
+        cache = self._keep_cache[task_family]
+        if column not in cache:
+            pattern = self._keep_patterns.get(task_family)
+            cache[column] = (
+                column in self._keep_literals.get(task_family, ()) or
+                bool(pattern and pattern.match(column))
+            )
+        return cache[column]
+
+    def resolve_keep(self, task_family: str, columns: Iterable[str]) -> set[str]:
+        """
+        Returns the subset of *columns* that are kept in *task_family*.
+        """
+        return {column for column in columns if self.keeps(task_family, column)}
+
+    #
+    # shift aliases
+    #
+
+    def aliases(self, shift_name: str, selection_dependent: bool = False) -> dict[str, str]:
+        """
+        Returns the column aliases of the shift *shift_name*, optionally only those that are
+        *selection_dependent*.
+        """
+        lookup = self._aliases_selection_dependent if selection_dependent else self._aliases
+        return lookup.get(shift_name, {})
+
+    def resolve(self, column: str, shift_name: str) -> str:
+        """
+        Returns the name of the column that *column* is mapped to in the shift *shift_name*.
+        """
+        return self._aliases.get(shift_name, {}).get(column, column)
+
+    def shifts_aliasing(self, column: str) -> frozenset[str]:
+        """
+        Returns the names of all shifts that define an alias for *column*.
+        """
+        return frozenset(self._shifts_per_column.get(column, ()))
+
+    #
+    # event weights
+    #
+
+    def weight_columns(self, dataset_inst: od.Dataset | None = None) -> frozenset[str]:
+        """
+        Returns the names of event weight columns of the config and optionally *dataset_inst*.
+        """
+        if dataset_inst is None:
+            return self._weight_columns
+        return self._weight_columns | frozenset(dataset_inst.x("event_weights", {}).keys())
+
+
+# indices per config id, stored with the config to detect reused ids
+_indices: dict[int, tuple[od.Config, ColumnRoutingIndex]] = {}
+
+
+def get_routing_index(config: od.Config) -> ColumnRoutingIndex:
+    """
+    Returns the :py:class:`ColumnRoutingIndex` of *config*, building it on first access and
+    rebuilding it when shifts were added since then. This only compares the identity of *config*
+    and its number of shifts, so it is cheap enough to be called per chunk.
+    """
+    entry = _indices.get(id(config))
+    if entry is None or entry[0] is not config or entry[1].n_shifts != len(config.shifts):
+        entry = _indices[id(config)] = (config, ColumnRoutingIndex(config))
+    return entry[1]
+
+
+def invalidate_routing_index(config: od.Config | None = None) -> None:
+    """
+    Drops the cached :py:class:`ColumnRoutingIndex` of *config*, or of all configs when *None*.
+    Must be called after changing column aliases of existing shifts, event weights or
+    keep_columns of a config whose index was already built.
+    """
+    if config is None:
+        _indices.clear()
+    else:
+        _indices.pop(id(config), None)
@@ -0,0 +1,266 @@
+# coding: utf-8
+
+"""
+Persistent snapshots of built config objects.
+
+Building a config via *add_config* is repeated identically in every local and remote job. Built
+configs are therefore pickled into the data directory (see :py:func:`snapshot_dir`), keyed by a
+hash of all inputs that determine their content, i.e., the config source files and helpers, the
+cmsdb campaign, the columnflow and order versions, the law config and the arguments passed to
+*add_config*. When a snapshot with a matching hash exists, it is loaded instead. Snapshots are
+kept out of the source tree and are not shipped with job bundles, so remote jobs build configs
+once and reuse snapshots in their own data directory.
+"""
+
+from __future__ import annotations
+
+import os
+import glob
+import pickle
+import hashlib
+import tempfile
+import importlib
+import importlib.util
+import importlib.metadata
+from typing import Callable, Any
+
+import law
+import order as od
+
+
+logger = law.logger.get_logger(__name__)
+
+thisdir = os.path.dirname(os.path.abspath(__file__))
+
+# name of the snapshot directory inside the data directory
+default_snapshot_dir = "config_snapshots"
+
+# bump when the snapshot format changes
+SNAPSHOT_FORMAT = 1
+
+# modules whose sources are run while building configs, in addition to azh/config
+build_modules = ["azh.util", "columnflow.config_util"]
+
+# packages whose versions determine the built config objects
+versioned_packages = ["columnflow", "order"]
+
+# environment variables that affect the build
+env_inputs = ["CF_FLAVOR"]
+
+
+def snapshot_enabled() -> bool:
+    return law.util.flag_to_bool(os.getenv("AZH_CONFIG_SNAPSHOTS", "1"))
+
+
+def snapshot_dir() -> str:
+    """
+    Returns the directory in which config snapshots are stored, which is ``AZH_CONFIG_SNAPSHOT_DIR``
+    when set, and :py:attr:`default_snapshot_dir` in the columnflow data directory ``CF_DATA`` or,
+    outside of a setup, in the law home directory otherwise.
+    """
+    path = os.getenv("AZH_CONFIG_SNAPSHOT_DIR")
+    if not path:
+        base = os.getenv("CF_DATA") or os.getenv("LAW_HOME") or os.path.join("~", ".law")
+        path = os.path.join(base, default_snapshot_dir)
+    return os.path.expandvars(os.path.expanduser(path))
+
+
+def _package_fingerprint(module_name: str) -> str:
+    """
+    Returns a hash of all python sources of the top-level package of *module_name* (e.g. cmsdb,
+    including its processes and campaigns) without importing the module itself.
+    """
+    spec = importlib.util.find_spec(module_name.split(".", 1)[0])
+    if not spec or not spec.origin:
+        return ""
+
+    h = hashlib.sha256()
+    if spec.submodule_search_locations:
+        pattern = os.path.join(os.path.dirname(spec.origin), "**", "*.py")
+        paths = sorted(glob.glob(pattern, recursive=True))
+    else:
+        paths = [spec.origin]
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+
+    return h.hexdigest()
+
+
+def _module_fingerprint(module_name: str) -> str:
+    """
+    Returns a hash of the source file of *module_name* without importing it.
+    """
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except ModuleNotFoundError:
+        spec = None
+    if not spec or not spec.origin or not os.path.isfile(spec.origin):
+        return ""
+
+    with open(spec.origin, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _package_version(name: str) -> str:
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        pass
+    # packages checked out as submodules are not installed, so fall back to their attribute
+    mod = importlib.import_module(name)
+    return str(getattr(mod, "__version__", ""))
+
+
+def _law_config_file() -> str | None:
+    path = os.getenv("LAW_CONFIG_FILE")
+    if not path:
+        base = os.getenv("AZH_BASE", os.path.dirname(os.path.dirname(thisdir)))
+        path = os.path.join(base, "law.cfg")
+    path = os.path.expandvars(os.path.expanduser(path))
+    return path if os.path.isfile(path) else None
+
+
+def config_hash(campaign_module: str, config_name: str, config_id: int, **kwargs) -> str:
+    """
+    Computes the hash identifying a config snapshot from the sources in azh/config and of all
+    *build_modules*, the package providing the campaign module *campaign_module*, the versions of
+    all *versioned_packages*, the law config, the *env_inputs* and all arguments passed to
+    *add_config*.
+    """
+    h = hashlib.sha256()
+    h.update(f"format={SNAPSHOT_FORMAT}".encode())
+
+    # config sources
+    paths = glob.glob(os.path.join(thisdir, "*.py")) + glob.glob(os.path.join(thisdir, "*.yaml"))
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            h.update(os.path.basename(path).encode())
+            h.update(f.read())
+
+    # other sources run during the build
+    for module_name in build_modules:
+        h.update(f"{module_name}={_module_fingerprint(module_name)}".encode())
+
+    # package versions
+    for name in versioned_packages:
+        h.update(f"{name}=={_package_version(name)}".encode())
+
+    # law config, which is shipped with job bundles as well
+    law_cfg = _law_config_file()
+    if law_cfg:
+        with open(law_cfg, "rb") as f:
+            h.update(f.read())
+
+    # environment
+    for name in env_inputs:
+        h.update(f"{name}={os.getenv(name, '')}".encode())
+
+    # campaign and the state of the package providing it
+    h.update(campaign_module.encode())
+    h.update(_package_fingerprint(campaign_module).encode())
+
+    # arguments
+    h.update(repr((config_name, config_id, sorted(kwargs.items()))).encode())
+
+    return h.hexdigest()[:16]
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """
+    Pickler that stores the analysis a config belongs to as a reference rather than by value.
+    """
+
+    def __init__(self, *args, analysis: od.Analysis, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.analysis = analysis
+
+    def persistent_id(self, obj: Any) -> str | None:
+        return "analysis" if obj is self.analysis else None
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+
+    def __init__(self, *args, analysis: od.Analysis, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.analysis = analysis
+
+    def persistent_load(self, pid: str) -> od.Analysis:
+        if pid != "analysis":
+            raise pickle.UnpicklingError(f"unknown persistent id '{pid}'")
+        return self.analysis
+
+
+def load_snapshot(path: str, analysis: od.Analysis) -> od.Config | None:
+    """
+    Loads a config snapshot from *path* and returns it, or *None* when it does not exist or cannot
+    be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            return _SnapshotUnpickler(f, analysis=analysis).load()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"could not load config snapshot {path}, rebuilding config: {e}")
+        return None
+
+
+def write_snapshot(path: str, config: od.Config, analysis: od.Analysis) -> bool:
+    """
+    Writes *config* to *path*. The snapshot is written to a temporary file in the same directory
+    first and then atomically moved to *path*, so that concurrent readers never see partial files
+    and concurrent writers simply replace each other's identical snapshots.
+    """
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp_", suffix=".pkl")
+    except OSError as e:
+        logger.debug(f"could not create config snapshot directory {dirname}: {e}")
+        return False
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            _SnapshotPickler(f, protocol=pickle.HIGHEST_PROTOCOL, analysis=analysis).dump(config)
+        os.chmod(tmp_path, 0o664)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"could not write config snapshot {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+    return True
+
+
+def load_or_build_config(
+    analysis: od.Analysis,
+    build: Callable[[], od.Config],
+    campaign_module: str,
+    config_name: str,
+    config_id: int,
+    **kwargs,
+) -> od.Config:
+    """
+    Returns the config *config_name* of *analysis*, either loaded from a matching snapshot or built
+    by calling *build*, in which case a new snapshot is written. *campaign_module*, *config_id* and
+    *kwargs* are only used to compute the snapshot hash and should match the arguments that *build*
+    passes to *add_config*.
+    """
+    if not snapshot_enabled():
+        return build()
+
+    h = config_hash(campaign_module, config_name, config_id, **kwargs)
+    path = os.path.join(snapshot_dir(), f"{config_name}_{h}.pkl")
+
+    config = load_snapshot(path, analysis)
+    if config is not None:
+        logger.debug(f"loaded config {config_name} from snapshot {path}")
+        return analysis.add_config(config)
+
+    config = build()
+    if write_snapshot(path, config, analysis):
+        logger.debug(f"wrote snapshot of config {config_name} to {path}")
+
+    return config
@@ -0,0 +1,251 @@
+# coding: utf-8
+
+"""
+Fused histogram filling for many variables and categories.
+
+Instead of filling one histogram per (category, variable) combination, a :py:class:`FillEngine`
+computes the integer bin indices of each variable once per chunk and accumulates weights of all
+categories into one flat array per variable and process with a single ``np.bincount`` call. The
+resulting histograms have the category, process, shift and variable axes of histograms created by
+``cf.CreateHistograms``.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Sequence
+
+import order as od
+
+from columnflow.util import maybe_import
+
+np = maybe_import("numpy")
+ak = maybe_import("awkward")
+hist = maybe_import("hist")
+
+
+def variable_axis(variable_inst: od.Variable) -> hist.axis.Variable:
+    """
+    Returns the axis of *variable_inst* as created by ``cf.CreateHistograms``.
+    """
+    return hist.axis.Variable(
+        variable_inst.bin_edges,
+        name=variable_inst.name,
+        label=variable_inst.get_full_x_title(),
+    )
+
+
+def bin_indices(
+    values: np.ndarray,
+    axis: hist.axis.Variable,
+    variable_inst: od.Variable | None = None,
+) -> np.ndarray:
+    """
+    Returns the bin indices of *values* in *axis*, including flow bins, i.e., 0 is the underflow
+    and ``n_bins + 1`` the overflow bin. Values on bin edges, as well as nan and infinities, are
+    assigned exactly as when filling the histogram.
+
+    When *variable_inst* has an even binning, indices are computed arithmetically as
+    ``floor((x - lo) / width)``, clipped to the flow bins and corrected by one bin where floating
+    point rounding at bin edges differs from the edges of *axis*. Otherwise, they are looked up by
+    the axis itself.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if variable_inst is None or not variable_inst.even_binning:
+        return np.asarray(axis.index(values), dtype=np.int64) + 1
+
+    n_bins, lo, hi = variable_inst.binning
+    with np.errstate(invalid="ignore"):
+        idx = np.floor((values - lo) * (n_bins / (hi - lo)))
+    idx = np.clip(np.nan_to_num(idx, nan=n_bins), -1, n_bins).astype(np.int64)
+
+    # bin i covers [edges[i + 1], edges[i + 2]) of the edges extended by the flow bins, comparisons
+    # with nan are false, so nan values and the overflow bin stay where they are
+    edges = np.concatenate([[-np.inf], axis.edges, [np.nan]])
+    idx -= values < edges[idx + 1]
+    idx += values >= edges[idx + 2]
+
+    return idx + 1
+
+
+def expand_categories(
+    entry_events: np.ndarray,
+    category_offsets: np.ndarray,
+    category_positions: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Expands entries (one per event for scalar variables, one per object for jagged variables)
+    belonging to events *entry_events* into (entry, category) pairs, given per-event categories in
+    CSR format via *category_offsets* and *category_positions*. Returns the entry indices and the
+    category positions of all pairs.
+    """
+    n_cats = np.diff(category_offsets)[entry_events]
+    entries = np.repeat(np.arange(len(entry_events)), n_cats)
+    starts = np.repeat(category_offsets[entry_events], n_cats)
+    within = np.arange(len(entries)) - np.repeat(np.cumsum(n_cats) - n_cats, n_cats)
+    return entries, category_positions[starts + within]
+
+
+class FillEngine(object):
+    """
+    Accumulates weighted histograms of all *variable_insts* in all categories with ids
+    *category_ids*. Call :py:meth:`fill` once per chunk and :py:meth:`to_hists` at the end.
+
+    Per variable and process, sums of weights and of squared weights are stored in flat arrays of
+    shape ``(n_rows, n_categories, n_bins + 2)``, where rows correspond to the shifts with ids
+    *shift_ids*, so that weight variations can be accumulated alongside the nominal weight.
+    """
+
+    def __init__(
+        self,
+        variable_insts: Iterable[od.Variable],
+        category_ids: Sequence[int],
+        shift_ids: Sequence[int] = (0,),
+    ) -> None:
+        super().__init__()
+
+        self.variable_insts = list(variable_insts)
+        self.category_ids = np.array(sorted(set(category_ids)), dtype=np.int64)
+        self.shift_ids = list(shift_ids)
+        self.n_rows = len(self.shift_ids)
+        self.axes = {v.name: variable_axis(v) for v in self.variable_insts}
+
+        # sums per process id and variable name, created when a process is first filled
+        self.sum_w: dict[int, dict[str, np.ndarray]] = {}
+        self.sum_w2: dict[int, dict[str, np.ndarray]] = {}
+
+    def _sums(self, process_id: int) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray]]:
+        if process_id not in self.sum_w:
+            n_cats = len(self.category_ids)
+            self.sum_w[process_id] = {
+                v.name: np.zeros(self.n_rows * n_cats * (v.n_bins + 2), dtype=np.float64)
+                for v in self.variable_insts
+            }
+            self.sum_w2[process_id] = {
+                name: np.zeros_like(arr)
+                for name, arr in self.sum_w[process_id].items()
+            }
+        return self.sum_w[process_id], self.sum_w2[process_id]
+
+    def _category_csr(self, category_ids: ak.Array) -> tuple[np.ndarray, np.ndarray]:
+        # map per-event category ids to positions in self.category_ids, dropping unknown ids
+        flat_ids = np.asarray(ak.flatten(category_ids, axis=1), dtype=np.int64)
+        pos = np.searchsorted(self.category_ids, flat_ids)
+        pos = np.clip(pos, 0, len(self.category_ids) - 1)
+        known = self.category_ids[pos] == flat_ids
+        counts = np.asarray(ak.num(category_ids, axis=1))
+        event_of_id = np.repeat(np.arange(len(counts)), counts)[known]
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(event_of_id, minlength=len(counts)), out=offsets[1:])
+        return offsets, pos[known]
+
+    def fill(
+        self,
+        values: dict[str, np.ndarray | ak.Array],
+        category_ids: ak.Array,
+        process_ids: np.ndarray | ak.Array,
+        weights: np.ndarray,
+    ) -> None:
+        """
+        Fills *values* (variable name to per-event or jagged per-object values, e.g. from a
+        :py:class:`~azh.histogramming.variables.VariablePlan`) of events in categories
+        *category_ids* (jagged per event) and processes *process_ids*. *weights* has shape
+        ``(n_events,)`` or ``(n_rows, n_events)``.
+        """
+        weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+        if weights.shape[0] != self.n_rows:
+            raise ValueError(f"expected {self.n_rows} weight rows, got {weights.shape[0]}")
+
+        # fill per process, usually a single one per dataset
+        process_ids = np.asarray(process_ids, dtype=np.int64)
+        for process_id in np.unique(process_ids):
+            if len(process_ids) and (process_ids == process_id).all():
+                self._fill(int(process_id), values, category_ids, weights)
+                continue
+            mask = process_ids == process_id
+            self._fill(
+                int(process_id),
+                {name: vals[mask] for name, vals in values.items()},
+                category_ids[mask],
+                weights[:, mask],
+            )
+
+    def _fill(
+        self,
+        process_id: int,
+        values: dict[str, np.ndarray | ak.Array],
+        category_ids: ak.Array,
+        weights: np.ndarray,
+    ) -> None:
+        sum_w, sum_w2 = self._sums(process_id)
+        n_events = weights.shape[1]
+        n_cats = len(self.category_ids)
+        row_offsets = (np.arange(self.n_rows) * n_cats)[:, None]
+
+        cat_offsets, cat_positions = self._category_csr(category_ids)
+
+        # event-category pairs are shared by all scalar variables
+        scalar_pairs = None
+
+        for variable_inst in self.variable_insts:
+            vals = values[variable_inst.name]
+            n_flat = variable_inst.n_bins + 2
+
+            # flatten jagged variables, remembering the event of each entry
+            if isinstance(vals, ak.Array) and vals.ndim > 1:
+                counts = np.asarray(ak.num(vals, axis=1))
+                entry_events = np.repeat(np.arange(n_events), counts)
+                vals = np.asarray(ak.flatten(vals, axis=1))
+                entries, cats = expand_categories(entry_events, cat_offsets, cat_positions)
+            else:
+                entry_events = None
+                if scalar_pairs is None:
+                    scalar_pairs = expand_categories(
+                        np.arange(n_events),
+                        cat_offsets,
+                        cat_positions,
+                    )
+                entries, cats = scalar_pairs
+
+            # bin indices computed once per variable, combined with categories and weight rows
+            idx = bin_indices(vals, self.axes[variable_inst.name], variable_inst)[entries]
+            flat_idx = ((row_offsets + cats[None, :]) * n_flat + idx[None, :]).ravel()
+            events = entries if entry_events is None else entry_events[entries]
+            w = weights[:, events].ravel()
+
+            size = sum_w[variable_inst.name].size
+            sum_w[variable_inst.name] += np.bincount(flat_idx, weights=w, minlength=size)
+            sum_w2[variable_inst.name] += np.bincount(flat_idx, weights=w**2, minlength=size)
+
+    def to_hists(self, shift_ids: Sequence[int] | None = None) -> dict[str, hist.Hist]:
+        """
+        Returns a histogram per variable with category, process, shift and variable axes
+        (including flow bins), as created by ``cf.CreateHistograms``. The shift axis contains all
+        shifts, or only those with ids *shift_ids*.
+        """
+        if shift_ids is None:
+            shift_ids = self.shift_ids
+        rows = [self.shift_ids.index(shift_id) for shift_id in shift_ids]
+
+        hists = {}
+        n_cats = len(self.category_ids)
+        process_ids = sorted(self.sum_w)
+        for variable_inst in self.variable_insts:
+            h = hist.Hist(
+                hist.axis.IntCategory(self.category_ids.tolist(), name="category", growth=True),
+                hist.axis.IntCategory(process_ids, name="process", growth=True),
+                hist.axis.IntCategory(list(shift_ids), name="shift", growth=True),
+                self.axes[variable_inst.name],
+                storage=hist.storage.Weight(),
+            )
+            if process_ids:
+                # (process, row, category, bin) -> (category, process, shift, bin)
+                shape = (self.n_rows, n_cats, variable_inst.n_bins + 2)
+                name = variable_inst.name
+                sum_w = np.stack([self.sum_w[p][name].reshape(shape)[rows] for p in process_ids])
+                sum_w2 = np.stack([self.sum_w2[p][name].reshape(shape)[rows] for p in process_ids])
+                view = h.view(flow=True)
+                view.value[...] = sum_w.transpose(2, 0, 1, 3)
+                view.variance[...] = sum_w2.transpose(2, 0, 1, 3)
+            hists[variable_inst.name] = h
+
+        return hists
@@ -0,0 +1,179 @@
+# coding: utf-8
+
+"""
+Fused implementation of the run method of ``cf.CreateHistograms``.
+
+Histograms of all requested variables are filled in a single pass per chunk. Variables are
+evaluated by a compiled :py:class:`~azh.histogramming.variables.VariablePlan` and filled into all
+categories at once by a :py:class:`~azh.histogramming.fill.FillEngine`. Outputs have the same
+structure as those of ``cf.CreateHistograms``, i.e., one histogram per variable with category,
+process, shift and variable axes. Only one-dimensional variables are supported, tasks requesting
+others run the columnflow implementation (see ``patch_create_histograms_fused`` in
+:py:mod:`azh.columnflow_patches`).
+
+In the nominal pass, all weight-only shifts (see
+:py:func:`azh.histogramming.weights.is_weight_only_shift`) are filled alongside, and their
+histograms are saved as the outputs of the corresponding shifted tasks, which are then complete
+before they are run. Shifted tasks that run before the nominal one fill their histograms
+themselves, with identical results.
+"""
+
+from __future__ import annotations
+
+import law
+
+from columnflow.util import maybe_import
+
+np = maybe_import("numpy")
+
+
+def fused_variable_names(task: law.Task) -> list[str] | None:
+    """
+    Returns the names of the variables of the ``cf.CreateHistograms`` *task* when all of them are
+    one-dimensional, and *None* otherwise.
+    """
+    names = []
+    for var_names in task.variable_tuples.values():
+        if len(var_names) != 1:
+            return None
+        names.append(var_names[0])
+    return names
+
+
+def weight_shift_targets(task: law.Task, variable_columns: set[str]) -> dict[str, law.Target]:
+    """
+    Returns the histogram outputs of the shifted counterparts of the nominal ``cf.CreateHistograms``
+    *task* per weight-only shift, given the *variable_columns* read by the task. Shifts that the
+    task does not depend on are skipped, since their tasks resolve to the nominal task itself.
+    """
+    from azh.histogramming.weights import get_weight_only_shifts
+
+    if not task.global_shift_inst.is_nominal or task.dataset_inst.is_data:
+        return {}
+
+    shift_names = get_weight_only_shifts(task.config_inst, task.dataset_inst, variable_columns)
+    path = task.output()["hists"].path
+    targets = {}
+    for shift_name in shift_names:
+        target = task.req(task, shift=shift_name).output()["hists"]
+        if target.path != path:
+            targets[shift_name] = target
+    return targets
+
+
+def create_histograms_fused(task: law.Task, producer_ipc: bool = False) -> None:
+    """
+    Creates and saves the histograms of the ``cf.CreateHistograms`` *task* in a single pass per
+    chunk. With *producer_ipc*, produced columns are read from the memory-mapped arrow ipc files
+    of :py:class:`~azh.tasks.columns.ProduceColumnsIPC`, which must then be required in place of
+    ``cf.ProduceColumns``.
+    """
+    from columnflow.columnar_util import Route, update_ak_array, add_ak_aliases, has_ak_column
+    from azh.histogramming.variables import compile_variable_plan
+    from azh.histogramming.fill import FillEngine
+    from azh.histogramming.weights import WeightShiftFiller
+    from azh.io.arrow import ak_from_ipc
+
+    inputs = task.input()
+
+    variable_names = fused_variable_names(task)
+    if variable_names is None:
+        raise ValueError(f"fused histogramming of {task!r} requires one-dimensional variables")
+    category_ids = [cat.id for cat, _, _ in task.config_inst.walk_categories()]
+
+    # in the nominal pass, weight-only shifts are filled alongside
+    plan = compile_variable_plan(task.config_inst, variable_names)
+    shift_targets = weight_shift_targets(task, plan.columns)
+    filler = None
+    if shift_targets:
+        filler = WeightShiftFiller(
+            task.config_inst,
+            task.dataset_inst,
+            variable_names,
+            category_ids,
+            shift_names=list(shift_targets),
+        )
+        task.publish_message(f"filling weight-only shifts {', '.join(filler.shift_names)}")
+    else:
+        engine = FillEngine(
+            plan.variable_insts,
+            category_ids,
+            shift_ids=[task.global_shift_inst.id],
+        )
+
+    # get shift dependent aliases
+    aliases = task.local_shift_inst.x("column_aliases", {})
+
+    # define columns that need to be read
+    read_columns = {"category_ids", "process_id"} | set(aliases.values()) | plan.columns
+    read_columns |= set(task.config_inst.x.event_weights.keys())
+    read_columns |= set(task.dataset_inst.x("event_weights", {}).keys())
+    if filler is not None:
+        read_columns |= filler.weight_columns
+    read_columns = {Route(c) for c in read_columns}
+
+    # iterate over chunks of events and diffs
+    files = [inputs["events"]["collection"][0]["events"].path]
+    ipc_columns = []
+    if task.producer_insts and producer_ipc:
+        # memory-mapped once and sliced per chunk below
+        ipc_columns = [
+            ak_from_ipc(inp["columns"].abspath, columns=[r.column for r in read_columns])
+            for inp in inputs["producers"]
+        ]
+    elif task.producer_insts:
+        files.extend([inp["columns"].path for inp in inputs["producers"]])
+    if task.ml_model_insts:
+        files.extend([inp["mlcolumns"].path for inp in inputs["ml"]])
+    for (events, *columns), pos in task.iter_chunked_io(
+        files,
+        source_type=len(files) * ["awkward_parquet"],
+        read_columns=len(files) * [read_columns],
+    ):
+        if ipc_columns:
+            columns = [c[pos.entry_start:pos.entry_stop] for c in ipc_columns] + columns
+
+        # optional check for overlapping inputs
+        if task.check_overlapping_inputs:
+            task.raise_if_overlapping([events] + list(columns))
+
+        # add additional columns and aliases
+        events = update_ak_array(events, *columns)
+        events = add_ak_aliases(
+            events,
+            aliases,
+            remove_src=True,
+            missing_strategy=task.missing_column_alias_strategy,
+        )
+
+        if filler is not None:
+            filler.fill(events)
+            continue
+
+        # build the full event weight
+        weight = np.ones(len(events), dtype=np.float64)
+        if task.dataset_inst.is_mc and len(events):
+            for column in task.config_inst.x.event_weights:
+                weight = weight * np.asarray(Route(column).apply(events))
+            for column in task.dataset_inst.x("event_weights", []):
+                if has_ak_column(events, column):
+                    weight = weight * np.asarray(Route(column).apply(events))
+                else:
+                    task.logger.warning_once(
+                        f"missing_dataset_weight_{column}",
+                        f"weight '{column}' for dataset {task.dataset_inst.name} not found",
+                    )
+
+        engine.fill(plan(events), events.category_ids, events.process_id, weight)
+
+    if filler is None:
+        task.output()["hists"].dump(engine.to_hists(), formatter="pickle")
+        return
+
+    task.output()["hists"].dump(filler.to_hists("nominal"), formatter="pickle")
+    for shift_name in filler.shift_names:
+        # shifted tasks that ran in the meantime produced identical histograms
+        target = shift_targets[shift_name]
+        if not target.exists():
+            target.parent.touch()
+            target.dump(filler.to_hists(shift_name), formatter="pickle")
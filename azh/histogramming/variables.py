@@ -0,0 +1,126 @@
+# coding: utf-8
+
+"""
+Compiled evaluation of variable expressions.
+
+Variables such as ``jet{1..3}_{pt,eta,phi,mass}`` are defined via expressions like
+``Jet.pt[:,0]``, which, when evaluated one by one, pad and fill the same collection field several
+times. A :py:class:`VariablePlan` groups all requested variables by the column they slice, pads
+each column once to the largest requested index and slices all variables from the padded array.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import OrderedDict
+from typing import Any, Callable, Iterable
+
+import order as od
+
+from columnflow.util import maybe_import
+from columnflow.columnar_util import Route
+
+np = maybe_import("numpy")
+ak = maybe_import("awkward")
+
+
+# expressions of the form "Collection.field[:,i]"
+index_expr_re = re.compile(r"^\s*(?P<column>[\w.]+)\s*\[\s*:\s*,\s*(?P<index>\d+)\s*\]\s*$")
+
+
+class VariablePlan(object):
+    """
+    Evaluation plan for a set of *variable_insts*. Calling the plan with an events chunk returns a
+    dictionary mapping variable names to their values, in the order of *variable_insts*.
+
+    Indexed expressions (``column[:,i]``) are evaluated from a single padded copy of their
+    column, plain column expressions through their route and callable expressions by calling
+    them. Intermediates are cached per call, so variables sharing a column only read it once.
+    """
+
+    def __init__(self, variable_insts: Iterable[od.Variable]) -> None:
+        super().__init__()
+
+        self.variable_insts = list(variable_insts)
+
+        # variable name -> (kind, column or callable, index, null value)
+        self.steps: OrderedDict[str, tuple[str, Any, int | None, Any]] = OrderedDict()
+
+        # maximum index requested per padded column
+        self.pad_sizes: dict[str, int] = {}
+
+        for variable_inst in self.variable_insts:
+            expr = variable_inst.expression
+            null_value = variable_inst.null_value
+            if callable(expr):
+                self.steps[variable_inst.name] = ("call", expr, None, null_value)
+                continue
+
+            m = index_expr_re.match(expr)
+            if m:
+                column, index = m.group("column"), int(m.group("index"))
+                self.pad_sizes[column] = max(self.pad_sizes.get(column, 0), index + 1)
+                self.steps[variable_inst.name] = ("index", column, index, null_value)
+            else:
+                self.steps[variable_inst.name] = ("route", expr, None, null_value)
+
+    @property
+    def columns(self) -> set[str]:
+        """
+        Names of columns read by all expressions, taken from the aux entry ``inputs`` of variables
+        with callable expressions.
+        """
+        columns = {
+            Route(column).column
+            for kind, column, _, _ in self.steps.values()
+            if kind != "call"
+        }
+        for variable_inst in self.variable_insts:
+            if callable(variable_inst.expression):
+                columns |= {Route(column).column for column in variable_inst.x("inputs", [])}
+        return columns
+
+    def __call__(self, events: ak.Array) -> OrderedDict[str, np.ndarray | ak.Array]:
+        cache: dict[str, Any] = {}
+
+        def padded(column: str) -> np.ma.MaskedArray:
+            # pad each column once to the maximum requested index and convert to a 2D array
+            if column not in cache:
+                values = Route(column).apply(events)
+                values = ak.pad_none(values, self.pad_sizes[column], axis=1, clip=True)
+                cache[column] = np.ma.asarray(ak.to_numpy(values, allow_missing=True))
+            return cache[column]
+
+        def routed(column: str, null_value: Any) -> np.ndarray | ak.Array:
+            key = (column, null_value)
+            if key not in cache:
+                cache[key] = Route(column).apply(events, null_value)
+            return cache[key]
+
+        results = OrderedDict()
+        for name, (kind, obj, index, null_value) in self.steps.items():
+            if kind == "index":
+                results[name] = np.ma.filled(padded(obj)[:, index], null_value)
+            elif kind == "route":
+                results[name] = routed(obj, null_value)
+            else:
+                results[name] = obj(events)
+
+        return results
+
+
+def compile_variable_plan(
+    config_inst: od.Config,
+    variable_names: Iterable[str] | None = None,
+    filter_fn: Callable[[od.Variable], bool] | None = None,
+) -> VariablePlan:
+    """
+    Compiles a :py:class:`VariablePlan` for the variables *variable_names* of *config_inst*, or
+    for all variables passing *filter_fn* when no names are given.
+    """
+    if variable_names is None:
+        variable_insts = [v for v in config_inst.variables if not filter_fn or filter_fn(v)]
+    else:
+        variable_insts = [config_inst.get_variable(name) for name in variable_names]
+
+    return VariablePlan(variable_insts)
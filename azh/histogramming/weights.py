@@ -0,0 +1,198 @@
+# coding: utf-8
+
+"""
+Histogramming of weight-only shifts in the same pass as the nominal shift.
+
+Shifts such as ``muon_*``, ``e_sf_*``, ``mur``/``muf``/``pdf``, ``btag_*`` or ``minbias_xs_*``
+only alias event weight columns and leave all variables unchanged, provided that the aliased
+columns are event weights of the config (``cfg.x.event_weights``) or dataset. Their histograms
+can therefore be filled with the bin indices of the nominal pass, accumulating each weight
+variation as an additional row of a :py:class:`~azh.histogramming.fill.FillEngine`, i.e., an
+additional entry of the shift axis.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Sequence
+
+import order as od
+
+from columnflow.util import maybe_import
+from columnflow.columnar_util import Route
+
+from azh.config.routing import get_routing_index
+from azh.histogramming.variables import compile_variable_plan
+from azh.histogramming.fill import FillEngine
+
+np = maybe_import("numpy")
+ak = maybe_import("awkward")
+hist = maybe_import("hist")
+
+
+def is_weight_only_shift(
+    config_inst: od.Config,
+    dataset_inst: od.Dataset,
+    shift_inst: od.Shift,
+    variable_columns: Iterable[str],
+) -> bool:
+    """
+    Returns whether *shift_inst* only changes event weights of *dataset_inst*, i.e., whether it is
+    not selection dependent, not realized through dedicated datasets, and all of its column aliases
+    refer to event weight columns that are not among the *variable_columns*.
+    """
+    if shift_inst.is_nominal:
+        return False
+    if shift_inst.has_tag({"disjoint_from_nominal", "selection_dependent"}, mode=any):
+        return False
+
+    index = get_routing_index(config_inst)
+    if index.aliases(shift_inst.name, selection_dependent=True):
+        return False
+
+    aliases = set(index.aliases(shift_inst.name))
+    if not aliases or not aliases.issubset(index.weight_columns(dataset_inst)):
+        return False
+
+    return not aliases.intersection(variable_columns)
+
+
+def get_weight_only_shifts(
+    config_inst: od.Config,
+    dataset_inst: od.Dataset,
+    variable_columns: Iterable[str],
+    shift_names: Iterable[str] | None = None,
+) -> list[str]:
+    """
+    Returns the names of all weight-only shifts of *config_inst* for *dataset_inst*, optionally
+    restricted to *shift_names*.
+    """
+    variable_columns = set(variable_columns)
+    shift_insts = (
+        config_inst.shifts
+        if shift_names is None
+        else [config_inst.get_shift(name) for name in shift_names]
+    )
+    return [
+        shift_inst.name
+        for shift_inst in shift_insts
+        if is_weight_only_shift(config_inst, dataset_inst, shift_inst, variable_columns)
+    ]
+
+
+def weight_rows(
+    events: ak.Array,
+    config_inst: od.Config,
+    dataset_inst: od.Dataset,
+    shift_names: Sequence[str],
+) -> np.ndarray:
+    """
+    Returns the event weights of the nominal shift (row 0) and of all *shift_names* (subsequent
+    rows) as an array of shape ``(1 + len(shift_names), n_events)``. Each weight column is read
+    once and shared between all rows that do not alias it. A *ValueError* is raised when one of the
+    *shift_names* does not alias any weight column, as its weights would silently equal the
+    nominal ones.
+    """
+    index = get_routing_index(config_inst)
+    columns = sorted(index.weight_columns(dataset_inst)) if dataset_inst.is_mc else []
+
+    cache = {}
+
+    def get(column: str) -> np.ndarray:
+        if column not in cache:
+            cache[column] = np.asarray(Route(column).apply(events), dtype=np.float64)
+        return cache[column]
+
+    nominal = np.ones(len(events), dtype=np.float64)
+    for column in columns:
+        nominal = nominal * get(column)
+
+    rows = [nominal]
+    for shift_name in shift_names:
+        aliased = [column for column in columns if index.resolve(column, shift_name) != column]
+        if not aliased:
+            raise ValueError(
+                f"shift {shift_name} does not alias any event weight column of dataset "
+                f"{dataset_inst.name} ({', '.join(columns) or 'none'})",
+            )
+        weight = np.ones(len(events), dtype=np.float64)
+        for column in columns:
+            weight = weight * get(index.resolve(column, shift_name))
+        rows.append(weight)
+
+    return np.stack(rows, axis=0)
+
+
+class WeightShiftFiller(object):
+    """
+    Fills histograms of *variable_names* in categories *category_ids* for the nominal shift and,
+    in the same pass, for all weight-only shifts among *shift_names* (all config shifts when
+    *None*). Shifts that change kinematics or the selection are not handled and are listed in
+    :py:attr:`skipped_shifts`.
+    """
+
+    def __init__(
+        self,
+        config_inst: od.Config,
+        dataset_inst: od.Dataset,
+        variable_names: Sequence[str],
+        category_ids: Sequence[int],
+        shift_names: Sequence[str] | None = None,
+    ) -> None:
+        super().__init__()
+
+        self.config_inst = config_inst
+        self.dataset_inst = dataset_inst
+        self.plan = compile_variable_plan(config_inst, variable_names)
+
+        # only mc datasets have weight variations
+        if dataset_inst.is_mc:
+            self.shift_names = get_weight_only_shifts(
+                config_inst,
+                dataset_inst,
+                self.plan.columns,
+                shift_names,
+            )
+        else:
+            self.shift_names = []
+        candidates = (
+            [s.name for s in config_inst.shifts]
+            if shift_names is None
+            else list(shift_names)
+        )
+        self.skipped_shifts = [
+            name for name in candidates
+            if name != "nominal" and name not in self.shift_names
+        ]
+
+        self.engine = FillEngine(
+            self.plan.variable_insts,
+            category_ids,
+            shift_ids=[config_inst.get_shift(name).id for name in ["nominal"] + self.shift_names],
+        )
+
+    @property
+    def weight_columns(self) -> set[str]:
+        """
+        Names of all weight columns, including shifted ones, required to fill.
+        """
+        index = get_routing_index(self.config_inst)
+        columns = set(index.weight_columns(self.dataset_inst)) if self.dataset_inst.is_mc else set()
+        return columns | {
+            index.resolve(column, shift_name)
+            for column in columns
+            for shift_name in self.shift_names
+        }
+
+    def fill(self, events: ak.Array) -> None:
+        values = self.plan(events)
+        weights = weight_rows(events, self.config_inst, self.dataset_inst, self.shift_names)
+        self.engine.fill(values, events.category_ids, events.process_id, weights)
+
+    def to_hists(self, shift_name: str | None = None) -> dict[str, hist.Hist]:
+        """
+        Returns histograms per variable name, containing the nominal and all weight-only shifts,
+        or only the shift *shift_name*.
+        """
+        if shift_name is None:
+            return self.engine.to_hists()
+        return self.engine.to_hists(shift_ids=[self.config_inst.get_shift(shift_name).id])
@@ -0,0 +1,100 @@
+# coding: utf-8
+
+"""
+Arrow IPC files as a memory-mapped intermediate format for event columns.
+
+Parquet files are decoded and decompressed on every read. Arrow IPC files written without
+compression can instead be memory-mapped, so that reading them only maps pages of the file and
+``ak.from_arrow`` wraps the mapped buffers without copying, provided that the file contains a
+single record batch (multiple batches would be concatenated into new buffers). LZ4-compressed IPC
+files are smaller but are decompressed into memory on read.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+import law
+
+from columnflow.util import maybe_import
+
+ak = maybe_import("awkward")
+
+
+logger = law.logger.get_logger(__name__)
+
+
+# supported compression codecs of ipc files, "none" for memory-mappable files
+ipc_compressions = ("none", "lz4")
+
+
+def _check_compression(compression: str) -> None:
+    if compression not in ipc_compressions:
+        raise ValueError(
+            f"unknown ipc compression '{compression}', expected one of {ipc_compressions}",
+        )
+
+
+def parquet_to_ipc(src_path: str, dst_path: str, compression: str = "none") -> int:
+    """
+    Converts the parquet file at *src_path* into an arrow ipc file at *dst_path*, combining all
+    row groups into a single record batch so that reads do not need to concatenate buffers.
+    *compression* is one of :py:attr:`ipc_compressions`. Returns the number of rows.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    _check_compression(compression)
+    options = pa.ipc.IpcWriteOptions(compression=None if compression == "none" else compression)
+
+    table = pq.read_table(src_path).combine_chunks()
+    with pa.OSFile(dst_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+
+    return table.num_rows
+
+
+def ak_to_ipc(events: ak.Array, path: str, compression: str = "none") -> None:
+    """
+    Writes *events* into an arrow ipc file at *path* with *compression*.
+    """
+    import pyarrow as pa
+
+    _check_compression(compression)
+    options = pa.ipc.IpcWriteOptions(compression=None if compression == "none" else compression)
+
+    table = ak.to_arrow_table(events).combine_chunks()
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+
+
+def ak_from_ipc(
+    path: str,
+    columns: Iterable[str] | None = None,
+    memory_map: bool = True,
+) -> ak.Array:
+    """
+    Reads the arrow ipc file at *path* into an awkward array, optionally restricted to the
+    top-level fields of *columns* (e.g. ``"Jet"`` for ``"Jet.pt"``). With *memory_map*, buffers of
+    uncompressed files are used in place. The mapping stays open as long as the returned array
+    references its buffers.
+    """
+    import pyarrow as pa
+
+    source = pa.memory_map(path, "r") if memory_map else pa.OSFile(path, "rb")
+    table = pa.ipc.open_file(source).read_all()
+
+    if columns is not None:
+        fields = list(dict.fromkeys(column.split(".", 1)[0] for column in columns))
+        table = table.select([f for f in fields if f in table.column_names])
+
+    events = ak.from_arrow(table)
+
+    # reduce nested fields to the requested ones
+    if columns is not None:
+        from columnflow.columnar_util import RouteFilter
+        events = RouteFilter(list(columns))(events)
+
+    return events
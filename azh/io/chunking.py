@@ -0,0 +1,304 @@
+# coding: utf-8
+
+"""
+Memory-aware adaptive chunk sizing for chunked IO.
+
+The number of events per chunk is derived from a target peak RSS and an estimate of the memory
+needed per event, which is initially obtained from column metadata (uproot branch sizes or
+parquet row group statistics) and refined after each processed chunk from the measured RSS.
+Since the entry ranges of a ``ChunkedIOHandler`` are fixed when it is opened, refined estimates
+are kept per process and reused by subsequent handlers reading the same columns. Within a handler,
+the RSS is checked again right before each chunk is processed, and chunks that would exceed the
+target are split into smaller parts (see :py:func:`iter_split_chunks`).
+"""
+
+from __future__ import annotations
+
+import os
+import resource
+from typing import Any, Iterable, Iterator, Sequence
+
+import law
+
+
+logger = law.logger.get_logger(__name__)
+
+# refined bytes per event (including overhead) per chunker key, shared within this process
+_refined_bytes_per_event: dict[str, float] = {}
+
+
+def get_rss() -> int:
+    """
+    Returns the current resident set size of this process in bytes, falling back to the peak RSS
+    on systems without ``/proc``.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def estimate_bytes_per_event_root(
+    source,
+    columns: Iterable[str] | None = None,
+    tree: str = "Events",
+) -> float:
+    """
+    Estimates the uncompressed bytes per event of the branches of *tree* that correspond to
+    *columns* (all branches when *None*). *source* is either the path of a root file or an
+    already opened uproot directory, such as a remote nano file opened by the caller. Nested
+    columns such as ``"Jet.pt"`` map to their flat nano branches (``"Jet_pt"``), and ``"Jet.*"``
+    to all of them.
+    """
+    import uproot
+    import fnmatch
+
+    if isinstance(source, str):
+        with uproot.open(source) as f:
+            return estimate_bytes_per_event_root(f, columns=columns, tree=tree)
+
+    t = source[tree] if tree in source else source
+    names = t.keys()
+    if columns is not None:
+        patterns = [c.replace(".", "_") for c in columns]
+        names = [n for n in names if any(fnmatch.fnmatch(n, p) for p in patterns)]
+    n_entries = max(t.num_entries, 1)
+    return sum(t[n].uncompressed_bytes for n in names) / n_entries
+
+
+def estimate_bytes_per_event_parquet(path: str, columns: Iterable[str] | None = None) -> float:
+    """
+    Estimates the uncompressed bytes per event of *columns* (all when *None*) in the parquet
+    file at *path* from its row group metadata.
+    """
+    import pyarrow.parquet as pq
+    import fnmatch
+
+    from azh.io.parquet import column_name
+
+    md = pq.ParquetFile(path).metadata
+    n_rows = max(md.num_rows, 1)
+    patterns = list(columns) if columns is not None else None
+    total = 0
+    for i in range(md.num_row_groups):
+        rg = md.row_group(i)
+        for j in range(rg.num_columns):
+            col = rg.column(j)
+            name = column_name(col.path_in_schema)
+            if patterns is None or any(fnmatch.fnmatch(name, p) for p in patterns):
+                total += col.total_uncompressed_size
+    return total / n_rows
+
+
+def estimate_bytes_per_event(source, columns: Iterable[str] | None = None) -> float | None:
+    """
+    Estimates the bytes per event for a root or parquet file at *source*, or for an opened
+    uproot directory, and returns *None* when the format is unknown or the metadata cannot be
+    read.
+    """
+    try:
+        if not isinstance(source, str):
+            if hasattr(source, "keys") and hasattr(source, "file_path"):
+                return estimate_bytes_per_event_root(source, columns)
+        elif source.endswith(".root"):
+            return estimate_bytes_per_event_root(source, columns)
+        elif source.endswith(".parquet"):
+            return estimate_bytes_per_event_parquet(source, columns)
+    except Exception as e:
+        logger.debug(f"could not estimate bytes per event of {source}: {e}")
+    return None
+
+
+class AdaptiveChunker(object):
+    """
+    Determines chunk sizes that keep the peak RSS of a process below *target_rss* bytes.
+
+    The memory per event is modeled as the estimated input bytes per event times an *overhead*
+    factor that accounts for decompression, awkward intermediates and outputs. After each chunk,
+    :py:meth:`observe` refines the model from the measured RSS increase relative to the baseline
+    RSS at construction time, using an exponential moving average with weight *smoothing*.
+    Chunk sizes are clamped to [*min_size*, *max_size*]. Refined estimates are stored under *key*
+    and take precedence over metadata estimates of later chunkers with the same *key*.
+
+    When the baseline RSS leaves less than *min_budget* (a fraction of *target_rss*) for events,
+    the model is considered unreliable and *initial_size* is used instead of clamping to
+    *min_size*.
+    """
+
+    def __init__(
+        self,
+        target_rss: int,
+        bytes_per_event: float | None = None,
+        initial_size: int = 100000,
+        min_size: int = 1000,
+        max_size: int = 1000000,
+        overhead: float = 4.0,
+        smoothing: float = 0.5,
+        min_budget: float = 0.25,
+        name: str = "",
+        key: str | None = None,
+    ) -> None:
+        super().__init__()
+
+        self.target_rss = int(target_rss)
+        self.min_size = int(min_size)
+        self.max_size = int(max_size)
+        self.overhead = overhead
+        self.smoothing = smoothing
+        self.min_budget = min_budget
+        self.name = name
+        self.key = key
+
+        self.baseline_rss = get_rss()
+        self.bytes_per_event = bytes_per_event * overhead if bytes_per_event else None
+        if key is not None and key in _refined_bytes_per_event:
+            self.bytes_per_event = _refined_bytes_per_event[key]
+        self.sizes: list[int] = []
+
+        self._budget_warned = False
+        self._initial_size = self._clamp(initial_size)
+        self._size = self._compute_size() if self.bytes_per_event else self._initial_size
+        self._log(f"initial chunk size {self._size}")
+
+    @classmethod
+    def from_law_config(
+        cls,
+        sources: Sequence = (),
+        columns: Iterable[str] | None = None,
+        **kwargs,
+    ) -> AdaptiveChunker | None:
+        """
+        Creates a chunker from the ``chunked_io_*`` options in the ``[analysis]`` section of the
+        law config, with an initial estimate from the metadata of *sources* (file paths or opened
+        uproot directories). Returns *None* when ``chunked_io_target_rss`` is not set.
+        """
+        target = law.config.get_expanded("analysis", "chunked_io_target_rss", None)
+        if target in (None, "", "None"):
+            return None
+
+        estimates = [estimate_bytes_per_event(source, columns) for source in sources]
+        estimates = [e for e in estimates if e]
+
+        get_int = law.config.get_expanded_int
+        kwargs.setdefault("initial_size", get_int("analysis", "chunked_io_chunk_size", 100000))
+        kwargs.setdefault("min_size", get_int("analysis", "chunked_io_min_chunk_size", 1000))
+        kwargs.setdefault("max_size", get_int("analysis", "chunked_io_max_chunk_size", 1000000))
+
+        return cls(
+            target_rss=law.util.parse_bytes(target, unit="bytes"),
+            bytes_per_event=sum(estimates) if estimates else None,
+            **kwargs,
+        )
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _clamp(self, size: float) -> int:
+        return int(min(max(size, self.min_size), self.max_size))
+
+    def _compute_size(self) -> int:
+        available = self.target_rss - self.baseline_rss
+        if available < self.min_budget * self.target_rss:
+            if not self._budget_warned:
+                self._budget_warned = True
+                logger.warning(
+                    f"baseline rss of {self.baseline_rss / 1024**2:.0f} MB leaves too little of "
+                    f"the target rss of {self.target_rss / 1024**2:.0f} MB, using the default "
+                    "chunk size",
+                )
+            return self._initial_size
+        return self._clamp(available / self.bytes_per_event)
+
+    def _log(self, msg: str) -> None:
+        logger.info(f"adaptive chunking{f' ({self.name})' if self.name else ''}: {msg}")
+
+    def observe(self, n_events: int, peak_rss: int | None = None) -> int:
+        """
+        Updates the memory model after processing a chunk of *n_events* that reached *peak_rss*
+        (the current RSS when *None*) and returns the size of the next chunk.
+        """
+        if n_events <= 0:
+            return self._size
+
+        self.sizes.append(n_events)
+        rss = get_rss() if peak_rss is None else peak_rss
+        measured = max(rss - self.baseline_rss, 0) / n_events
+        if measured > 0:
+            if self.bytes_per_event is None:
+                self.bytes_per_event = measured
+            else:
+                self.bytes_per_event = (
+                    self.smoothing * measured + (1 - self.smoothing) * self.bytes_per_event
+                )
+            if self.key is not None:
+                _refined_bytes_per_event[self.key] = self.bytes_per_event
+
+        if self.bytes_per_event:
+            size = self._compute_size()
+            if size != self._size:
+                self._log(
+                    f"chunk size {self._size} -> {size} "
+                    f"({self.bytes_per_event / 1024:.1f} kB/event, rss {rss / 1024**2:.0f} MB)",
+                )
+            self._size = size
+
+        return self._size
+
+    def next_size(self, rss: int | None = None) -> int:
+        """
+        Returns the number of events that can be processed next given the current *rss* (measured
+        when *None*), i.e., the number of events whose estimated memory fits below the target rss,
+        clamped to [*min_size*, :py:attr:`size`]. Without an estimate, :py:attr:`size` is returned.
+        """
+        if not self.bytes_per_event:
+            return self._size
+        rss = get_rss() if rss is None else rss
+        size = (self.target_rss - rss) / self.bytes_per_event
+        size = int(min(max(size, self.min_size), self._size))
+        if size < self._size:
+            self._log(f"shrinking chunk to {size} events at rss {rss / 1024**2:.0f} MB")
+        return size
+
+    def summary(self) -> str:
+        if not self.sizes:
+            return "no chunks processed"
+        return (
+            f"{len(self.sizes)} chunks, sizes min/mean/max "
+            f"{min(self.sizes)}/{sum(self.sizes) / len(self.sizes):.0f}/{max(self.sizes)}"
+        )
+
+
+def _slice_chunk(chunk: Any, start: int, stop: int) -> Any:
+    # chunks of handlers with multiple sources are sequences of arrays
+    if isinstance(chunk, (list, tuple)):
+        return type(chunk)(c[start:stop] for c in chunk)
+    return chunk[start:stop]
+
+
+def iter_split_chunks(chunks: Iterable[tuple[Any, Any]], chunker: AdaptiveChunker) -> Iterator:
+    """
+    Iterates over pairs of chunks and chunk positions in *chunks*, as yielded by a
+    ``ChunkedIOHandler``, and splits each chunk right before it is processed into parts of at most
+    :py:meth:`AdaptiveChunker.next_size` events given the rss at that time. Parts are yielded with
+    positions covering their entries and consecutive indices, so that consumers ordering outputs
+    by index keep the order of entries. *chunker* observes each part after it was processed.
+    """
+    index = 0
+    for chunk, pos in chunks:
+        n_events = pos.entry_stop - pos.entry_start
+        start = 0
+        while True:
+            stop = min(start + chunker.next_size(), n_events)
+            part = chunk if start == 0 and stop == n_events else _slice_chunk(chunk, start, stop)
+            yield part, pos._replace(
+                index=index,
+                entry_start=pos.entry_start + start,
+                entry_stop=pos.entry_start + stop,
+            )
+            chunker.observe(stop - start)
+            index += 1
+            start = stop
+            if start >= n_events:
+                break
@@ -0,0 +1,176 @@
+# coding: utf-8
+
+"""
+Process-wide cache of compiled correctionlib correction sets.
+
+Weight producers (electron, muon and btag scale factors, jet and met corrections) create their
+``correctionlib.CorrectionSet`` from the gzipped json files in ``cfg.x.external_files`` during
+every task setup. Once :py:func:`install` is called, ``CorrectionSet.from_string`` and
+``CorrectionSet.from_file`` return compiled sets that are parsed and compiled once per process and
+shared between producers, branches and packed jobs. Evaluation of correction sets does not modify
+them, so sharing is safe.
+
+Sets are cached by the real path, modification time and size of their file, determined before the
+content is read. ``from_file`` does not read the file at all for cached sets. Producers that load
+the content through law's gzip formatter and pass it to ``from_string`` receive content tagged with
+the key of its file, so that it is not hashed. Only untagged strings are keyed by their sha256
+hash.
+"""
+
+from __future__ import annotations
+
+import os
+import gzip
+import hashlib
+import threading
+from typing import Any
+
+import law
+
+
+logger = law.logger.get_logger(__name__)
+
+
+# compiled correction sets per file or content key
+_cache: dict[str, Any] = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+# original constructor and gzip loader, set by install()
+_orig_from_string = None
+_orig_load_gzip = None
+
+
+class _KeyedBytes(bytes):
+    """
+    File content that carries the cache key of its file, also after decoding.
+    """
+
+    cache_key = None
+
+    def decode(self, *args, **kwargs) -> _KeyedStr:
+        data = _KeyedStr(super().decode(*args, **kwargs))
+        data.cache_key = self.cache_key
+        return data
+
+
+class _KeyedStr(str):
+
+    cache_key = None
+
+
+def file_key(path: str) -> str:
+    """
+    Returns the cache key of the file at *path*, built from its real path, modification time and
+    size without reading it.
+    """
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def content_hash(data: str | bytes) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _get(key: str, build) -> Any:
+    with _lock:
+        if key in _cache:
+            _stats["hits"] += 1
+            return _cache[key]
+        _stats["misses"] += 1
+        cset = _cache[key] = build()
+    logger.debug(f"compiled correction set {key} ({len(_cache)} cached)")
+    return cset
+
+
+def _from_string():
+    if _orig_from_string is not None:
+        return _orig_from_string
+
+    import correctionlib
+
+    return correctionlib.CorrectionSet.from_string
+
+
+def correction_set_from_string(data: str | bytes) -> Any:
+    """
+    Returns the compiled correction set of the json *data*, cached by the key of the file it was
+    loaded from or, if unknown, by its content hash.
+    """
+    from_string = _from_string()
+    key = getattr(data, "cache_key", None)
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    return _get(key or content_hash(data), lambda: from_string(data))
+
+
+def correction_set_from_file(path: str) -> Any:
+    """
+    Returns the compiled correction set of the (optionally gzipped) json file at *path*, cached by
+    its :py:func:`file_key`. The file is only read when the set is not cached yet.
+    """
+    from_string = _from_string()
+    path = os.path.expandvars(os.path.expanduser(str(path)))
+
+    def build():
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            return from_string(f.read().decode("utf-8"))
+
+    return _get(file_key(path), build)
+
+
+def load_gzip(path, *args, **kwargs) -> bytes:
+    """
+    Replacement of ``law.target.formatter.GZipFormatter.load`` that tags the decompressed content
+    with the :py:func:`file_key` of *path*, determined before reading.
+    """
+    from law.target.file import get_path
+
+    if args or kwargs:
+        return _orig_load_gzip(path, *args, **kwargs)
+
+    try:
+        key = file_key(get_path(path))
+    except OSError:
+        # not a local file
+        return _orig_load_gzip(path)
+
+    data = _KeyedBytes(_orig_load_gzip(path))
+    data.cache_key = key
+    return data
+
+
+def cache_info() -> dict[str, int]:
+    return {"size": len(_cache), **_stats}
+
+
+def clear() -> None:
+    with _lock:
+        _cache.clear()
+
+
+def install() -> None:
+    """
+    Replaces ``correctionlib.CorrectionSet.from_string`` and ``from_file`` with their cached
+    versions and tags content loaded with law's gzip formatter with the key of its file.
+    """
+    global _orig_from_string, _orig_load_gzip
+
+    import correctionlib
+
+    if _orig_from_string is not None:
+        return
+
+    _orig_from_string = correctionlib.CorrectionSet.from_string
+
+    correctionlib.CorrectionSet.from_string = staticmethod(correction_set_from_string)
+    correctionlib.CorrectionSet.from_file = staticmethod(correction_set_from_file)
+
+    from law.target.formatter import GZipFormatter
+
+    _orig_load_gzip = GZipFormatter.load
+    GZipFormatter.load = staticmethod(load_gzip)
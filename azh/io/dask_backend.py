@@ -0,0 +1,211 @@
+# coding: utf-8
+
+"""
+Optional dask execution of selectors and producers.
+
+Instead of calling a selector or producer chunk by chunk in one process, the partitions of a
+dask-awkward array are converted to delayed objects and the function is called eagerly on each of
+them by a local multi-core scheduler, e.g. for interactive studies on full datasets. The function
+is not traced, so that functions converting columns to numpy arrays are supported, and no output
+type needs to be inferred upfront. As a consequence, dask-awkward cannot determine the necessary
+columns by itself (``dak.necessary_columns`` requires a traced graph), so inputs are projected
+explicitly when they are opened, to the columns declared through the ``uses`` of the function
+(including those of all sub-functions): parquet files are read with these columns, and NanoAOD
+files with a filter on the corresponding branches.
+
+Since each partition is processed by exactly the same function as in eager mode and selectors and
+producers do not combine information across events, results are expected to be identical to eager
+execution. :py:func:`run_dask` verifies this on a small leading range of events by comparing with
+an eager call via :py:func:`assert_identical`. Selector statistics are accumulated per partition
+and merged into the *stats* passed by the caller.
+
+Requires ``dask-awkward`` and, for NanoAOD inputs, coffea with dask support, as shipped in the
+``example`` sandbox.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Any, Sequence
+
+import law
+
+from columnflow.util import maybe_import
+from columnflow.columnar_util import Route
+
+np = maybe_import("numpy")
+ak = maybe_import("awkward")
+
+
+logger = law.logger.get_logger(__name__)
+
+
+def used_columns(func_inst: Any) -> list[str]:
+    """
+    Returns the sorted names of all columns used by the array function *func_inst*.
+    """
+    return sorted({Route(c).column for c in func_inst.used_columns})
+
+
+def nano_branches(columns: Sequence[str]) -> list[str]:
+    """
+    Returns the patterns of the NanoAOD branches of *columns*, e.g. ``"Jet_pt"`` for ``"Jet.pt"``,
+    including the counts of collections (``"nJet"``) needed to build their structure.
+    """
+    routes = [Route(c) for c in columns]
+    names = {route.string_nano_column for route in routes}
+    names |= {f"n{route[0]}" for route in routes if len(route) > 1}
+    return sorted(names)
+
+
+def read_dask(
+    paths: Sequence[str],
+    columns: Sequence[str] | None = None,
+    step_size: int = 100000,
+) -> Any:
+    """
+    Returns a dask-awkward array of the events in *paths*. Parquet files (e.g. reduced events) are
+    read restricted to *columns*, root files are opened as NanoAOD events with coffea, restricted
+    to the branches of *columns*, one partition per *step_size* entries.
+    """
+    if all(path.endswith(".parquet") for path in paths):
+        import dask_awkward as dak
+        return dak.from_parquet(list(paths), columns=list(columns) if columns else None)
+
+    from coffea.nanoevents import NanoEventsFactory, NanoAODSchema
+    uproot_options = {"step_size": step_size}
+    if columns:
+        uproot_options["filter_name"] = nano_branches(columns)
+    return NanoEventsFactory.from_root(
+        {path: "Events" for path in paths},
+        schemaclass=NanoAODSchema,
+        permit_dask=True,
+        uproot_options=uproot_options,
+    ).events()
+
+
+def read_eager(path: str, n_events: int, columns: Sequence[str] | None = None) -> ak.Array:
+    """
+    Eagerly reads the first *n_events* events of the file at *path*, restricted to *columns*. For
+    parquet files, the collections of *columns* are streamed in batches of *n_events* rows, so that
+    only the pages of the first batch are read, and for root files, only the requested entries of
+    their branches are read.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(path)
+        fields = sorted({Route(c)[0] for c in columns}) if columns else None
+        batch = next(pf.iter_batches(batch_size=max(n_events, 1), columns=fields), None)
+        if batch is None:
+            return ak.from_arrow(pf.schema_arrow.empty_table())
+        return ak.from_arrow(batch)[:n_events]
+
+    from coffea.nanoevents import NanoEventsFactory, NanoAODSchema
+    uproot_options = {"filter_name": nano_branches(columns)} if columns else {}
+    return NanoEventsFactory.from_root(
+        {path: "Events"},
+        schemaclass=NanoAODSchema,
+        entry_stop=n_events,
+        uproot_options=uproot_options,
+    ).events()
+
+
+def _call(events: ak.Array, func_inst: Any, kind: str, aliases: dict, kwargs: dict) -> tuple:
+    # calls the function on one partition and returns its output and selector statistics
+    from columnflow.columnar_util import add_ak_aliases
+
+    if aliases:
+        events = add_ak_aliases(events, aliases, remove_src=True)
+
+    if kind == "producer":
+        return func_inst(events, **kwargs), None
+
+    # selectors return events and a selection result, from which the event and step masks are
+    # returned as columns
+    stats = defaultdict(float)
+    events, results = func_inst(events, stats=stats, **kwargs)
+    output = ak.zip(
+        {"event": results.event, "steps": ak.zip(dict(results.steps), depth_limit=1)},
+        depth_limit=1,
+    )
+    return output, stats
+
+
+def run_dask(
+    func_inst: Any,
+    paths: Sequence[str],
+    kind: str = "producer",
+    n_workers: int = 4,
+    scheduler: str = "processes",
+    step_size: int = 100000,
+    aliases: dict[str, str] | None = None,
+    stats: dict | None = None,
+    n_verify_events: int = 1000,
+    **kwargs,
+) -> ak.Array:
+    """
+    Runs the selector or producer (*kind*) *func_inst* on all events in *paths* with the local
+    dask *scheduler* using *n_workers* and returns the concatenated output. Column *aliases* are
+    applied to each partition before the call. Statistics of selectors are merged into *stats*.
+
+    Unless *n_verify_events* is zero, the output of the first *n_verify_events* events is compared
+    to that of an eager call on the same events, raising an *AssertionError* when they differ.
+    """
+    import dask
+    from azh.io.parallel import merge_stats
+
+    if kind not in ("producer", "selector"):
+        raise ValueError(f"unknown kind '{kind}', expected producer or selector")
+
+    aliases = dict(aliases or {})
+    columns = sorted(set(used_columns(func_inst)) | set(aliases.values()))
+    events = read_dask(paths, columns=columns, step_size=step_size)
+
+    logger.info(
+        f"running {kind} {func_inst.cls_name} on {events.npartitions} partitions with "
+        f"{n_workers} workers, reading {len(columns)} columns",
+    )
+    call = dask.delayed(_call, pure=True)
+    tasks = [call(part, func_inst, kind, aliases, kwargs) for part in events.to_delayed()]
+    results = dask.compute(*tasks, scheduler=scheduler, num_workers=n_workers)
+
+    outputs = [output for output, _ in results]
+    if stats is not None:
+        for _, part_stats in results:
+            if part_stats:
+                merge_stats(stats, part_stats)
+    output = outputs[0] if len(outputs) == 1 else ak.concatenate(outputs, axis=0)
+
+    # compare the leading events to eager execution
+    if n_verify_events:
+        eager_events = read_eager(paths[0], n_verify_events, columns=columns)
+        n = len(eager_events)
+        eager_output, _ = _call(eager_events, func_inst, kind, aliases, kwargs)
+        dask_output = output[:n]
+        if kind == "producer":
+            # inputs are read differently, so only compare produced columns
+            from columnflow.columnar_util import RouteFilter
+            route_filter = RouteFilter(func_inst.produced_columns)
+            dask_output, eager_output = route_filter(dask_output), route_filter(eager_output)
+        assert_identical(dask_output, eager_output)
+        logger.debug(f"verified dask output of the first {n} events against eager execution")
+
+    return output
+
+
+def assert_identical(a: ak.Array, b: ak.Array) -> None:
+    """
+    Raises an *AssertionError* unless *a* and *b* have the same type and identical buffer contents,
+    e.g. to compare the outputs of eager and dask execution bit for bit.
+    """
+    form_a, len_a, bufs_a = ak.to_buffers(ak.to_packed(a))
+    form_b, len_b, bufs_b = ak.to_buffers(ak.to_packed(b))
+
+    if len_a != len_b:
+        raise AssertionError(f"lengths differ: {len_a} != {len_b}")
+    if form_a != form_b:
+        raise AssertionError(f"forms differ:\n{form_a}\n{form_b}")
+    for key, buf in bufs_a.items():
+        if np.asarray(buf).tobytes() != np.asarray(bufs_b[key]).tobytes():
+            raise AssertionError(f"buffer {key} differs")
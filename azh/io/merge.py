@@ -0,0 +1,97 @@
+# coding: utf-8
+
+"""
+Streaming merging of parquet files with bounded memory.
+
+Instead of reading whole input files, :py:func:`stream_merge_parquet` copies row groups one at a
+time into the output file, buffering at most *max_buffered_row_groups* of them in memory in order
+to coalesce small row groups (e.g. from chunk files with few selected events) into row groups of
+about *row_group_size* rows. The grouping of files into outputs is unchanged and still follows the
+merging factors of ``cf.MergeReductionStats``.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Sequence
+
+import law
+
+from azh.io.storage import ColumnStoragePolicy
+
+
+logger = law.logger.get_logger(__name__)
+
+
+def stream_merge_parquet(
+    src_paths: Sequence[str],
+    dst_path: str,
+    row_group_size: int | None = None,
+    max_buffered_row_groups: int = 4,
+    writer_opts: dict[str, Any] | None = None,
+    policy: ColumnStoragePolicy | None = None,
+) -> int:
+    """
+    Merges the parquet files at *src_paths*, which must share a schema, into *dst_path* and
+    returns the number of rows. Row groups are written as they are unless they are smaller than
+    *row_group_size* rows, in which case up to *max_buffered_row_groups* consecutive row groups
+    are combined. *writer_opts* are forwarded to ``pyarrow.parquet.ParquetWriter``, updated by the
+    per-column codecs of the storage *policy* the files were written with.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if max_buffered_row_groups < 1:
+        raise ValueError(f"max_buffered_row_groups must be positive, got {max_buffered_row_groups}")
+    if not src_paths:
+        raise ValueError("cannot merge empty list of parquet files")
+
+    writer = None
+    schema = None
+    buffer = []
+    n_rows = 0
+
+    def flush():
+        nonlocal n_rows
+        if not buffer:
+            return
+        table = buffer[0] if len(buffer) == 1 else pa.concat_tables(buffer)
+        writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        n_rows += table.num_rows
+        del buffer[:]
+
+    try:
+        for path in src_paths:
+            pf = pq.ParquetFile(path)
+            if writer is None:
+                schema = pf.schema_arrow
+                opts = dict(writer_opts or {})
+                if policy is not None:
+                    opts.update(policy.parquet_writer_opts(pf.schema))
+                writer = pq.ParquetWriter(dst_path, schema, **opts)
+            elif not pf.schema_arrow.equals(schema, check_metadata=False):
+                raise ValueError(f"schema of {path} differs from the schema of {src_paths[0]}")
+
+            for i in range(pf.num_row_groups):
+                table = pf.read_row_group(i).replace_schema_metadata(schema.metadata)
+                if not table.num_rows:
+                    continue
+                buffer.append(table)
+                buffered_rows = sum(t.num_rows for t in buffer)
+                if (
+                    row_group_size is None or
+                    buffered_rows >= row_group_size or
+                    len(buffer) >= max_buffered_row_groups
+                ):
+                    flush()
+        flush()
+
+        # files without any rows still need a valid, empty output
+        if n_rows == 0:
+            writer.write_table(schema.empty_table())
+    finally:
+        if writer is not None:
+            writer.close()
+
+    logger.debug(f"merged {len(src_paths)} files with {n_rows} rows into {dst_path}")
+
+    return n_rows
@@ -0,0 +1,278 @@
+# coding: utf-8
+
+"""
+Content-addressed local mirror of external files.
+
+Entries of ``cfg.x.external_files`` are ``(path, version)`` tuples pointing to afs locations or
+urls, which are slow or unavailable on worker nodes. An :py:class:`ExternalFilesMirror` stores
+their contents under their sha256 hash in ``objects/`` and records in ``manifest.json`` which
+``(path, version)`` resolves to which hash. Resolution is deterministic and does not need any
+network access. Configs keep their original locations, so that hashes and outputs of
+``cf.BundleExternalFiles`` do not depend on the node, and the mirror is only consulted when the
+files are fetched (:py:func:`mirrored_external_files`). Entries that are not mirrored are fetched
+from their original location.
+
+Sources are fetched in parallel by :py:meth:`ExternalFilesMirror.sync`, which verifies that the
+content of already mirrored entries did not change. Concurrent syncs merge their entries into the
+manifest under a file lock. Sources can be urls or local paths, so a local directory can stand in
+for afs.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import contextlib
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator
+
+import law
+import order as od
+
+
+logger = law.logger.get_logger(__name__)
+
+# bump when the manifest format changes
+MANIFEST_FORMAT = 1
+
+
+def iter_external_files(
+    external_files: dict,
+    prefix: tuple[str, ...] = (),
+) -> Iterator[tuple[tuple[str, ...], tuple[str, str]]]:
+    """
+    Yields the key path and the ``(path, version)`` tuple of all entries in the nested
+    *external_files* mapping.
+    """
+    for key, value in external_files.items():
+        if isinstance(value, dict):
+            yield from iter_external_files(value, prefix + (key,))
+        elif isinstance(value, (tuple, list)) and len(value) == 2:
+            yield prefix + (key,), (str(value[0]), str(value[1]))
+        else:
+            yield prefix + (key,), (str(value), "")
+
+
+def entry_key(src: str, version: str) -> str:
+    return f"{src}@{version}"
+
+
+def fetch_source(src: str, dst: str, timeout: float = 60.0) -> None:
+    """
+    Fetches *src*, a url or a local path, to the local path *dst*.
+    """
+    if "://" in src and not src.startswith("file://"):
+        with urllib.request.urlopen(src, timeout=timeout) as r, open(dst, "wb") as f:
+            shutil.copyfileobj(r, f)
+    else:
+        path = src[len("file://"):] if src.startswith("file://") else src
+        shutil.copyfile(os.path.expandvars(os.path.expanduser(path)), dst)
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ExternalFilesMirror(object):
+    """
+    Mirror of external files in the directory *root*.
+    """
+
+    def __init__(self, root: str) -> None:
+        super().__init__()
+
+        self.root = os.path.expandvars(os.path.expanduser(root))
+        self.manifest_path = os.path.join(self.root, "manifest.json")
+        self._manifest: dict[str, dict[str, Any]] | None = None
+
+    @property
+    def manifest(self) -> dict[str, dict[str, Any]]:
+        if self._manifest is None:
+            self._manifest = self._read_manifest()
+        return self._manifest
+
+    def _read_manifest(self) -> dict[str, dict[str, Any]]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r") as f:
+            data = json.load(f)
+        if data.get("format") != MANIFEST_FORMAT:
+            logger.warning(f"ignoring manifest {self.manifest_path} with unknown format")
+            return {}
+        return data["entries"]
+
+    def _write_manifest(self, keys: set[str]) -> None:
+        # merge the entries *keys* into the manifest on disk, which might have been extended by
+        # concurrent syncs since it was read, holding an exclusive lock while doing so
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, "manifest.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = self._read_manifest()
+                entries.update({key: self.manifest[key] for key in keys})
+                fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".json")
+                with os.fdopen(fd, "w") as f:
+                    data = {"format": MANIFEST_FORMAT, "entries": entries}
+                    json.dump(data, f, indent=4, sort_keys=True)
+                os.replace(tmp, self.manifest_path)
+                self._manifest = entries
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def object_path(self, sha256: str, name: str) -> str:
+        # keep the original file name, as consumers might dispatch on its extension
+        return os.path.join(self.root, "objects", sha256[:2], sha256, name)
+
+    def resolve(self, src: str, version: str, verify: bool = False) -> str | None:
+        """
+        Returns the local path of the mirrored content of ``(src, version)``, or *None* when it is
+        not mirrored. With *verify*, the content hash is checked as well.
+        """
+        entry = self.manifest.get(entry_key(src, version))
+        if not entry:
+            return None
+        path = self.object_path(entry["sha256"], entry["name"])
+        if not os.path.exists(path):
+            return None
+        if verify and file_hash(path) != entry["sha256"]:
+            raise Exception(f"mirrored content of {src} ({version}) at {path} is corrupted")
+        return path
+
+    def _fetch(self, src: str, version: str) -> dict[str, Any]:
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+        os.close(fd)
+        try:
+            fetch_source(src, tmp)
+            sha256 = file_hash(tmp)
+
+            # versions are expected to pin the content
+            entry = self.manifest.get(entry_key(src, version))
+            if entry and entry["sha256"] != sha256:
+                raise Exception(
+                    f"content of {src} changed without a version change ({version}): "
+                    f"{entry['sha256']} -> {sha256}",
+                )
+
+            name = os.path.basename(src.rstrip("/")) or "file"
+            dst = self.object_path(sha256, name)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.replace(tmp, dst)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        return {"sha256": sha256, "size": os.path.getsize(dst), "name": name}
+
+    def sync(
+        self,
+        external_files: dict,
+        n_workers: int = 8,
+        offline: bool = False,
+        refresh: bool = False,
+    ) -> dict[str, str]:
+        """
+        Mirrors all entries of *external_files* that are not mirrored yet (or all of them with
+        *refresh*) using *n_workers* parallel fetches and returns a mapping of entry keys to
+        errors of failed fetches. In *offline* mode, nothing is fetched and missing entries are
+        reported as errors.
+        """
+        entries = {
+            entry_key(src, version): (src, version)
+            for _, (src, version) in iter_external_files(external_files)
+        }
+        todo = {
+            key: src_version for key, src_version in entries.items()
+            if refresh or self.resolve(*src_version) is None
+        }
+
+        errors = {}
+        if offline:
+            errors.update({key: "not mirrored (offline)" for key in todo})
+            return errors
+
+        mirrored = set()
+        with ThreadPoolExecutor(max_workers=max(n_workers, 1)) as pool:
+            futures = {key: pool.submit(self._fetch, *todo[key]) for key in sorted(todo)}
+            for key, future in futures.items():
+                try:
+                    self.manifest[key] = future.result()
+                    mirrored.add(key)
+                    logger.info(f"mirrored {key}")
+                except Exception as e:
+                    errors[key] = str(e)
+                    logger.warning(f"could not mirror {key}: {e}")
+
+        if mirrored:
+            self._write_manifest(mirrored)
+
+        logger.info(
+            f"{len(entries) - len(errors)}/{len(entries)} external files mirrored in {self.root}",
+        )
+
+        return errors
+
+    def rewrite(self, external_files: dict) -> dict:
+        """
+        Returns a copy of *external_files* with the paths of all mirrored entries replaced by their
+        local paths, keeping versions and the structure. Entries given as plain paths, which have an
+        empty version (see :py:func:`iter_external_files`), stay plain paths. Entries that are not
+        mirrored are kept.
+        """
+        def rewrite(value):
+            if isinstance(value, dict):
+                return value.__class__({k: rewrite(v) for k, v in value.items()})
+            if isinstance(value, (tuple, list)) and len(value) == 2:
+                local = self.resolve(str(value[0]), str(value[1]))
+                return (local, value[1]) if local else value
+            return self.resolve(str(value), "") or value
+
+        return rewrite(external_files)
+
+
+def get_mirror() -> ExternalFilesMirror | None:
+    """
+    Returns the mirror configured via ``external_files_mirror`` in the ``[analysis]`` section of
+    the law config, or *None* when not set.
+    """
+    root = law.config.get_expanded("analysis", "external_files_mirror", None)
+    if root in (None, "", "None"):
+        return None
+    return ExternalFilesMirror(root)
+
+
+@contextlib.contextmanager
+def mirrored_external_files(config_inst: od.Config) -> Iterator[dict[str, str]]:
+    """
+    Context manager that temporarily points the external files of *config_inst* to the configured
+    mirror, e.g. while ``cf.BundleExternalFiles`` fetches them, and restores the original locations
+    on exit. Yields a mapping of local mirror paths to original sources, which is empty when no
+    mirror is configured.
+    """
+    mirror = get_mirror()
+    if mirror is None or not config_inst.has_aux("external_files"):
+        yield {}
+        return
+
+    sources = config_inst.x.external_files
+    local_sources = {}
+    for _, (src, version) in iter_external_files(sources):
+        local = mirror.resolve(src, version)
+        if local:
+            local_sources[local] = src
+
+    config_inst.x.external_files = mirror.rewrite(sources)
+    try:
+        yield local_sources
+    finally:
+        config_inst.x.external_files = sources
@@ -0,0 +1,411 @@
+# coding: utf-8
+
+"""
+Process-pool parallelism over chunks with arrays exchanged via shared memory.
+
+A :py:class:`ChunkPool` applies a function, such as an initialized producer or selector, to
+chunks in worker processes and yields the results in the order of the chunks. Awkward arrays are
+not pickled but packed (which copies arrays that are not contiguous yet), decomposed into their
+buffers and copied into a POSIX shared memory block, which the receiving side maps without
+copying on linux. Functions applied by workers are created once per worker by a picklable
+*factory*, so producers like ``choose_lepton`` or ``z_boson`` run unchanged. Statistics that
+selectors accumulate in their *stats* argument are collected per chunk and merged in the parent
+process, see :py:meth:`ChunkPool.map`.
+
+Tasks keep their chunk loops: a :py:class:`ChunkLookahead` submits chunks to the pool while they
+are read, ahead of the loop processing them, and :py:func:`pooled_calls` makes calls of the
+selector or producer within the loop return the result of the current chunk (see
+``patch_chunk_pool`` in :py:mod:`azh.columnflow_patches`).
+"""
+
+from __future__ import annotations
+
+import os
+import functools
+import contextlib
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Any, Callable, Iterable, Iterator
+
+import law
+
+from columnflow.util import maybe_import
+
+np = maybe_import("numpy")
+ak = maybe_import("awkward")
+
+
+logger = law.logger.get_logger(__name__)
+
+
+# directory backing posix shared memory on linux
+shm_dir = "/dev/shm"
+
+
+def share_array(array: ak.Array) -> dict[str, Any]:
+    """
+    Copies the buffers of *array* into a new shared memory block and returns a picklable
+    descriptor to be passed to :py:func:`attach_array`, which takes over ownership of the block.
+    """
+    from multiprocessing import shared_memory, resource_tracker
+
+    form, length, container = ak.to_buffers(ak.to_packed(array))
+
+    offsets, pos = {}, 0
+    for key, buf in container.items():
+        buf = np.asarray(buf)
+        offsets[key] = (pos, buf.nbytes, buf.dtype.str)
+        # align buffers to 64 bytes
+        pos += (buf.nbytes + 63) // 64 * 64
+
+    shm = shared_memory.SharedMemory(create=True, size=max(pos, 1))
+    for key, buf in container.items():
+        start, nbytes, _ = offsets[key]
+        shm.buf[start:start + nbytes] = np.asarray(buf).view(np.uint8).ravel()
+
+    # the receiving side unlinks the block, so do not let this process track it
+    resource_tracker.unregister(shm._name, "shared_memory")
+    shm.close()
+
+    return {
+        "name": shm.name,
+        "form": form.to_json(),
+        "length": length,
+        "buffers": offsets,
+        "behavior": array.behavior,
+    }
+
+
+def attach_array(desc: dict[str, Any]) -> ak.Array:
+    """
+    Returns the array described by *desc* (see :py:func:`share_array`) and unlinks its shared
+    memory block. On linux, buffers are copy-on-write mappings that are released together with
+    the array, elsewhere they are copied out of the block.
+    """
+    from multiprocessing import shared_memory
+
+    path = os.path.join(shm_dir, desc["name"].lstrip("/"))
+    if os.path.exists(path):
+        if os.path.getsize(path):
+            mem = np.memmap(path, dtype=np.uint8, mode="c")
+        else:
+            mem = np.zeros(0, dtype=np.uint8)
+        os.unlink(path)
+    else:
+        shm = shared_memory.SharedMemory(name=desc["name"])
+        mem = np.array(shm.buf, dtype=np.uint8)
+        shm.close()
+        shm.unlink()
+
+    container = {
+        key: mem[start:start + nbytes].view(np.dtype(dtype))
+        for key, (start, nbytes, dtype) in desc["buffers"].items()
+    }
+    form = ak.forms.from_json(desc["form"])
+
+    return ak.from_buffers(form, desc["length"], container, behavior=desc["behavior"])
+
+
+def _share(obj: Any) -> Any:
+    # share awkward arrays directly or as members of tuples, other objects are pickled
+    if isinstance(obj, ak.Array):
+        return ("__shared__", share_array(obj))
+    if isinstance(obj, tuple):
+        return tuple(_share(o) for o in obj)
+    return obj
+
+
+def _attach(obj: Any) -> Any:
+    if isinstance(obj, tuple) and len(obj) == 2 and obj[0] == "__shared__":
+        return attach_array(obj[1])
+    if isinstance(obj, tuple):
+        return tuple(_attach(o) for o in obj)
+    return obj
+
+
+# function applied by a worker process, created by the pool's factory in each worker
+_worker_func: Callable | None = None
+
+
+def _init_worker(factory: Callable[[], Callable]) -> None:
+    global _worker_func
+    _worker_func = factory()
+
+
+def _run_worker(shared_args: tuple, kwargs: dict[str, Any], collect_stats: bool) -> tuple:
+    # returns the shared result and, when requested, the stats accumulated by this chunk
+    stats = collections.defaultdict(float) if collect_stats else None
+    if collect_stats:
+        kwargs = {**kwargs, "stats": stats}
+    return _share(_worker_func(*_attach(shared_args), **kwargs)), stats
+
+
+def merge_stats(stats: dict, update: dict) -> dict:
+    """
+    Adds the values in *update* to those in *stats*, recursing into nested dictionaries such as
+    per-process sums, and returns *stats*.
+    """
+    for key, value in update.items():
+        if key not in stats:
+            stats[key] = value
+        elif isinstance(value, dict):
+            merge_stats(stats[key], value)
+        else:
+            stats[key] += value
+    return stats
+
+
+class ChunkPool(object):
+    """
+    Pool of *n_workers* processes applying the function returned by *factory* to chunks. At most
+    *max_pending* chunks are in flight, so that memory stays bounded. Processes are started with
+    the *start_method* of multiprocessing ("spawn" by default, since forking a process with io
+    threads is unsafe).
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Callable],
+        n_workers: int = 4,
+        max_pending: int | None = None,
+        start_method: str = "spawn",
+    ) -> None:
+        super().__init__()
+
+        self.factory = factory
+        self.n_workers = n_workers
+        self.max_pending = max_pending or 2 * n_workers
+        self.start_method = start_method
+
+        self._executor: ProcessPoolExecutor | None = None
+
+    def __enter__(self) -> ChunkPool:
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_worker,
+            initargs=(self.factory,),
+        )
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=exc_type is not None)
+        self._executor = None
+
+    @staticmethod
+    def _discard(future: Future, shared_args: tuple) -> None:
+        # attach and drop inputs of cancelled chunks and results that will not be consumed,
+        # freeing their shared memory
+        if future.cancel():
+            _attach(shared_args)
+        elif future.exception() is None:
+            _attach(future.result()[0])
+
+    def map(
+        self,
+        chunks: Iterable[tuple | ak.Array | None],
+        stats: dict | None = None,
+        return_stats: bool = False,
+        **kwargs,
+    ) -> Iterator[Any]:
+        """
+        Applies the worker function to all *chunks*, each being an array or a tuple of arguments,
+        with additional *kwargs*, and yields the results in the order of *chunks*. Chunks that are
+        *None* are not submitted and yield *None*.
+
+        When *stats* is given, each call receives a new ``defaultdict(float)`` as its *stats*
+        argument, which is merged into *stats* via :py:func:`merge_stats` before the result of
+        the chunk is yielded. With *return_stats*, calls receive a *stats* argument as well, and
+        pairs of results and the stats of their chunks are yielded instead.
+        """
+        if self._executor is None:
+            raise RuntimeError("ChunkPool must be used as a context manager")
+
+        collect_stats = stats is not None or return_stats
+
+        def result(future: Future | None) -> Any:
+            if future is None:
+                return (None, None) if return_stats else None
+            shared_result, chunk_stats = future.result()
+            if stats is not None:
+                merge_stats(stats, chunk_stats)
+            shared_result = _attach(shared_result)
+            return (shared_result, chunk_stats) if return_stats else shared_result
+
+        pending = collections.deque()
+        try:
+            for chunk in chunks:
+                if chunk is None:
+                    pending.append((None, None))
+                else:
+                    shared_args = _share(chunk if isinstance(chunk, tuple) else (chunk,))
+                    future = self._executor.submit(_run_worker, shared_args, kwargs, collect_stats)
+                    pending.append((future, shared_args))
+                if len(pending) >= self.max_pending:
+                    yield result(pending.popleft()[0])
+            while pending:
+                yield result(pending.popleft()[0])
+        finally:
+            for future, shared_args in pending:
+                if future is not None:
+                    self._discard(future, shared_args)
+
+
+class ChunkLookahead(object):
+    """
+    Iterable over the ``(chunk, pos)`` pairs of *chunks*, as yielded by a ``ChunkedIOHandler``,
+    that applies the worker function of *pool* to ``prepare(chunk)`` ahead of the chunk being
+    yielded. *prepare* returns the arguments of the worker function, or *None* for chunks to be
+    processed by the caller itself. With *stats*, stats are collected per chunk.
+
+    :py:meth:`pop_result` returns the result of the chunk yielded last.
+    """
+
+    def __init__(
+        self,
+        pool: ChunkPool,
+        chunks: Iterable[tuple[Any, Any]],
+        prepare: Callable[[Any], Any],
+        stats: bool = False,
+    ) -> None:
+        super().__init__()
+
+        self.pool = pool
+        self.chunks = chunks
+        self.prepare = prepare
+        self.stats = stats
+
+        self._result: tuple[Any, dict | None] | None = None
+
+    def __iter__(self) -> Iterator[tuple[Any, Any]]:
+        # chunks read but not yet yielded, in the order of their results
+        read = collections.deque()
+
+        def args():
+            for chunk, pos in self.chunks:
+                read.append((chunk, pos))
+                yield self.prepare(chunk)
+
+        try:
+            for result in self.pool.map(args(), return_stats=self.stats):
+                self._result = result if self.stats else (result, None)
+                yield read.popleft()
+        finally:
+            self._result = None
+
+    def pop_result(self) -> tuple[Any, dict | None] | None:
+        """
+        Returns the pair of the result and stats of the current chunk, or *None* when it was not
+        submitted or its result was already returned.
+        """
+        result, self._result = self._result, None
+        if result is None or result[0] is None:
+            return None
+        return result
+
+
+@contextlib.contextmanager
+def pooled_calls(inst: Any, lookahead: ChunkLookahead) -> Iterator[None]:
+    """
+    Context manager that makes calls of the array function *inst* return the results of the
+    current chunk of *lookahead* instead, when available. Stats of the chunk are merged into the
+    *stats* argument of the call (the second positional or the *stats* keyword argument). Other
+    instances of the class of *inst* are not affected.
+    """
+    cls = type(inst)
+    had_call = "__call__" in cls.__dict__
+    orig_call = cls.__call__
+
+    @functools.wraps(orig_call)
+    def __call__(self, *args, **kwargs):
+        result = lookahead.pop_result() if self is inst else None
+        if result is None:
+            return orig_call(self, *args, **kwargs)
+
+        output, chunk_stats = result
+        if chunk_stats:
+            stats = kwargs["stats"] if "stats" in kwargs else args[1]
+            merge_stats(stats, chunk_stats)
+        return output
+
+    cls.__call__ = __call__
+    try:
+        yield
+    finally:
+        if had_call:
+            cls.__call__ = orig_call
+        else:
+            del cls.__call__
+
+
+def _build_array_function(
+    cls_name: str,
+    kind: str,
+    config_name: str,
+    dataset_name: str,
+    shift_name: str,
+    setup_inputs: dict | None,
+    output_columns: list[str] | None,
+) -> Callable:
+    from columnflow.calibration import Calibrator
+    from columnflow.selection import Selector
+    from columnflow.production import Producer
+    from columnflow.util import InsertableDict
+
+    analysis_inst = law.util.import_obj(law.config.get_expanded("analysis", "default_analysis"))
+    config_inst = analysis_inst.get_config(config_name)
+    dataset_inst = config_inst.get_dataset(dataset_name)
+
+    base_cls = {"calibrator": Calibrator, "selector": Selector, "producer": Producer}[kind]
+    inst = base_cls.get_cls(cls_name)(inst_dict={
+        "analysis_inst": analysis_inst,
+        "config_inst": config_inst,
+        "dataset_inst": dataset_inst,
+        "global_shift_inst": config_inst.get_shift(shift_name),
+    })
+    inst.run_setup({}, setup_inputs or {}, InsertableDict())
+
+    if output_columns is None:
+        return inst
+
+    # only send requested columns back to the parent process
+    from columnflow.columnar_util import RouteFilter
+    route_filter = RouteFilter(output_columns)
+
+    def func(events, **kwargs):
+        # selectors return events and their selection results
+        result = inst(events, **kwargs)
+        if isinstance(result, tuple):
+            return (route_filter(result[0]), *result[1:])
+        return route_filter(result)
+
+    return func
+
+
+def array_function_factory(
+    cls_name: str,
+    kind: str,
+    config_inst,
+    dataset_inst,
+    shift_inst=None,
+    setup_inputs: dict | None = None,
+    output_columns: Iterable[str] | None = None,
+) -> Callable[[], Callable]:
+    """
+    Returns a picklable factory that creates and sets up the calibrator, selector or producer
+    (*kind*) *cls_name* for *config_inst* and *dataset_inst* in a worker process. *setup_inputs*
+    are passed to its setup functions, e.g. the inputs of the task running the pool. When
+    *output_columns* are given, returned event arrays are reduced to them, e.g. to the produced
+    columns of a producer or the columns written by a selection.
+    """
+    return functools.partial(
+        _build_array_function,
+        cls_name,
+        kind,
+        config_inst.name,
+        dataset_inst.name,
+        shift_inst.name if shift_inst else "nominal",
+        setup_inputs,
+        sorted(map(str, output_columns)) if output_columns is not None else None,
+    )
@@ -0,0 +1,53 @@
+# coding: utf-8
+
+"""
+Row group metadata of parquet event files.
+
+Event files are written with bounded row groups and min/max statistics per row group and column
+(see ``parquet_row_group_size`` in the law config), which readers such as ``pyarrow.dataset`` use
+to skip row groups that cannot match a filter.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+
+def column_name(path_in_schema: str) -> str:
+    """
+    Converts a parquet column path as written by awkward, e.g. ``"Jet.list.item.pt"``, into a
+    column name like ``"Jet.pt"``.
+    """
+    return ".".join(p for p in path_in_schema.split(".") if p not in ("list", "item", "element"))
+
+
+def read_row_group_stats(
+    path: str,
+    columns: Iterable[str] | None = None,
+) -> list[tuple[int, dict[str, tuple[Any, Any]]]]:
+    """
+    Returns the number of rows and the min/max statistics per column for all row groups of the
+    parquet file at *path*, optionally restricted to *columns*. Columns without statistics are
+    omitted.
+    """
+    import pyarrow.parquet as pq
+
+    columns = None if columns is None else set(columns)
+    md = pq.ParquetFile(path).metadata
+
+    stats = []
+    for i in range(md.num_row_groups):
+        rg = md.row_group(i)
+        rg_stats = {}
+        for j in range(rg.num_columns):
+            col = rg.column(j)
+            name = column_name(col.path_in_schema)
+            if columns is not None and name not in columns:
+                continue
+            s = col.statistics
+            if s is None or not s.has_min_max:
+                continue
+            rg_stats[name] = (s.min, s.max)
+        stats.append((rg.num_rows, rg_stats))
+
+    return stats
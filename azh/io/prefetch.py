@@ -0,0 +1,281 @@
+# coding: utf-8
+
+"""
+Background prefetching of input files.
+
+Tasks reading remote NanoAOD files alternate between fetching a file and processing it. A
+:py:class:`Prefetcher` stages the next files into a local directory in a background thread while
+the current one is processed, keeping at most *n_ahead* staged files and, optionally, at most
+*max_bytes* on disk. Files are removed once the consumer moves on to the next one.
+
+Sources can be law file targets (fetched with ``copy_to_local``) or plain paths (copied), so a
+local directory can serve as a stand-in for the remote file system:
+
+.. code-block:: python
+
+    for src, path in Prefetcher(glob.glob("/data/nano/*.root"), "/tmp/stage", n_ahead=2):
+        process(path)
+
+Since workflow branches usually process a single file, a :py:class:`StageArea` additionally
+stages the files of the next branch while the current one is processed. Staged files are shared
+through a directory, so that they are found both when the next branch runs in the same process
+and when it runs in another process on the same node.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import hashlib
+import threading
+import queue
+from typing import Any, Callable, Iterable, Iterator
+
+import law
+
+
+logger = law.logger.get_logger(__name__)
+
+
+def fetch_source(source: Any, dst: str) -> None:
+    """
+    Fetches *source* to the local path *dst*. *source* is either a target providing
+    ``copy_to_local`` or a local path.
+    """
+    if hasattr(source, "copy_to_local"):
+        source.copy_to_local(dst)
+    else:
+        shutil.copyfile(str(source), dst)
+
+
+def source_basename(source: Any) -> str:
+    return os.path.basename(getattr(source, "path", None) or str(source))
+
+
+class Prefetcher(object):
+    """
+    Iterable over ``(source, local_path)`` pairs of *sources*, in order, whose files are staged
+    into *stage_dir* by a background thread via *fetch* (:py:func:`fetch_source` by default).
+
+    At most *n_ahead* files are staged (including the one currently being processed), and no new
+    fetch starts while the staged files exceed *max_bytes*. The file of the previous iteration is
+    deleted when the next one is requested, unless *cleanup* is *False*. Fetch errors are raised
+    by the iteration that would have returned the failed file, and partially fetched files are
+    always removed.
+    """
+
+    def __init__(
+        self,
+        sources: Iterable[Any],
+        stage_dir: str,
+        n_ahead: int = 2,
+        max_bytes: int | None = None,
+        fetch: Callable[[Any, str], None] | None = None,
+        cleanup: bool = True,
+    ) -> None:
+        super().__init__()
+
+        if n_ahead < 1:
+            raise ValueError(f"n_ahead must be positive, got {n_ahead}")
+
+        self.sources = sources
+        self.stage_dir = stage_dir
+        self.n_ahead = n_ahead
+        self.max_bytes = max_bytes
+        self.fetch = fetch or fetch_source
+        self.cleanup = cleanup
+
+        self._cond = threading.Condition()
+        self._n_staged = 0
+        self._staged_bytes = 0
+        self._stop = threading.Event()
+
+    def _wait_for_capacity(self) -> bool:
+        # block until another file may be staged, returns False when stopped
+        with self._cond:
+            while not self._stop.is_set() and (
+                self._n_staged >= self.n_ahead or
+                (self.max_bytes and self._n_staged > 0 and self._staged_bytes >= self.max_bytes)
+            ):
+                self._cond.wait(0.1)
+            if self._stop.is_set():
+                return False
+            self._n_staged += 1
+            return True
+
+    def _release(self, size: int) -> None:
+        with self._cond:
+            self._n_staged -= 1
+            self._staged_bytes -= size
+            self._cond.notify_all()
+
+    def _run(self, q: queue.Queue) -> None:
+        try:
+            for i, source in enumerate(self.sources):
+                if not self._wait_for_capacity():
+                    return
+                dst = os.path.join(self.stage_dir, f"{i}_{source_basename(source)}")
+                fetched = False
+                try:
+                    self.fetch(source, dst)
+                    size = os.path.getsize(dst)
+                    fetched = True
+                except BaseException as e:
+                    q.put((source, None, 0, e))
+                    return
+                finally:
+                    # remove partially fetched files
+                    if not fetched and os.path.exists(dst):
+                        os.remove(dst)
+                with self._cond:
+                    self._staged_bytes += size
+                logger.debug(f"staged {source_basename(source)} ({size / 1024**2:.1f} MB)")
+                q.put((source, dst, size, None))
+        except BaseException as e:
+            # errors while iterating sources
+            q.put((None, None, 0, e))
+            return
+        q.put(None)
+
+    def _remove(self, path: str, size: int) -> None:
+        if self.cleanup and os.path.exists(path):
+            os.remove(path)
+        self._release(size)
+
+    def __iter__(self) -> Iterator[tuple[Any, str]]:
+        os.makedirs(self.stage_dir, exist_ok=True)
+        self._stop.clear()
+
+        q = queue.Queue()
+        thread = threading.Thread(target=self._run, args=(q,), daemon=True)
+        thread.start()
+
+        prev = None
+        try:
+            while True:
+                # release the previous file first, the next one might be waiting for capacity
+                if prev is not None:
+                    self._remove(*prev)
+                    prev = None
+                item = q.get()
+                if item is None:
+                    break
+                source, path, size, error = item
+                if error is not None:
+                    raise error
+                prev = (path, size)
+                yield source, path
+        finally:
+            # stop the background thread and remove staged files that were not consumed
+            self._stop.set()
+            thread.join()
+            if prev is not None:
+                self._remove(*prev)
+            while not q.empty():
+                item = q.get()
+                if item is not None and item[1] is not None:
+                    self._remove(item[1], item[2])
+
+
+class StageArea(object):
+    """
+    Directory *stage_dir* of files fetched ahead of their use by :py:meth:`stage`, identified by
+    keys such as remote paths. Files are fetched via *fetch* (:py:func:`fetch_source` by default)
+    in a background thread into temporary files that are renamed once complete, so that consumers
+    only ever see complete files. No fetch starts while the directory holds *max_bytes* or more.
+
+    The thread is not a daemon, so a process finishes pending fetches before it exits and the
+    files remain available to other processes. A consumer in the same process :py:meth:`wait`s for
+    them, then :py:meth:`claim`s a staged file, which moves it out of reach of other consumers, and
+    removes it once done.
+    """
+
+    def __init__(
+        self,
+        stage_dir: str,
+        max_bytes: int | None = None,
+        fetch: Callable[[Any, str], None] | None = None,
+    ) -> None:
+        super().__init__()
+
+        self.stage_dir = stage_dir
+        self.max_bytes = max_bytes
+        self.fetch = fetch or fetch_source
+
+        self._thread: threading.Thread | None = None
+
+    def path(self, key: str) -> str:
+        """
+        Returns the path of the staged file of *key*.
+        """
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.stage_dir, f"{digest}_{os.path.basename(key)}")
+
+    def size(self) -> int:
+        """
+        Returns the total size of all files in the stage directory in bytes.
+        """
+        total = 0
+        for entry in os.scandir(self.stage_dir):
+            try:
+                total += entry.stat().st_size if entry.is_file() else 0
+            except FileNotFoundError:
+                # claimed or removed in the meantime
+                pass
+        return total
+
+    def _run(self, sources: Callable[[], Iterable[tuple[str, Any]]]) -> None:
+        try:
+            for key, source in sources():
+                dst = self.path(key)
+                if os.path.exists(dst):
+                    continue
+                if self.max_bytes and self.size() >= self.max_bytes:
+                    logger.debug(f"stage directory {self.stage_dir} is full, stop staging")
+                    return
+                tmp = f"{dst}.{os.getpid()}.part"
+                try:
+                    self.fetch(source, tmp)
+                    os.replace(tmp, dst)
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                logger.debug(f"staged {os.path.basename(key)} for later use")
+        except Exception as e:
+            # staging is optional, consumers fall back to their sources
+            logger.warning(f"staging files into {self.stage_dir} failed: {e}")
+
+    def stage(self, sources: Callable[[], Iterable[tuple[str, Any]]]) -> bool:
+        """
+        Starts fetching the ``(key, source)`` pairs returned by calling *sources* in a background
+        thread, which also resolves the pairs themselves. Returns *False* without staging when a
+        previous call is still fetching.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return False
+
+        os.makedirs(self.stage_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, args=(sources,))
+        self._thread.start()
+        return True
+
+    def wait(self) -> None:
+        """
+        Waits for fetches started in this process.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def claim(self, key: str) -> str | None:
+        """
+        Returns the path of the staged file of *key*, or *None* when it was not staged (yet). The
+        caller owns the returned file and must remove it.
+        """
+        dst = self.path(key)
+        claimed = f"{dst}.{os.getpid()}.claimed"
+        try:
+            os.rename(dst, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
@@ -0,0 +1,66 @@
+# coding: utf-8
+
+"""
+Deterministic, stratified event sampling at read level for fast and representative development
+runs.
+
+While a sampling fraction is active, chunked reading of nano files is restricted to the leading
+fraction of the entries of each file. Every file of a dataset contributes the same fraction of its
+events, and events that are not sampled are never read, decompressed or calibrated. Since all tasks
+reading nano files (calibration, selection and reduction) see the same capped number of entries,
+their outputs stay aligned. Selection stats only count events that were read, so normalization
+weights derived from them are scaled up by the inverse fraction without further treatment.
+"""
+
+from __future__ import annotations
+
+import math
+import contextlib
+from typing import Iterator
+
+
+# sampling fraction applied when opening nano files, set by tasks while they run
+_active_fraction: float | None = None
+
+
+def get_active_sampling() -> float | None:
+    return _active_fraction
+
+
+@contextlib.contextmanager
+def active_sampling(fraction: float | None) -> Iterator[float | None]:
+    """
+    Context manager that samples the given *fraction* of entries of all nano files opened within.
+    *None* or fractions of at least 1 disable the sampling.
+    """
+    global _active_fraction
+
+    if fraction is not None and fraction >= 1:
+        fraction = None
+
+    prev, _active_fraction = _active_fraction, fraction
+    try:
+        yield fraction
+    finally:
+        _active_fraction = prev
+
+
+def sampled_entries(n_entries: int, fraction: float | None) -> int:
+    """
+    Returns the number of leading entries out of *n_entries* to read for a sampling *fraction*.
+    At least one entry is kept of non-empty files, so that every file contributes to the stats.
+    """
+    if fraction is None or fraction >= 1 or n_entries <= 0:
+        return n_entries
+    return min(n_entries, max(int(math.ceil(n_entries * max(fraction, 0.0))), 1))
+
+
+def get_sampling_fraction(task) -> float | None:
+    """
+    Returns the sampling fraction configured for the dataset of *task* via
+    ``config_inst.x.event_sampling_fraction``. Data is never sampled, as its luminosity cannot be
+    rescaled accordingly.
+    """
+    if task.dataset_inst.is_data:
+        return None
+    return task.config_inst.x("event_sampling_fraction", None)
@@ -0,0 +1,253 @@
+# coding: utf-8
+
+"""
+Run-length encoded indices of selected events.
+
+The event mask of ``cf.SelectEvents`` is row-aligned with the input NanoAOD file, but applying it
+requires reading all entries. A :py:class:`SelectionIndex` stores the ``[start, stop)`` entry
+ranges of selected events instead, so that only the basket clusters overlapping these ranges are
+requested from the original file. With tight selections, most baskets are never read.
+
+``cf.ReduceEvents`` reads its inputs in fixed entry ranges that must stay row-aligned with the
+selection masks and calibration outputs. Within these ranges, :py:func:`read_selected_chunk`
+reads only clusters containing selected entries and expands the result back to the full range,
+with unselected entries repeating a selected one, which are then dropped by the event mask (see
+``patch_reduce_events_selection_index`` in :py:mod:`azh.columnflow_patches`).
+"""
+
+from __future__ import annotations
+
+import contextlib
+from typing import Any, Callable, Iterable, Iterator
+
+import law
+
+from columnflow.util import maybe_import
+
+from azh.util import mask_to_ranges
+
+np = maybe_import("numpy")
+ak = maybe_import("awkward")
+
+
+logger = law.logger.get_logger(__name__)
+
+
+def coalesce_ranges(
+    ranges: np.ndarray,
+    max_gap: int = 0,
+    offsets: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Merges consecutive ``[start, stop)`` *ranges* separated by at most *max_gap* entries, trading
+    a few unselected entries for fewer, larger reads. With entry *offsets* of basket clusters
+    (e.g. ``uproot.TTree.common_entry_offsets()``), *max_gap* is ignored and ranges are only kept
+    apart when at least one cluster in between contains none of their entries, since all other
+    entries in between are read as part of the same baskets anyway.
+    """
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    if len(ranges) < 2:
+        return ranges
+    if offsets is None:
+        gaps = ranges[1:, 0] - ranges[:-1, 1]
+        split = np.flatnonzero(gaps > max_gap) + 1
+    else:
+        offsets = np.asarray(offsets, dtype=np.int64)
+        first = np.searchsorted(offsets, ranges[:, 0], side="right") - 1
+        last = np.searchsorted(offsets, ranges[:, 1] - 1, side="right") - 1
+        split = np.flatnonzero(first[1:] > last[:-1] + 1) + 1
+    starts = ranges[np.concatenate([[0], split]), 0]
+    stops = ranges[np.concatenate([split - 1, [len(ranges) - 1]]), 1]
+    return np.stack([starts, stops], axis=1)
+
+
+def expand_indices(mask: np.ndarray, ranges: np.ndarray) -> np.ndarray:
+    """
+    Returns indices into the concatenated entries of the ``[start, stop)`` *ranges*, given
+    relative to the first entry of *mask*, that expand them to all entries of *mask*. Entries
+    selected by *mask*, which must be contained in *ranges*, map to their own position, all other
+    entries to the position of the first selected entry (or to 0 when there is none).
+    """
+    mask = np.asarray(mask, dtype=bool)
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    starts = ranges[:, 0]
+    concat_starts = np.concatenate([[0], np.cumsum(ranges[:, 1] - starts)[:-1]])
+
+    entries = np.arange(len(mask), dtype=np.int64)
+    r = np.maximum(np.searchsorted(starts, entries, side="right") - 1, 0)
+    pos = concat_starts[r] + entries - starts[r]
+
+    selected = np.flatnonzero(mask)
+    fill = pos[selected[0]] if len(selected) else 0
+    return np.where(mask, pos, fill)
+
+
+class SelectionIndex(object):
+    """
+    Selected entry *ranges* of shape ``(n_ranges, 2)`` of an input file with *n_entries* entries.
+    """
+
+    def __init__(self, ranges: np.ndarray, n_entries: int) -> None:
+        super().__init__()
+
+        self.ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+        self.n_entries = int(n_entries)
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray | ak.Array) -> SelectionIndex:
+        mask = np.asarray(mask, dtype=bool)
+        return cls(mask_to_ranges(mask), len(mask))
+
+    @property
+    def n_selected(self) -> int:
+        return int((self.ranges[:, 1] - self.ranges[:, 0]).sum())
+
+    def clip(self, entry_start: int, entry_stop: int) -> np.ndarray:
+        """
+        Returns the ranges overlapping ``[entry_start, entry_stop)``, clipped to it.
+        """
+        r = self.ranges
+        r = r[(r[:, 1] > entry_start) & (r[:, 0] < entry_stop)]
+        return np.clip(r, entry_start, entry_stop)
+
+    def mask(self, entry_start: int = 0, entry_stop: int | None = None) -> np.ndarray:
+        """
+        Returns the selection mask of the entries in ``[entry_start, entry_stop)``.
+        """
+        if entry_stop is None:
+            entry_stop = self.n_entries
+        n = max(entry_stop - entry_start, 0)
+        ranges = self.clip(entry_start, entry_stop) - entry_start
+        edges = np.zeros(n + 1, dtype=np.int64)
+        np.add.at(edges, ranges[:, 0], 1)
+        np.add.at(edges, ranges[:, 1], -1)
+        return np.cumsum(edges[:-1]) > 0
+
+    def entries(self) -> np.ndarray:
+        """
+        Returns the indices of all selected entries.
+        """
+        if not len(self.ranges):
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, stop) for start, stop in self.ranges])
+
+    def save(self, path: str) -> None:
+        np.savez(path, ranges=self.ranges, n_entries=np.int64(self.n_entries))
+
+    @classmethod
+    def load(cls, path: str) -> SelectionIndex:
+        with np.load(path) as f:
+            return cls(f["ranges"], int(f["n_entries"]))
+
+    def read(
+        self,
+        path: str,
+        columns: Iterable[str],
+        tree: str = "Events",
+        max_gap: int | None = None,
+    ) -> ak.Array:
+        """
+        Reads *columns* (e.g. ``"Jet.pt"`` or ``"Jet.*"``, mapped to nano branches ``"Jet_pt"``)
+        of the selected entries from the root file at *path*. Ranges whose entries share basket
+        clusters are read at once, or, with *max_gap*, ranges closer than *max_gap* entries, and
+        unselected entries in between are dropped again.
+        """
+        import uproot
+
+        filter_name = [c.replace(".", "_") for c in columns]
+
+        with uproot.open(path) as f:
+            t = f[tree]
+            if t.num_entries != self.n_entries:
+                raise ValueError(
+                    f"selection index of {self.n_entries} entries does not match {path} with "
+                    f"{t.num_entries} entries",
+                )
+
+            if max_gap is None:
+                offsets = t.common_entry_offsets(filter_name=filter_name)
+                ranges = coalesce_ranges(self.ranges, offsets=offsets)
+            else:
+                ranges = coalesce_ranges(self.ranges, max_gap)
+
+            if not len(ranges):
+                return t.arrays(filter_name=filter_name, entry_start=0, entry_stop=0)
+
+            chunks = []
+            for start, stop in ranges:
+                arr = t.arrays(filter_name=filter_name, entry_start=int(start), entry_stop=int(stop))
+                # remove unselected entries within coalesced ranges
+                keep = self.mask(start, stop)
+                chunks.append(arr if keep.all() else arr[keep])
+
+        logger.debug(
+            f"read {self.n_selected} of {self.n_entries} entries of {path} in {len(ranges)} ranges",
+        )
+
+        return chunks[0] if len(chunks) == 1 else ak.concatenate(chunks, axis=0)
+
+
+def read_selected_chunk(
+    read: Callable[[Any], ak.Array],
+    chunk_pos: Any,
+    index: SelectionIndex,
+    offsets: np.ndarray | None = None,
+) -> ak.Array:
+    """
+    Reads the entries of the chunk at *chunk_pos* (a ``ChunkedIOHandler.ChunkPosition``) via
+    ``read(chunk_pos)`` and returns an array with one row per entry, in which entries not selected
+    by *index* repeat the first selected entry of the chunk (or its first entry when there is
+    none). With entry *offsets* of basket clusters, only the clusters containing selected entries
+    are read, which requires *read* to accept positions of sub-ranges. Otherwise, the full chunk
+    is read, so that sources read either way stay row-aligned.
+    """
+    start, stop = chunk_pos.entry_start, chunk_pos.entry_stop
+    if stop <= start:
+        return read(chunk_pos)
+
+    mask = index.mask(start, stop)
+    if offsets is None:
+        ranges = np.array([[start, stop]], dtype=np.int64)
+    else:
+        ranges = coalesce_ranges(index.clip(start, stop), offsets=offsets)
+        if not len(ranges):
+            ranges = np.array([[start, start + 1]], dtype=np.int64)
+
+    if len(ranges) == 1 and ranges[0, 0] == start and ranges[0, 1] == stop:
+        arr = read(chunk_pos)
+        return arr if mask.all() else arr[expand_indices(mask, ranges - start)]
+
+    parts = [
+        read(chunk_pos._replace(entry_start=int(a), entry_stop=int(b)))
+        for a, b in ranges
+    ]
+    arr = parts[0] if len(parts) == 1 else ak.concatenate(parts, axis=0)
+    return arr[expand_indices(mask, ranges - start)]
+
+
+# index used by the patched chunk readers and the paths of sources to read as they are, set by
+# cf.ReduceEvents while it runs
+_active_index: tuple[SelectionIndex, set[str]] | None = None
+
+
+def get_active_selection_index() -> tuple[SelectionIndex, set[str]] | None:
+    return _active_index
+
+
+@contextlib.contextmanager
+def active_selection_index(
+    index: SelectionIndex | None,
+    skip_paths: Iterable[str] = (),
+) -> Iterator[SelectionIndex | None]:
+    """
+    Context manager that activates *index* for all chunks read within, except for the sources at
+    *skip_paths*, such as the selection results defining the event mask.
+    """
+    global _active_index
+
+    prev = _active_index
+    _active_index = None if index is None else (index, set(skip_paths))
+    try:
+        yield index
+    finally:
+        _active_index = prev
@@ -0,0 +1,234 @@
+# coding: utf-8
+
+"""
+Per-column storage policies for written event files.
+
+A policy maps column patterns to storage options, defined in the config next to the kept columns
+per task family, e.g.
+
+.. code-block:: python
+
+    cfg.x.column_storage = {
+        "cf.ReduceEvents": [
+            ("*.pdgId", {"dtype": "int8"}),
+            ("*.eta", {"dtype": "float16"}),
+            ("*weight*", {"dtype": "float32", "codec": "zstd", "level": 9}),
+        ],
+    }
+
+Supported options are ``dtype`` (cast at write time), ``mantissa_bits`` (float32 quantization by
+rounding the mantissa, which keeps the dtype but improves compression), ``codec`` and ``level``
+(per-column parquet compression). For each option, the first matching pattern is used. Columns
+cast to one of the narrow :py:attr:`upcast_dtypes` are marked with the
+:py:attr:`upcast_parameter`, which is stored in the awkward schema of written files, so that
+:py:func:`upcast` restores standard widths of exactly these columns at read time.
+"""
+
+from __future__ import annotations
+
+import contextlib
+from typing import Any, Iterator, Sequence
+
+import law
+import order as od
+
+from columnflow.util import maybe_import
+from columnflow.columnar_util import get_ak_routes, set_ak_column
+
+from azh.util import flat_jagged_view
+
+np = maybe_import("numpy")
+ak = maybe_import("awkward")
+
+
+logger = law.logger.get_logger(__name__)
+
+
+# narrow dtypes and the dtypes they are restored to at read time
+upcast_dtypes = {
+    "float16": "float32",
+    "int8": "int32",
+    "int16": "int32",
+    "uint8": "int32",
+    "uint16": "int32",
+}
+
+# awkward parameter marking columns narrowed by a policy, holding the dtype to restore
+upcast_parameter = "azh_upcast"
+
+
+def quantize_mantissa(values: np.ndarray, bits: int) -> np.ndarray:
+    """
+    Rounds float32 *values* to *bits* mantissa bits (out of 23), zeroing the remaining ones.
+    Non-finite values are passed through unchanged.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    drop = 23 - int(bits)
+    if drop <= 0:
+        return values
+    ints = values.view(np.uint32)
+    mask = np.uint32((0xFFFFFFFF << drop) & 0xFFFFFFFF)
+    quantized = ((ints + np.uint32(1 << (drop - 1))) & mask).view(np.float32)
+    # rounding can carry into the exponent of inf and nan, and large finite values rounded to
+    # inf are kept as well, so restore all non-finite inputs and overflows
+    return np.where(np.isfinite(values) & np.isfinite(quantized), quantized, values)
+
+
+def _map_values(column: ak.Array, func) -> ak.Array:
+    # apply func to the flat values of a flat or singly jagged column
+    if column.ndim == 1:
+        return ak.Array(func(np.asarray(column)))
+    values, wrap = flat_jagged_view(column)
+    return wrap(func(values))
+
+
+def _with_leaf_parameter(column: ak.Array, key: str, value: Any) -> ak.Array:
+    # set a parameter on the leaf values, since list nodes of nested columns belong to the parent
+    def set_parameter(layout, **kwargs):
+        if layout.is_numpy:
+            return layout.with_parameter(key, value)
+
+    return ak.transform(set_parameter, column)
+
+
+def _leaf_parameter(column: ak.Array, key: str) -> Any:
+    layout = ak.to_layout(column)
+    while not layout.is_numpy and hasattr(layout, "content"):
+        layout = layout.content
+    return layout.parameter(key) if layout.is_numpy else None
+
+
+class ColumnStoragePolicy(object):
+    """
+    Storage policy defined by a sequence of ``(pattern, options)`` *rules*.
+    """
+
+    def __init__(self, rules: Sequence[tuple[str, dict[str, Any]]]) -> None:
+        super().__init__()
+
+        self.rules = [(pattern, dict(options)) for pattern, options in rules]
+
+    @classmethod
+    def from_config(cls, config_inst: od.Config, task_family: str) -> ColumnStoragePolicy | None:
+        """
+        Returns the policy of *task_family* defined in ``column_storage`` of *config_inst*, or
+        *None* when not defined.
+        """
+        rules = config_inst.x("column_storage", {}).get(task_family)
+        return cls(rules) if rules else None
+
+    def lookup(self, column: str) -> dict[str, Any]:
+        """
+        Returns the options of *column*, taking each option from the first matching rule.
+        """
+        options = {}
+        for pattern, rule_options in self.rules:
+            if law.util.multi_match(column, pattern):
+                for key, value in rule_options.items():
+                    options.setdefault(key, value)
+        return options
+
+    def apply(self, events: ak.Array) -> ak.Array:
+        """
+        Casts and quantizes columns of *events* according to the policy.
+        """
+        for route in get_ak_routes(events):
+            options = self.lookup(route.column)
+            dtype = options.get("dtype")
+            bits = options.get("mantissa_bits")
+            if dtype is None and bits is None:
+                continue
+
+            values = route.apply(events)
+            if bits is not None:
+                values = _map_values(values, lambda v: quantize_mantissa(v, bits))
+            if dtype is not None:
+                values = ak.values_astype(values, dtype)
+                target = upcast_dtypes.get(np.dtype(dtype).name)
+                if target is not None:
+                    values = _with_leaf_parameter(values, upcast_parameter, target)
+            events = set_ak_column(events, route, values)
+
+        return events
+
+    def writer_kwargs(self, events: ak.Array) -> dict[str, Any]:
+        """
+        Returns per-column ``compression`` and ``compression_level`` arguments of
+        ``ak.to_parquet`` for *events*, or an empty dictionary when no codec is configured.
+        """
+        compression, levels = {}, {}
+        for route in get_ak_routes(events):
+            options = self.lookup(route.column)
+            if "codec" in options:
+                compression[route.column] = options["codec"]
+                if "level" in options:
+                    levels[route.column] = options["level"]
+
+        kwargs = {}
+        if compression:
+            kwargs["compression"] = compression
+        if levels:
+            kwargs["compression_level"] = levels
+        return kwargs
+
+    def parquet_writer_opts(self, schema) -> dict[str, Any]:
+        """
+        Returns per-column ``compression`` and ``compression_level`` arguments of
+        ``pyarrow.parquet.ParquetWriter`` for the columns of the parquet *schema*, e.g. to rewrite
+        files written with this policy, or an empty dictionary when no codec is configured.
+        """
+        from azh.io.parquet import column_name
+
+        compression, levels = {}, {}
+        for i in range(len(schema)):
+            path = schema.column(i).path
+            options = self.lookup(column_name(path))
+            if "codec" in options:
+                compression[path] = options["codec"]
+                if "level" in options:
+                    levels[path] = options["level"]
+
+        opts = {}
+        if compression:
+            opts["compression"] = compression
+        if levels:
+            opts["compression_level"] = levels
+        return opts
+
+
+# policy applied by the patched parquet writer, set by tasks while they run
+_active_policy: ColumnStoragePolicy | None = None
+
+
+def get_active_policy() -> ColumnStoragePolicy | None:
+    return _active_policy
+
+
+@contextlib.contextmanager
+def active_policy(policy: ColumnStoragePolicy | None) -> Iterator[ColumnStoragePolicy | None]:
+    """
+    Context manager that activates *policy* for all parquet files written within.
+    """
+    global _active_policy
+
+    prev, _active_policy = _active_policy, policy
+    try:
+        yield policy
+    finally:
+        _active_policy = prev
+
+
+def upcast(events: ak.Array) -> ak.Array:
+    """
+    Restores standard widths of columns that were narrowed by a :py:class:`ColumnStoragePolicy`,
+    identified by their :py:attr:`upcast_parameter`. Other columns are left unchanged, even if
+    they have a narrow dtype.
+    """
+    for route in get_ak_routes(events):
+        values = route.apply(events)
+        target = _leaf_parameter(values, upcast_parameter)
+        if target is not None:
+            values = _with_leaf_parameter(values, upcast_parameter, None)
+            events = set_ak_column(events, route, ak.values_astype(values, target))
+
+    return events
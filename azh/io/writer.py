@@ -0,0 +1,160 @@
+# coding: utf-8
+
+"""
+Background writing of chunk outputs.
+
+Chunked tasks serialize the outputs of each chunk before computing the next one. A
+:py:class:`BackgroundWriter` moves these writes into a worker thread, so that chunk N is written
+while chunk N+1 is being computed. The number of pending writes is bounded, so that submitting
+blocks (back-pressure) when serialization is slower than computation, and errors of failed writes
+are raised in the submitting thread at the next submission or when flushing.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import queue
+import threading
+from typing import Any, Callable, Iterator
+
+import law
+
+
+logger = law.logger.get_logger(__name__)
+
+
+class BackgroundWriter(object):
+    """
+    Executes write functions in a single worker thread, in order of submission, with at most
+    *max_pending* writes waiting. Use as a context manager to flush on exit.
+    """
+
+    def __init__(self, max_pending: int = 2, name: str = "") -> None:
+        super().__init__()
+
+        if max_pending < 1:
+            raise ValueError(f"max_pending must be positive, got {max_pending}")
+
+        self.max_pending = max_pending
+        self.name = name
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error: BaseException | None = None
+        self._thread: threading.Thread | None = None
+        self.n_written = 0
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                # skip remaining writes after an error
+                if self._error is None:
+                    func, args, kwargs = item
+                    func(*args, **kwargs)
+                    self.n_written += 1
+            except BaseException as e:
+                self._error = e
+                logger.error(f"background write{f' ({self.name})' if self.name else ''} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _raise(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._work, daemon=True)
+            self._thread.start()
+
+    def submit(self, func: Callable, *args, **kwargs) -> None:
+        """
+        Schedules ``func(*args, **kwargs)``, blocking while *max_pending* writes are waiting. Raises
+        the error of a previously failed write.
+        """
+        self._raise()
+        self.start()
+        self._queue.put((func, args, kwargs))
+
+    def flush(self) -> None:
+        """
+        Waits for all pending writes and raises the error of a failed write.
+        """
+        if self._thread is not None:
+            self._queue.join()
+        self._raise()
+
+    def close(self, flush: bool = True) -> None:
+        """
+        Stops the worker thread after pending writes are done (or skipped when *flush* is *False*)
+        and raises the error of a failed write when flushing.
+        """
+        if self._thread is None:
+            return
+        if not flush and self._error is None:
+            self._error = RuntimeError("background writer closed without flushing")
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if flush:
+            self._raise()
+        else:
+            self._error = None
+
+    def __enter__(self) -> BackgroundWriter:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # do not mask exceptions raised in the context
+        self.close(flush=exc_type is None)
+
+
+# writer used by the patched parquet writer, set by tasks while they run
+_active_writer: BackgroundWriter | None = None
+
+
+def get_active_writer() -> BackgroundWriter | None:
+    return _active_writer
+
+
+@contextlib.contextmanager
+def active_writer(writer: BackgroundWriter | None) -> Iterator[BackgroundWriter | None]:
+    """
+    Context manager that activates *writer* for all chunk outputs written within.
+    """
+    global _active_writer
+
+    prev, _active_writer = _active_writer, writer
+    try:
+        yield writer
+    finally:
+        _active_writer = prev
+
+
+def write(func: Callable, *args, **kwargs) -> Any:
+    """
+    Calls ``func(*args, **kwargs)`` through the active writer, or directly when none is active.
+    """
+    writer = get_active_writer()
+    if writer is None:
+        return func(*args, **kwargs)
+    writer.submit(func, *args, **kwargs)
+
+
+def with_background_writer(func: Callable, max_pending: int = 2, name: str = "") -> Callable:
+    """
+    Wraps *func* so that chunk outputs written within are written by an active
+    :py:class:`BackgroundWriter`, which is flushed and closed before the wrapper returns. Errors of
+    failed writes are raised by the wrapper, so decorators around it only ever see complete outputs.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with BackgroundWriter(max_pending=max_pending, name=name) as writer:
+            with active_writer(writer):
+                return func(*args, **kwargs)
+
+    return wrapper
@@ -6,6 +6,8 @@ Test model definition.
 
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
 import law
 import order as od
 
@@ -15,9 +17,10 @@ from columnflow.util import maybe_import, dev_sandbox
 from columnflow.columnar_util import Route, set_ak_column
 
 ak = maybe_import("awkward")
-tf = maybe_import("tensorflow")
 
-law.contrib.load("tensorflow")
+# tensorflow is imported only when a model is trained or opened
+if TYPE_CHECKING:
+    import tensorflow as tf
 
 
 class ExampleModel(MLModel):
@@ -58,6 +61,8 @@ class ExampleModel(MLModel):
         return task.target(f"mlmodel_f{task.branch}of{self.folds}", dir=True)
 
     def open_model(self, target: law.FileSystemDirectoryTarget) -> tf.keras.models.Model:
+        law.contrib.load("tensorflow")
+
         return target.load(formatter="tf_keras_model")
 
     def train(
@@ -66,6 +71,9 @@ class ExampleModel(MLModel):
         input: dict[str, list[dict[str, law.FileSystemFileTarget]]],
         output: law.FileSystemDirectoryTarget,
     ) -> None:
+        import tensorflow as tf
+        law.contrib.load("tensorflow")
+
         # define a dummy NN
         x = tf.keras.Input(shape=(2,))
         a1 = tf.keras.layers.Dense(10, activation="elu")(x)
@@ -0,0 +1,134 @@
+# coding: utf-8
+
+"""
+Fixed-width bitset representation of event categories.
+
+The variable-length ``category_ids`` column is encoded into ``category_bits``, a fixed number of
+uint64 words per event with one bit per category of the config. Per-category masks are then
+obtained with a single bitwise operation, and an inverted index (written per file by
+``azh.CategoryIndex``) maps each category to the contiguous event ranges it contains, so that
+per-category processing only touches those rows.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+import order as od
+
+from columnflow.production import Producer, producer
+from columnflow.util import maybe_import, InsertableDict
+from columnflow.columnar_util import set_ak_column
+
+from azh.util import mask_to_ranges
+
+np = maybe_import("numpy")
+ak = maybe_import("awkward")
+
+
+class CategoryBitset(object):
+    """
+    Mapping of category ids to bit positions for all categories (including nested ones) of a
+    config, ordered by id for a stable layout.
+    """
+
+    def __init__(self, category_ids: Iterable[int]) -> None:
+        super().__init__()
+
+        self.category_ids = np.array(sorted(set(category_ids)), dtype=np.int64)
+        self.n_words = max(1, (len(self.category_ids) + 63) // 64)
+
+    @classmethod
+    def from_config(cls, config_inst: od.Config) -> CategoryBitset:
+        return cls(c.id for c, _, _ in config_inst.walk_categories())
+
+    def bit(self, category_id: int) -> tuple[int, np.uint64]:
+        """
+        Returns the word index and the bit mask of *category_id*.
+        """
+        pos = int(np.searchsorted(self.category_ids, category_id))
+        if pos >= len(self.category_ids) or self.category_ids[pos] != category_id:
+            raise ValueError(f"unknown category id {category_id}")
+        return pos // 64, np.uint64(1) << np.uint64(pos % 64)
+
+    def encode(self, category_ids: ak.Array) -> np.ndarray:
+        """
+        Encodes jagged *category_ids* into an array of shape ``(n_events, n_words)``. Unknown ids
+        are ignored.
+        """
+        counts = np.asarray(ak.num(category_ids, axis=1))
+        flat_ids = np.asarray(ak.flatten(category_ids, axis=1), dtype=np.int64)
+        events = np.repeat(np.arange(len(counts)), counts)
+
+        pos = np.clip(np.searchsorted(self.category_ids, flat_ids), 0, len(self.category_ids) - 1)
+        known = self.category_ids[pos] == flat_ids
+        events, pos = events[known], pos[known]
+
+        bits = np.zeros((len(counts), self.n_words), dtype=np.uint64)
+        np.bitwise_or.at(bits, (events, pos // 64), np.uint64(1) << (pos % 64).astype(np.uint64))
+        return bits
+
+    def mask(self, bits: np.ndarray, category_id: int) -> np.ndarray:
+        """
+        Returns the event mask of *category_id* given encoded *bits*.
+        """
+        word, bit = self.bit(category_id)
+        return (np.asarray(bits)[:, word] & bit) != 0
+
+    def inverted_index(self, bits: np.ndarray) -> dict[int, np.ndarray]:
+        """
+        Returns a mapping of category ids to arrays of shape ``(n_ranges, 2)`` containing the
+        ``[start, stop)`` event ranges of that category. Categories without events are omitted.
+        """
+        index = {}
+        for category_id in self.category_ids.tolist():
+            mask = self.mask(bits, category_id)
+            if not mask.any():
+                continue
+            index[category_id] = mask_to_ranges(mask)
+        return index
+
+    @staticmethod
+    def save_inverted_index(path: str, index: dict[int, np.ndarray]) -> None:
+        np.savez(path, **{str(category_id): ranges for category_id, ranges in index.items()})
+
+    @staticmethod
+    def load_inverted_index(path: str) -> dict[int, np.ndarray]:
+        with np.load(path) as f:
+            return {int(key): f[key] for key in f.files}
+
+    @staticmethod
+    def take(events: ak.Array, ranges: np.ndarray) -> ak.Array:
+        """
+        Returns the rows of *events* within *ranges* (e.g. from :py:meth:`inverted_index`),
+        slicing contiguous blocks instead of applying a full boolean mask.
+        """
+        if not len(ranges):
+            return events[:0]
+        if len(ranges) == 1:
+            return events[int(ranges[0, 0]):int(ranges[0, 1])]
+        return ak.concatenate([events[int(start):int(stop)] for start, stop in ranges], axis=0)
+
+
+@producer(
+    uses={"category_ids"},
+    produces={"category_bits"},
+)
+def category_bits(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
+    """
+    Encodes ``category_ids`` into the fixed-width ``category_bits`` column.
+    """
+    bits = self.bitset.encode(events.category_ids)
+    events = set_ak_column(events, "category_bits", bits)
+
+    return events
+
+
+@category_bits.setup
+def category_bits_setup(
+    self: Producer,
+    reqs: dict,
+    inputs: dict,
+    reader_targets: InsertableDict,
+) -> None:
+    self.bitset = CategoryBitset.from_config(self.config_inst)
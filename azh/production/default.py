@@ -15,24 +15,23 @@ from azh.production.z_boson import z_boson
 from azh.production.prepare_objects import prepare_objects
 from azh.production.leptons import choose_lepton
 from azh.production.weights import event_weights
+from azh.production.categories import category_bits
 
 
 ak = maybe_import("awkward")
-coffea = maybe_import("coffea")
 np = maybe_import("numpy")
-maybe_import("coffea.nanoevents.methods.nanoaod")
 
 
 @producer(
     uses={
         category_ids, normalization_weights,
         event_weights, z_boson, choose_lepton,
-        prepare_objects,
+        prepare_objects, category_bits,
     },
     produces={
         category_ids, normalization_weights,
         event_weights, z_boson, choose_lepton,
-        prepare_objects,
+        prepare_objects, category_bits,
     },
 )
 def default(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
@@ -52,6 +51,8 @@ def default(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
     events = self[prepare_objects](events, **kwargs)
     events = self[z_boson](events, **kwargs)
 
+    # fixed-width category bitset
+    events = self[category_bits](events, **kwargs)
 
     # deterministoc seeds
     # events = self[category_ids](events, **kwargs)
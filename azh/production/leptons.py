@@ -4,13 +4,11 @@
 Column producers related to leptons.
 """
 from columnflow.production import Producer, producer
-from columnflow.util import maybe_import
+from columnflow.util import maybe_import, InsertableDict
 from columnflow.columnar_util import set_ak_column
 
 ak = maybe_import("awkward")
 np = maybe_import("numpy")
-coffea = maybe_import("coffea")
-maybe_import("coffea.nanoevents.methods.nanoaod")
 
 
 @producer(
@@ -67,4 +65,15 @@ def choose_lepton(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
     events = set_ak_column(events, "Leptons", leptons)
 
     print(events.Leptons)
-    return events
\ No newline at end of file
+    return events
+
+
+@choose_lepton.setup
+def choose_lepton_setup(
+    self: Producer,
+    reqs: dict,
+    inputs: dict,
+    reader_targets: InsertableDict,
+) -> None:
+    # register the nanoaod behaviors (e.g. PtEtaPhiMLorentzVector) only when the producer runs
+    import coffea.nanoevents.methods.nanoaod  # noqa
@@ -11,6 +11,8 @@ from columnflow.production.cms.btag import btag_weights
 from columnflow.util import maybe_import, safe_div, InsertableDict
 from columnflow.columnar_util import set_ak_column
 
+from azh.util import load_cached
+
 np = maybe_import("numpy")
 ak = maybe_import("awkward")
 
@@ -77,7 +79,7 @@ def normalized_btag_weights_requires(self: Producer, reqs: dict) -> None:
 @normalized_btag_weights.setup
 def normalized_btag_weights_setup(self: Producer, reqs: dict, inputs: dict, reader_targets: InsertableDict) -> None:
     # load the selection stats
-    stats = inputs["selection_stats"]["collection"][0]["stats"].load(formatter="json")
+    stats = load_cached(inputs["selection_stats"]["collection"][0]["stats"], formatter="json")
     print("stats", stats)
     # get the unique process ids in that dataset
     key = "sum_mc_weight_selected_no_bjet_per_process_and_njet"
@@ -12,6 +12,8 @@ from columnflow.production import Producer, producer
 from columnflow.util import maybe_import, safe_div, InsertableDict
 from columnflow.columnar_util import set_ak_column
 
+from azh.util import load_cached
+
 ak = maybe_import("awkward")
 np = maybe_import("numpy")
 
@@ -96,7 +98,7 @@ def normalized_weight_factory(
     @normalized_weight.setup
     def normalized_weight_setup(self: Producer, reqs: dict, inputs: dict, reader_targets: InsertableDict) -> None:
         # load the selection stats
-        stats = inputs["selection_stats"]["collection"][0]["stats"].load(formatter="json")
+        stats = load_cached(inputs["selection_stats"]["collection"][0]["stats"], formatter="json")
         print("stats:", stats)
         # get the unique process ids in that dataset
         key = "sum_mc_weight_per_process"
@@ -17,9 +17,7 @@ from columnflow.production.util import attach_coffea_behavior
 from azh.production.leptons import choose_lepton
 
 ak = maybe_import("awkward")
-coffea = maybe_import("coffea")
 np = maybe_import("numpy")
-maybe_import("coffea.nanoevents.methods.nanoaod")
 
 logger = law.logger.get_logger(__name__)
 
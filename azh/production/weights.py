@@ -16,6 +16,7 @@ from columnflow.production.cms.btag import btag_weights
 from columnflow.production.cms.scale import murmuf_weights, murmuf_envelope_weights
 from columnflow.production.cms.pdf import pdf_weights
 from azh.production.normalized_weights import normalized_weight_factory
+from azh.config.routing import get_routing_index
 # from azh.production.normalized_btag import normalized_btag_weights
 
 np = maybe_import("numpy")
@@ -53,8 +54,7 @@ def event_weight_init(self: Producer) -> None:
     if not getattr(self, "dataset_inst", None):
         return
 
-    self.uses |= set(self.config_inst.x.event_weights.keys())
-    self.uses |= set(self.dataset_inst.x("event_weights", {}).keys())
+    self.uses |= get_routing_index(self.config_inst).weight_columns(self.dataset_inst)
 
 
 @producer(
@@ -6,11 +6,13 @@ from columnflow.columnar_util import set_ak_column
 from columnflow.selection import Selector, SelectionResult, selector
 from azh.util import masked_sorted_indices
 
+np = maybe_import("numpy")
 ak = maybe_import("awkward")
 
 
 @selector(
     uses={"Jet.pt", "Jet.eta", "Jet.phi", "Jet.jetId", "Jet.puId"},
+    produces={"n_jet"},
     exposed=True,
 )
 def jet_selection(
@@ -43,6 +45,9 @@ def jet_selection(
     jet_indices = masked_sorted_indices(jet_mask, events.Jet.pt)
     jet_sel = ak.fill_none(jet_sel, False)
     jet_mask = ak.fill_none(jet_mask, False)
+
+    # jet multiplicity, stored as a scalar column so that reduced files carry row group statistics
+    events = set_ak_column(events, "n_jet", ak.num(jet_indices, axis=1), value_type=np.int32)
     print("Jet Selection:", jet_sel)
     # build and return selection results plus new columns
     return events, SelectionResult(
@@ -3,3 +3,7 @@
 
 # provisioning imports
 import azh.tasks.base
+import azh.tasks.columns
+import azh.tasks.selection
+import azh.tasks.packed
+import azh.tasks.external
@@ -0,0 +1,142 @@
+# coding: utf-8
+
+"""
+Tasks providing alternative storage formats of produced columns.
+"""
+
+import luigi
+import law
+
+from columnflow.tasks.framework.base import Requirements, DatasetTask
+from columnflow.tasks.framework.mixins import CalibratorsMixin, SelectorStepsMixin, ProducerMixin
+from columnflow.tasks.framework.remote import RemoteWorkflow
+from columnflow.tasks.production import ProduceColumns
+from columnflow.util import dev_sandbox
+
+from azh.tasks.base import AZHTask
+
+
+class ProduceColumnsIPC(
+    AZHTask,
+    ProducerMixin,
+    SelectorStepsMixin,
+    CalibratorsMixin,
+    DatasetTask,
+    law.LocalWorkflow,
+    RemoteWorkflow,
+):
+    """
+    Converts the parquet outputs of ``cf.ProduceColumns`` into arrow ipc files that can be
+    memory-mapped on read with :py:func:`azh.io.arrow.ak_from_ipc`. Without compression, repeated
+    local reads avoid any decoding. The files are consumed by ``cf.CreateHistograms`` when
+    ``histograms_producer_ipc`` is set in the ``[analysis]`` section of the law config.
+    """
+
+    compression = luigi.ChoiceParameter(
+        default="none",
+        choices=("none", "lz4"),
+        description="compression codec of the ipc files, 'none' allows zero-copy reads; "
+        "default: none",
+    )
+
+    sandbox = dev_sandbox(law.config.get("analysis", "default_columnar_sandbox"))
+
+    # upstream requirements
+    reqs = Requirements(
+        RemoteWorkflow.reqs,
+        ProduceColumns=ProduceColumns,
+    )
+
+    def create_branch_map(self):
+        # same branches as the producing task
+        return self.reqs.ProduceColumns.req(self, branch=-1).get_branch_map()
+
+    def workflow_requires(self):
+        reqs = super().workflow_requires()
+        reqs["columns"] = self.reqs.ProduceColumns.req(self)
+        return reqs
+
+    def requires(self):
+        return {"columns": self.reqs.ProduceColumns.req(self)}
+
+    def output(self):
+        return {"columns": self.target(f"columns_{self.branch}.arrow")}
+
+    @law.decorator.log
+    @law.decorator.localize(input=True, output=True)
+    @law.decorator.safe_output
+    def run(self):
+        from azh.io.arrow import parquet_to_ipc
+
+        inp = self.input()["columns"]["columns"]
+        outp = self.output()["columns"]
+
+        outp.parent.touch()
+        n_rows = parquet_to_ipc(inp.abspath, outp.abspath, compression=self.compression)
+
+        self.publish_message(f"converted {n_rows} rows to ipc with compression '{self.compression}'")
+
+
+class CategoryIndex(
+    AZHTask,
+    ProducerMixin,
+    SelectorStepsMixin,
+    CalibratorsMixin,
+    DatasetTask,
+    law.LocalWorkflow,
+    RemoteWorkflow,
+):
+    """
+    Writes the inverted category index (see
+    :py:meth:`azh.production.categories.CategoryBitset.inverted_index`) of the ``category_bits``
+    column produced by ``cf.ProduceColumns``, i.e., the event ranges per category id, so that
+    per-category readers can slice only those rows via
+    :py:meth:`~azh.production.categories.CategoryBitset.take`.
+    """
+
+    sandbox = dev_sandbox(law.config.get("analysis", "default_columnar_sandbox"))
+
+    # upstream requirements
+    reqs = Requirements(
+        RemoteWorkflow.reqs,
+        ProduceColumns=ProduceColumns,
+    )
+
+    def create_branch_map(self):
+        # same branches as the producing task
+        return self.reqs.ProduceColumns.req(self, branch=-1).get_branch_map()
+
+    def workflow_requires(self):
+        reqs = super().workflow_requires()
+        reqs["columns"] = self.reqs.ProduceColumns.req(self)
+        return reqs
+
+    def requires(self):
+        return {"columns": self.reqs.ProduceColumns.req(self)}
+
+    def output(self):
+        return {"index": self.target(f"category_index_{self.branch}.npz")}
+
+    @law.decorator.log
+    @law.decorator.localize(input=True, output=True)
+    @law.decorator.safe_output
+    def run(self):
+        import awkward as ak
+        from azh.production.categories import CategoryBitset
+
+        inp = self.input()["columns"]["columns"]
+        bits = ak.to_numpy(ak.from_parquet(inp.abspath, columns=["category_bits"])["category_bits"])
+
+        bitset = CategoryBitset.from_config(self.config_inst)
+        if bits.shape[1:] != (bitset.n_words,):
+            raise ValueError(
+                f"category_bits of shape {bits.shape} do not match the {bitset.n_words} words of "
+                f"the {len(bitset.category_ids)} categories of config {self.config_inst.name}",
+            )
+        index = bitset.inverted_index(bits)
+
+        outp = self.output()["index"]
+        outp.parent.touch()
+        bitset.save_inverted_index(outp.abspath, index)
+
+        self.publish_message(f"indexed {len(bits)} events in {len(index)} categories")
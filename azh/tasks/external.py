@@ -0,0 +1,83 @@
+# coding: utf-8
+
+"""
+Tasks managing external files.
+"""
+
+import luigi
+import law
+
+from columnflow.tasks.framework.base import ConfigTask
+
+from azh.tasks.base import AZHTask
+
+
+class MirrorExternalFiles(AZHTask, ConfigTask):
+    """
+    Copies all external files of the config into the local mirror configured via
+    ``external_files_mirror`` in the law config, see :py:class:`azh.io.mirror.ExternalFilesMirror`.
+    Sources are fetched in parallel, and the content of already mirrored entries is verified to be
+    unchanged with *refresh*, which also reruns the task when its output exists. With *offline*,
+    nothing is fetched and the task fails when entries are missing, e.g. to check that jobs can run
+    without access to the sources.
+    """
+
+    n_workers = luigi.IntParameter(
+        default=8,
+        significant=False,
+        description="number of parallel fetches; default: 8",
+    )
+    refresh = luigi.BoolParameter(
+        default=False,
+        significant=False,
+        description="fetch all sources again and verify their content; default: False",
+    )
+    offline = luigi.BoolParameter(
+        default=False,
+        significant=False,
+        description="do not fetch anything but fail when entries are not mirrored; default: False",
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # whether the task ran in this process, only relevant with refresh
+        self._refreshed = False
+
+    def complete(self):
+        # the output location does not depend on refresh, so bypass existing outputs until the
+        # task ran
+        if self.refresh and not self._refreshed:
+            return False
+        return super().complete()
+
+    def output(self):
+        return self.target("mirrored.json")
+
+    @law.decorator.log
+    @law.decorator.safe_output
+    def run(self):
+        from azh.io.mirror import get_mirror, iter_external_files
+
+        mirror = get_mirror()
+        if mirror is None:
+            raise Exception("no external_files_mirror configured in the [analysis] section")
+
+        external_files = self.config_inst.x.external_files
+
+        errors = mirror.sync(
+            external_files,
+            n_workers=self.n_workers,
+            offline=self.offline,
+            refresh=self.refresh,
+        )
+        if errors:
+            msg = "\n".join(f"  {key}: {err}" for key, err in sorted(errors.items()))
+            raise Exception(f"{len(errors)} external files could not be mirrored:\n{msg}")
+
+        self.output().dump({
+            ".".join(key): mirror.resolve(src, version)
+            for key, (src, version) in iter_external_files(external_files)
+        }, indent=4, formatter="json")
+
+        self._refreshed = True
@@ -0,0 +1,118 @@
+# coding: utf-8
+
+"""
+Tasks running several branches of other workflows in one process.
+"""
+
+import types
+
+import luigi
+import law
+
+from columnflow.tasks.framework.base import ConfigTask
+from columnflow.tasks.framework.remote import RemoteWorkflow
+from columnflow.util import dev_sandbox
+
+from azh.tasks.base import AZHTask
+
+
+class PackedBranches(
+    AZHTask,
+    ConfigTask,
+    law.LocalWorkflow,
+    RemoteWorkflow,
+):
+    """
+    Runs branches of the workflow *packed_task* for all datasets matching *datasets* in packs of
+    *pack_size* branches. The pack task itself runs in the sandbox of the packed tasks and calls
+    their ``run`` methods in sequence in its own process, so that configs, imported modules,
+    coffea behaviors and setup loads cached per process (e.g. via :py:func:`azh.util.load_cached`)
+    are reused between them, while outputs are still written per branch by the packed tasks. This
+    amortizes the setup of small datasets such as the high HT bins of ``dy_lep_m50_ht*``.
+
+    Requirements of all packed branches are requirements of the pack. Packed tasks must use the
+    same sandbox as the pack and must not yield dynamic dependencies.
+    """
+
+    packed_task = luigi.Parameter(
+        default="cf.ProduceColumns",
+        description="family of the workflow whose branches are packed; default: cf.ProduceColumns",
+    )
+    datasets = law.CSVParameter(
+        default=("dy_lep_m50_ht*",),
+        description="names or patterns of datasets whose branches are packed; "
+        "default: dy_lep_m50_ht*",
+    )
+    pack_size = luigi.IntParameter(
+        default=10,
+        description="number of branches handled in sequence per pack; default: 10",
+    )
+
+    sandbox = dev_sandbox(law.config.get("analysis", "default_columnar_sandbox"))
+
+    def get_task_cls(self):
+        return luigi.task_register.Register.get_task_cls(self.packed_task)
+
+    def get_dataset_names(self):
+        return [
+            dataset_inst.name
+            for dataset_inst in self.config_inst.datasets
+            if law.util.multi_match(dataset_inst.name, self.datasets)
+        ]
+
+    def create_branch_map(self):
+        task_cls = self.get_task_cls()
+
+        # all (dataset, branch) pairs, packed into groups of pack_size
+        pairs = [
+            (dataset, branch)
+            for dataset in self.get_dataset_names()
+            for branch in task_cls.req(self, dataset=dataset, branch=-1).get_branch_map()
+        ]
+        return dict(enumerate(
+            pairs[i:i + self.pack_size]
+            for i in range(0, len(pairs), self.pack_size)
+        ))
+
+    def get_packed_tasks(self):
+        task_cls = self.get_task_cls()
+        return [
+            task_cls.req(self, dataset=dataset, branch=branch)
+            for dataset, branch in self.branch_data
+        ]
+
+    def workflow_requires(self):
+        reqs = super().workflow_requires()
+        task_cls = self.get_task_cls()
+        reqs["packed"] = [
+            task_cls.req(self, dataset=dataset, branch=-1).workflow_requires()
+            for dataset in self.get_dataset_names()
+        ]
+        return reqs
+
+    def requires(self):
+        return [task.requires() for task in self.get_packed_tasks()]
+
+    def output(self):
+        return self.target(f"pack_{self.branch}.json")
+
+    @law.decorator.log
+    def run(self):
+        # run all incomplete branches of the pack in this process
+        for task in self.get_packed_tasks():
+            if task.complete():
+                continue
+            if task.sandbox != self.sandbox:
+                raise Exception(
+                    f"{task.task_family} uses sandbox {task.sandbox}, but {self.task_family} "
+                    f"runs in {self.sandbox}",
+                )
+            self.publish_message(f"running {task.repr()}")
+            if isinstance(task.run(), types.GeneratorType):
+                raise Exception(f"{task.task_family} yields dynamic dependencies, cannot pack it")
+
+        self.output().dump(
+            [{"dataset": dataset, "branch": branch} for dataset, branch in self.branch_data],
+            formatter="json",
+            indent=4,
+        )
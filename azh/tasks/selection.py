@@ -0,0 +1,74 @@
+# coding: utf-8
+
+"""
+Tasks deriving additional outputs from the event selection.
+"""
+
+import law
+
+from columnflow.tasks.framework.base import Requirements, DatasetTask
+from columnflow.tasks.framework.mixins import CalibratorsMixin, SelectorMixin
+from columnflow.tasks.framework.remote import RemoteWorkflow
+from columnflow.tasks.selection import SelectEvents
+from columnflow.util import dev_sandbox
+
+from azh.tasks.base import AZHTask
+
+
+class SelectionIndex(
+    AZHTask,
+    SelectorMixin,
+    CalibratorsMixin,
+    DatasetTask,
+    law.LocalWorkflow,
+    RemoteWorkflow,
+):
+    """
+    Writes run-length encoded ranges of selected entries per input file next to the event masks
+    of ``cf.SelectEvents``, see :py:class:`azh.io.selection_index.SelectionIndex`, for studies
+    re-reading selected events from NanoAOD files. ``cf.ReduceEvents`` does not require it, but
+    builds the same index from the event mask while it runs.
+    """
+
+    sandbox = dev_sandbox(law.config.get("analysis", "default_columnar_sandbox"))
+
+    # upstream requirements
+    reqs = Requirements(
+        RemoteWorkflow.reqs,
+        SelectEvents=SelectEvents,
+    )
+
+    def create_branch_map(self):
+        # same branches as the selection
+        return self.reqs.SelectEvents.req(self, branch=-1).get_branch_map()
+
+    def workflow_requires(self):
+        reqs = super().workflow_requires()
+        reqs["selection"] = self.reqs.SelectEvents.req(self)
+        return reqs
+
+    def requires(self):
+        return {"selection": self.reqs.SelectEvents.req(self)}
+
+    def output(self):
+        return {"index": self.target(f"index_{self.branch}.npz")}
+
+    @law.decorator.log
+    @law.decorator.localize(input=True, output=True)
+    @law.decorator.safe_output
+    def run(self):
+        import awkward as ak
+        from azh.io.selection_index import SelectionIndex as Index
+
+        results = self.input()["selection"]["results"]
+        mask = ak.from_parquet(results.abspath, columns=["event"])["event"]
+        index = Index.from_mask(mask)
+
+        outp = self.output()["index"]
+        outp.parent.touch()
+        index.save(outp.abspath)
+
+        self.publish_message(
+            f"selected {index.n_selected} of {index.n_entries} entries in "
+            f"{len(index.ranges)} ranges",
+        )
@@ -1,9 +1,13 @@
 # coding: utf-8
 
+from __future__ import annotations
+
 from columnflow.util import maybe_import
 from functools import wraps
 from typing import Hashable, Iterable, Callable
+import copy
 import law
+import order as od
 
 ak = maybe_import("awkward")
 np = maybe_import("numpy")
@@ -16,6 +20,97 @@ def masked_sorted_indices(mask: ak.Array, sort_var: ak.Array, ascending: bool =
     indices = ak.argsort(sort_var, axis=-1, ascending=ascending)
     return indices[mask[indices]]
 
+
+def mask_to_ranges(mask: np.ndarray) -> np.ndarray:
+    """
+    Run-length encodes a boolean *mask* into an array of shape ``(n_ranges, 2)`` containing the
+    ``[start, stop)`` ranges of consecutive *True* values.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], mask, [False]]).astype(np.int8)))
+    return edges.reshape(-1, 2).astype(np.int64)
+
+
+def flat_jagged_view(
+    column: ak.Array,
+    protect: Iterable[ak.Array] | None = None,
+    force_copy: bool = False,
+) -> tuple[np.ndarray, Callable[[np.ndarray | None], ak.Array]]:
+    """
+    Helper to obtain the flat content of a singly jagged *column* as a writable numpy view on its
+    buffer, together with a function that re-wraps a flat array with the original offsets of
+    *column* without copying.
+
+    The buffer is copied only when writing to it would be unsafe (copy-on-write), i.e., when it is
+    read-only, when it shares memory with any of the arrays in *protect*, or when the column is not
+    stored contiguously (e.g. after masking or slicing). Columns owned by someone else, such as
+    columns read from the input files, should be copied once with *force_copy*. Example:
+
+    .. code-block:: python
+
+        pt, wrap = flat_jagged_view(events.Jet.pt, force_copy=True)
+        pt[pt < 30] *= 1.1
+        events = set_ak_column(events, "Jet.pt", wrap())
+    """
+    layout = ak.to_layout(column)
+    if isinstance(layout, ak.contents.ListArray):
+        layout = layout.to_ListOffsetArray64(False)
+    if not isinstance(layout, ak.contents.ListOffsetArray):
+        raise ValueError(f"column must be singly jagged, got layout {layout.__class__.__name__}")
+
+    # non-contiguous contents need to be packed first, which implies a copy
+    if not isinstance(layout.content, ak.contents.NumpyArray):
+        layout = ak.to_layout(ak.to_packed(column))
+
+    offsets = np.asarray(layout.offsets.data).astype(np.int64, copy=False)
+    start, stop = int(offsets[0]), int(offsets[-1])
+    values = np.asarray(layout.content.data)[start:stop]
+
+    # copy on write
+    protected = [np.asarray(ak.flatten(a, axis=None)) for a in (protect or [])]
+    if (
+        force_copy or
+        not values.flags.writeable or
+        any(np.may_share_memory(values, p) for p in protected)
+    ):
+        values = values.copy()
+
+    offsets = offsets - start if start else offsets
+    parameters = layout.parameters
+    behavior = column.behavior
+
+    def wrap(flat: np.ndarray | None = None) -> ak.Array:
+        flat = values if flat is None else flat
+        if len(flat) != stop - start:
+            raise ValueError(f"expected flat array of length {stop - start}, got {len(flat)}")
+        return ak.Array(
+            ak.contents.ListOffsetArray(
+                ak.index.Index64(offsets),
+                ak.contents.NumpyArray(flat),
+                parameters=parameters,
+            ),
+            behavior=behavior,
+        )
+
+    return values, wrap
+
+
+# process-wide cache of loaded targets, see load_cached
+_target_cache: dict[tuple[str, str], object] = {}
+
+
+def load_cached(target: law.FileSystemTarget, formatter: str = "json") -> object:
+    """
+    Loads *target* with *formatter* once per process and returns the cached content afterwards,
+    so that tasks running several branches in one process (e.g. packed via azh.PackedBranches)
+    do not repeat setup loads. The content is shared and must not be modified.
+    """
+    key = (target.uri() if callable(getattr(target, "uri", None)) else target.path, formatter)
+    if key not in _target_cache:
+        _target_cache[key] = target.load(formatter=formatter)
+    return _target_cache[key]
+
+
 def call_once_on_config(include_hash=False):
     """
     Parametrized decorator to ensure that function *func* is only called once for the config *config*
@@ -35,6 +130,59 @@ def call_once_on_config(include_hash=False):
         return inner
     return outer
 
+
+def copy_campaign_subset(campaign: od.Campaign, dataset_names: Iterable[str]) -> od.Campaign:
+    """
+    Creates a copy of *campaign* that only contains copies of the datasets named *dataset_names*
+    and of the process trees they refer to, starting at their root processes. As opposed to
+    *campaign.copy()*, which copies all datasets and processes linked to the campaign, this keeps
+    memory and build time of configs proportional to the datasets actually used. All other fields
+    copied by *campaign.copy()* (labels, tags, aux data and dataset infos) are kept.
+    """
+    datasets = [campaign.get_dataset(name) for name in dataset_names]
+
+    # copy each root process (including its full subtree) of all dataset processes once
+    root_processes = {}
+    for dataset in datasets:
+        for process in dataset.processes:
+            for root in (process.get_root_processes() or [process]):
+                if root.name not in root_processes:
+                    root_processes[root.name] = root.copy()
+
+    # lookup of copied processes by name
+    processes = {
+        process.name: process
+        for root in root_processes.values()
+        for process, _, _ in root.walk_processes(include_self=True)
+    }
+
+    # create the campaign and add dataset copies linked to the copied processes
+    campaign_copy = od.Campaign(
+        name=campaign.name,
+        id=campaign.id,
+        ecm=campaign.ecm,
+        bx=campaign.bx,
+        label=campaign.label,
+        label_short=campaign.label_short,
+        tags=set(campaign.tags),
+        aux=copy.deepcopy(dict(campaign.aux)),
+    )
+    for dataset in datasets:
+        campaign_copy.add_dataset(
+            name=dataset.name,
+            id=dataset.id,
+            processes=[processes[process.name] for process in dataset.processes],
+            info={key: copy.deepcopy(info) for key, info in dataset.info.items()},
+            label=dataset.label,
+            label_short=dataset.label_short,
+            is_data=dataset.is_data,
+            tags=set(dataset.tags),
+            aux=copy.deepcopy(dict(dataset.aux)),
+        )
+
+    return campaign_copy
+
+
 # def four_vec(
 #     collections: str | Iterable[str],
 #     columns: str | Iterable[str] | None = None,
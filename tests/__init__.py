@@ -15,4 +15,21 @@ sys.path.append(base)
 import azh  # noqa
 
 # import all tests
-# ...
+from .test_routing import *
+from .test_sampling import *
+from .test_variables import *
+from .test_fill import *
+from .test_weights import *
+from .test_categories import *
+from .test_chunking import *
+from .test_parquet import *
+from .test_arrow import *
+from .test_storage import *
+from .test_prefetch import *
+from .test_writer import *
+from .test_merge import *
+from .test_selection_index import *
+from .test_parallel import *
+from .test_dask_backend import *
+from .test_corrections import *
+from .test_mirror import *
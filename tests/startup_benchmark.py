@@ -0,0 +1,173 @@
+# coding: utf-8
+
+"""
+Startup benchmark that measures the time of "law index", the import time of all analysis modules
+registered in the law.cfg "*_modules" options and the instantiation time of common tasks, each in
+a fresh interpreter. Exits with a non-zero code when one of the measurements exceeds its budget.
+
+The benchmark requires the full software environment and its budgets depend on the machine, so it
+is not part of tests/run_all but run explicitly via tests/run_startup_benchmark.
+
+Usage:
+
+.. code-block:: bash
+
+    python tests/startup_benchmark.py [--module-budget 0.5] [--index-budget 30] [--task-budget 15]
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+
+base = os.path.normpath(os.path.join(os.path.abspath(__file__), "../.."))
+
+# options in the [analysis] section of law.cfg listing modules to import
+module_options = [
+    "calibration_modules", "selection_modules", "production_modules", "categorization_modules",
+    "ml_modules", "inference_modules",
+]
+
+# task families and parameters to instantiate, measured via "law run ... --print-deps 0"
+default_tasks = [
+    ("cf.SelectEvents", ["--version", "startup_benchmark"]),
+    ("cf.ProduceColumns", ["--version", "startup_benchmark"]),
+]
+
+# modules imported before each measurement so that only the incremental import time is measured
+baseline_imports = "import law, order, columnflow.util, columnflow.columnar_util"
+
+import_snippet = f"""
+import time
+{baseline_imports}
+t0 = time.perf_counter()
+import {{module}}
+print(time.perf_counter() - t0)
+"""
+
+
+def expand_modules(value: str) -> list[str]:
+    """
+    Splits a comma-separated list of modules in *value*, expanding brace groups such as
+    "azh.selection.{example,default}".
+    """
+    modules = []
+    for part in re.split(r",(?![^{]*\})", value):
+        part = part.strip()
+        m = re.match(r"^(.*?)\{([^}]*)\}(.*)$", part)
+        if m:
+            modules.extend(
+                mod
+                for choice in m.group(2).split(",")
+                for mod in expand_modules(m.group(1) + choice.strip() + m.group(3))
+            )
+        elif part:
+            modules.append(part)
+    return modules
+
+
+def get_analysis_modules(all_modules: bool = False) -> list[str]:
+    import law
+
+    modules = []
+    for option in module_options:
+        for module in expand_modules(law.config.get_expanded("analysis", option, "")):
+            if (all_modules or module.startswith("azh.")) and module not in modules:
+                modules.append(module)
+
+    return modules
+
+
+def run_timed(cmd: list[str]) -> float:
+    """
+    Runs *cmd* and returns its wall time in seconds, raising an exception on failure.
+    """
+    t0 = time.perf_counter()
+    p = subprocess.run(cmd, cwd=base, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    duration = time.perf_counter() - t0
+    if p.returncode != 0:
+        raise Exception(f"command '{' '.join(cmd)}' failed with code {p.returncode}:\n{p.stderr}")
+    return duration
+
+
+def run_python(snippet: str) -> float:
+    """
+    Runs *snippet* in a fresh interpreter and returns the last line of its output as a float.
+    """
+    p = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=base,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if p.returncode != 0:
+        raise Exception(f"snippet failed with code {p.returncode}:\n{p.stderr}")
+    return float(p.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument(
+        "--module-budget",
+        type=float,
+        default=0.5,
+        help="budget per module import in seconds",
+    )
+    parser.add_argument(
+        "--index-budget",
+        type=float,
+        default=30.0,
+        help="budget for 'law index' in seconds",
+    )
+    parser.add_argument(
+        "--task-budget",
+        type=float,
+        default=15.0,
+        help="budget per task instantiation in seconds",
+    )
+    parser.add_argument("--all-modules", action="store_true", help="also measure non-azh modules")
+    parser.add_argument("--skip-index", action="store_true", help="skip measuring 'law index'")
+    parser.add_argument(
+        "--skip-tasks",
+        action="store_true",
+        help="skip measuring task instantiation",
+    )
+    args = parser.parse_args()
+
+    results = []
+
+    # law index
+    if not args.skip_index:
+        results.append(("law index", run_timed(["law", "index", "--quiet"]), args.index_budget))
+
+    # module imports
+    for module in get_analysis_modules(all_modules=args.all_modules):
+        duration = run_python(import_snippet.format(module=module))
+        results.append((f"import {module}", duration, args.module_budget))
+
+    # task instantiation
+    if not args.skip_tasks:
+        for task_family, task_args in default_tasks:
+            cmd = ["law", "run", task_family, *task_args, "--print-deps", "0"]
+            results.append((f"instantiate {task_family}", run_timed(cmd), args.task_budget))
+
+    # report
+    failed = False
+    width = max(len(name) for name, _, _ in results)
+    for name, duration, budget in results:
+        exceeded = duration > budget
+        failed |= exceeded
+        flag = "EXCEEDED" if exceeded else "ok"
+        print(f"{name:<{width}}  {duration:7.3f}s  (budget {budget:.3f}s)  {flag}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+# coding: utf-8
+
+__all__ = ["ArrowIPCTest"]
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import awkward as ak
+
+from azh.io.arrow import ak_to_ipc, ak_from_ipc, parquet_to_ipc
+
+
+class ArrowIPCTest(unittest.TestCase):
+
+    def setUp(self):
+        self.events = ak.Array({
+            "event": np.arange(50, dtype=np.uint64),
+            "Jet": ak.zip({
+                "pt": ak.unflatten(np.linspace(20.0, 200.0, 100), np.full(50, 2)),
+                "eta": ak.unflatten(np.linspace(-2.0, 2.0, 100), np.full(50, 2)),
+            }),
+        })
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for compression in ["none", "lz4"]:
+                path = os.path.join(tmp, f"events_{compression}.arrow")
+                ak_to_ipc(self.events, path, compression=compression)
+
+                events = ak_from_ipc(path)
+                self.assertEqual(events.tolist(), self.events.tolist())
+
+                # restricted to nested columns
+                events = ak_from_ipc(path, columns=["Jet.pt"])
+                self.assertEqual(events.fields, ["Jet"])
+                self.assertEqual(events.Jet.fields, ["pt"])
+                self.assertEqual(events.Jet.pt.tolist(), self.events.Jet.pt.tolist())
+
+            with self.assertRaises(ValueError):
+                ak_to_ipc(self.events, os.path.join(tmp, "events.arrow"), compression="zstd")
+
+    def test_from_parquet(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "events.parquet")
+            dst = os.path.join(tmp, "events.arrow")
+            ak.to_parquet(self.events, src, row_group_size=20)
+
+            self.assertEqual(parquet_to_ipc(src, dst), 50)
+            self.assertEqual(ak_from_ipc(dst).tolist(), self.events.tolist())
@@ -0,0 +1,63 @@
+# coding: utf-8
+
+__all__ = ["CategoryBitsetTest"]
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import awkward as ak
+
+from azh.production.categories import CategoryBitset
+
+
+class CategoryBitsetTest(unittest.TestCase):
+
+    def setUp(self):
+        # more than 64 categories to cover multiple words
+        self.bitset = CategoryBitset([1, 2, 3, 100] + list(range(1000, 1070)))
+        self.category_ids = ak.Array([[1, 100], [], [2, 1069, 1000], [1, 1], [999], [1, 3]])
+
+    def test_encode(self):
+        bits = self.bitset.encode(self.category_ids)
+
+        self.assertEqual(self.bitset.n_words, 2)
+        self.assertEqual(bits.shape, (6, 2))
+        self.assertEqual(bits.dtype, np.uint64)
+
+        # masks agree with the ids, unknown ids are ignored
+        for category_id in self.bitset.category_ids.tolist():
+            expected = [category_id in ids for ids in self.category_ids.tolist()]
+            np.testing.assert_array_equal(self.bitset.mask(bits, category_id), expected)
+
+        with self.assertRaises(ValueError):
+            self.bitset.mask(bits, 999)
+
+    def test_inverted_index(self):
+        bits = self.bitset.encode(self.category_ids)
+        index = self.bitset.inverted_index(bits)
+
+        np.testing.assert_array_equal(index[1], [[0, 1], [3, 4], [5, 6]])
+        np.testing.assert_array_equal(index[2], [[2, 3]])
+        self.assertNotIn(1001, index)
+
+        # save and load round trip
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.npz")
+            self.bitset.save_inverted_index(path, index)
+            loaded = self.bitset.load_inverted_index(path)
+        self.assertEqual(set(loaded), set(index))
+        for category_id, ranges in index.items():
+            np.testing.assert_array_equal(loaded[category_id], ranges)
+
+    def test_take(self):
+        events = ak.Array({"x": np.arange(10)})
+
+        empty = np.zeros((0, 2), dtype=np.int64)
+        self.assertEqual(CategoryBitset.take(events, empty).x.tolist(), [])
+        self.assertEqual(CategoryBitset.take(events, np.array([[2, 5]])).x.tolist(), [2, 3, 4])
+        self.assertEqual(
+            CategoryBitset.take(events, np.array([[0, 1], [7, 9]])).x.tolist(),
+            [0, 7, 8],
+        )
@@ -0,0 +1,62 @@
+# coding: utf-8
+
+__all__ = ["AdaptiveChunkerTest"]
+
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+import numpy as np
+import awkward as ak
+
+from azh.io.chunking import AdaptiveChunker, iter_split_chunks
+
+
+ChunkPosition = namedtuple("ChunkPosition", ["index", "entry_start", "entry_stop", "max_chunk_size"])
+
+
+class AdaptiveChunkerTest(unittest.TestCase):
+
+    def make_chunker(self, rss):
+        # 10 bytes per event with a baseline rss of 100 bytes, the smoothing of 0 keeps the estimate
+        with mock.patch("azh.io.chunking.get_rss", return_value=rss[0]):
+            return AdaptiveChunker(
+                target_rss=1000,
+                bytes_per_event=10.0,
+                overhead=1.0,
+                smoothing=0.0,
+                min_size=1,
+                max_size=1000,
+            )
+
+    def test_next_size(self):
+        chunker = self.make_chunker([100])
+        self.assertEqual(chunker.size, 90)
+
+        self.assertEqual(chunker.next_size(rss=100), 90)
+        self.assertEqual(chunker.next_size(rss=700), 30)
+        self.assertEqual(chunker.next_size(rss=2000), 1)
+
+        with mock.patch("azh.io.chunking.get_rss", return_value=550):
+            self.assertEqual(chunker.next_size(), 45)
+
+    def test_split_chunks(self):
+        chunker = self.make_chunker([100])
+        chunks = [
+            (ak.Array({"x": np.arange(0, 90)}), ChunkPosition(0, 0, 90, 90)),
+            (ak.Array({"x": np.arange(90, 120)}), ChunkPosition(1, 90, 120, 90)),
+        ]
+
+        # the rss is checked before each part is processed, and rises while processing the first
+        rss = iter([700, 700, 100, 100, 100])
+        with mock.patch("azh.io.chunking.get_rss", side_effect=lambda: next(rss, 100)):
+            parts = [(chunk.x.tolist(), pos) for chunk, pos in iter_split_chunks(chunks, chunker)]
+
+        positions = [pos for _, pos in parts]
+        self.assertEqual([pos.index for pos in positions], [0, 1, 2])
+        self.assertEqual(
+            [(pos.entry_start, pos.entry_stop) for pos in positions],
+            [(0, 30), (30, 90), (90, 120)],
+        )
+        self.assertEqual(sum((x for x, _ in parts), []), list(range(120)))
+        self.assertEqual(chunker.sizes, [30, 60, 30])
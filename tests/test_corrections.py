@@ -0,0 +1,76 @@
+# coding: utf-8
+
+__all__ = ["CorrectionSetCacheTest"]
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from azh.io import corrections
+
+
+class CorrectionSetCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.built = []
+        corrections.clear()
+
+        # stand-in for the compilation in correctionlib
+        def from_string(data):
+            self.built.append(data)
+            return json.loads(data)
+
+        patcher = mock.patch.object(corrections, "_orig_from_string", from_string)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        corrections.clear()
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with gzip.open(path, "wt") as f:
+            json.dump(content, f)
+        return path
+
+    def test_from_file(self):
+        path = self.write("sf.json.gz", {"name": "sf"})
+        cset = corrections.correction_set_from_file(path)
+        self.assertEqual(cset, {"name": "sf"})
+
+        # cached sets are neither read nor compiled again
+        with mock.patch("gzip.open", side_effect=AssertionError("file read")):
+            self.assertIs(corrections.correction_set_from_file(path), cset)
+        self.assertEqual(len(self.built), 1)
+
+    def test_file_changed(self):
+        path = self.write("sf.json.gz", {"name": "sf"})
+        corrections.correction_set_from_file(path)
+        self.write("sf.json.gz", {"name": "sf_v2"})
+        os.utime(path, ns=(0, 0))
+        self.assertEqual(corrections.correction_set_from_file(path), {"name": "sf_v2"})
+        self.assertEqual(len(self.built), 2)
+
+    def test_keyed_string(self):
+        path = self.write("sf.json.gz", {"name": "sf"})
+        with gzip.open(path, "rb") as f:
+            data = corrections._KeyedBytes(f.read())
+        data.cache_key = corrections.file_key(path)
+
+        # content tagged with its file key is not hashed and shares the set of the file
+        with mock.patch.object(corrections, "content_hash", side_effect=AssertionError("hashed")):
+            cset = corrections.correction_set_from_string(data.decode("utf-8"))
+        self.assertIs(corrections.correction_set_from_file(path), cset)
+        self.assertEqual(len(self.built), 1)
+
+    def test_untagged_string(self):
+        data = json.dumps({"name": "sf"})
+        cset = corrections.correction_set_from_string(data)
+        self.assertIs(corrections.correction_set_from_string(data.encode("utf-8")), cset)
+        self.assertEqual(corrections.cache_info()["size"], 1)
@@ -0,0 +1,71 @@
+# coding: utf-8
+
+__all__ = ["AssertIdenticalTest", "NanoBranchesTest"]
+
+import unittest
+
+import numpy as np
+import awkward as ak
+
+from azh.io.dask_backend import assert_identical, nano_branches
+
+
+class AssertIdenticalTest(unittest.TestCase):
+
+    def make_events(self, n=6):
+        counts = np.arange(n) % 3
+        return ak.Array({
+            "event": np.arange(n, dtype=np.int64),
+            "Jet": ak.zip({
+                "pt": ak.unflatten(np.linspace(20.0, 80.0, counts.sum()), counts),
+                "btag": ak.unflatten(np.arange(counts.sum()) % 2 == 0, counts),
+            }),
+        })
+
+    def test_identical(self):
+        events = self.make_events()
+        assert_identical(events, self.make_events())
+
+    def test_packing(self):
+        # views, e.g. of partitions of a larger array, are compared by content
+        events = self.make_events(12)
+        assert_identical(events[6:], ak.Array(events[6:].to_list()))
+        assert_identical(ak.concatenate([events[:4], events[4:]]), events)
+
+    def test_values(self):
+        events = self.make_events()
+        other = ak.with_field(events, events.Jet.pt + 1e-9, ["Jet", "pt"])
+        with self.assertRaises(AssertionError):
+            assert_identical(events, other)
+
+    def test_nan(self):
+        # nan values are compared bit for bit
+        a = ak.Array([1.0, np.nan])
+        assert_identical(a, ak.Array([1.0, np.nan]))
+
+    def test_lengths(self):
+        events = self.make_events()
+        with self.assertRaises(AssertionError):
+            assert_identical(events, events[:-1])
+
+    def test_types(self):
+        events = self.make_events()
+        other = ak.with_field(events, ak.values_astype(events.event, np.int32), "event")
+        with self.assertRaises(AssertionError):
+            assert_identical(events, other)
+
+    def test_structure(self):
+        # same flat content in different lists
+        a = ak.Array([[1, 2], [3]])
+        b = ak.Array([[1], [2, 3]])
+        with self.assertRaises(AssertionError):
+            assert_identical(a, b)
+
+
+class NanoBranchesTest(unittest.TestCase):
+
+    def test_branches(self):
+        self.assertEqual(
+            nano_branches(["event", "Jet.pt", "Muon.*"]),
+            ["Jet_pt", "Muon_*", "event", "nJet", "nMuon"],
+        )
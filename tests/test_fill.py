@@ -0,0 +1,78 @@
+# coding: utf-8
+
+__all__ = ["FillTest"]
+
+import unittest
+
+import numpy as np
+import awkward as ak
+import hist
+import order as od
+
+from azh.histogramming.fill import FillEngine, variable_axis, bin_indices
+
+
+class FillTest(unittest.TestCase):
+
+    def test_bin_indices(self):
+        rng = np.random.default_rng(42)
+        for binning in [(40, 0.0, 400.0), (7, -3.3, 2.1), (100, 0.1, 0.7)]:
+            variable_inst = od.Variable(name="x", id=1, expression="x", binning=binning)
+            axis = variable_axis(variable_inst)
+            edges = np.asarray(variable_inst.bin_edges)
+            values = np.concatenate([
+                rng.uniform(binning[1] - 1, binning[2] + 1, 10000),
+                edges,
+                np.nextafter(edges, -np.inf),
+                np.nextafter(edges, np.inf),
+                [np.nan, np.inf, -np.inf],
+            ])
+
+            # the arithmetic path for even binnings matches the lookup by the axis
+            np.testing.assert_array_equal(
+                bin_indices(values, axis, variable_inst),
+                np.asarray(axis.index(values)) + 1,
+            )
+
+    def test_fill(self):
+        variable_insts = [
+            od.Variable(name="pt", id=1, expression="pt", binning=(10, 0.0, 100.0)),
+            od.Variable(name="eta", id=2, expression="eta", binning=[-2.5, -1.0, 0.0, 1.0, 2.5]),
+        ]
+        values = {
+            "pt": np.array([5.0, 15.0, 150.0, 50.0]),
+            "eta": ak.Array([[0.5, -0.5], [], [2.0], [-3.0, 1.0]]),
+        }
+        category_ids = ak.Array([[1, 2], [1], [2], [3]])
+        process_ids = np.array([10, 10, 10, 11])
+        weights = np.array([1.0, 2.0, 3.0, 4.0])
+
+        engine = FillEngine(variable_insts, category_ids=[1, 2, 3])
+        engine.fill(values, category_ids, process_ids, weights)
+        hists = engine.to_hists()
+
+        # compare to filling a histogram per variable with one entry per object and category
+        for variable_inst in variable_insts:
+            vals = values[variable_inst.name]
+            if vals.ndim == 1:
+                vals = ak.singletons(vals)
+            fill_values, fill_cats, fill_procs, fill_weights = [], [], [], []
+            for event, cats in enumerate(category_ids.tolist()):
+                for val in vals[event].tolist():
+                    for cat in cats:
+                        fill_values.append(val)
+                        fill_cats.append(cat)
+                        fill_procs.append(process_ids[event])
+                        fill_weights.append(weights[event])
+
+            h = hists[variable_inst.name]
+            ref = hist.Hist(*h.axes, storage=hist.storage.Weight())
+            ref.fill(
+                category=fill_cats,
+                process=fill_procs,
+                shift=np.zeros(len(fill_values), dtype=int),
+                **{variable_inst.name: fill_values},
+                weight=fill_weights,
+            )
+            np.testing.assert_allclose(h.view(flow=True).value, ref.view(flow=True).value)
+            np.testing.assert_allclose(h.view(flow=True).variance, ref.view(flow=True).variance)
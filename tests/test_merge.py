@@ -0,0 +1,104 @@
+# coding: utf-8
+
+__all__ = ["StreamMergeParquetTest"]
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import awkward as ak
+
+from azh.io.merge import stream_merge_parquet
+
+
+class StreamMergeParquetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, start, stop, row_group_size=None, dtype=np.float64):
+        path = os.path.join(self.tmp, name)
+        events = ak.Array({
+            "event": np.arange(start, stop, dtype=np.int64),
+            "x": np.arange(start, stop).astype(dtype) * 0.5,
+        })
+        kwargs = {"row_group_size": row_group_size} if row_group_size else {}
+        ak.to_parquet(events, path, **kwargs)
+        return path
+
+    def row_group_sizes(self, path):
+        import pyarrow.parquet as pq
+
+        md = pq.ParquetFile(path).metadata
+        return [md.row_group(i).num_rows for i in range(md.num_row_groups)]
+
+    def test_content_and_order(self):
+        paths = [
+            self.write("a.parquet", 0, 25, row_group_size=10),
+            self.write("b.parquet", 25, 30),
+            self.write("c.parquet", 30, 47, row_group_size=8),
+        ]
+        dst = os.path.join(self.tmp, "merged.parquet")
+
+        n_rows = stream_merge_parquet(paths, dst)
+        self.assertEqual(n_rows, 47)
+
+        merged = ak.from_parquet(dst)
+        self.assertEqual(merged.event.tolist(), list(range(47)))
+        self.assertEqual(merged.x.tolist(), [0.5 * i for i in range(47)])
+
+        # without a row group size, row groups are copied as they are
+        self.assertEqual(self.row_group_sizes(dst), [10, 10, 5, 5, 8, 8, 1])
+
+    def test_coalesce_row_groups(self):
+        paths = [self.write(f"{i}.parquet", 5 * i, 5 * i + 5) for i in range(7)]
+        dst = os.path.join(self.tmp, "merged.parquet")
+
+        n_rows = stream_merge_parquet(paths, dst, row_group_size=12, max_buffered_row_groups=10)
+        self.assertEqual(n_rows, 35)
+        self.assertEqual(self.row_group_sizes(dst), [15, 15, 5])
+        self.assertEqual(ak.from_parquet(dst).event.tolist(), list(range(35)))
+
+    def test_max_buffered_row_groups(self):
+        paths = [self.write(f"{i}.parquet", 5 * i, 5 * i + 5) for i in range(7)]
+        dst = os.path.join(self.tmp, "merged.parquet")
+
+        stream_merge_parquet(paths, dst, row_group_size=100, max_buffered_row_groups=3)
+        self.assertEqual(self.row_group_sizes(dst), [15, 15, 5])
+
+    def test_empty_files(self):
+        paths = [
+            self.write("empty_0.parquet", 0, 0),
+            self.write("a.parquet", 0, 4),
+            self.write("empty_1.parquet", 4, 4),
+        ]
+        dst = os.path.join(self.tmp, "merged.parquet")
+        self.assertEqual(stream_merge_parquet(paths, dst, row_group_size=10), 4)
+        self.assertEqual(ak.from_parquet(dst).event.tolist(), list(range(4)))
+
+        # only empty files still result in a valid output with the same fields
+        dst = os.path.join(self.tmp, "merged_empty.parquet")
+        self.assertEqual(stream_merge_parquet([paths[0], paths[2]], dst), 0)
+        merged = ak.from_parquet(dst)
+        self.assertEqual(len(merged), 0)
+        self.assertEqual(sorted(merged.fields), ["event", "x"])
+
+    def test_schema_mismatch(self):
+        paths = [
+            self.write("a.parquet", 0, 4),
+            self.write("b.parquet", 4, 8, dtype=np.float32),
+        ]
+        with self.assertRaises(ValueError):
+            stream_merge_parquet(paths, os.path.join(self.tmp, "merged.parquet"))
+
+    def test_invalid_arguments(self):
+        dst = os.path.join(self.tmp, "merged.parquet")
+        with self.assertRaises(ValueError):
+            stream_merge_parquet([], dst)
+        with self.assertRaises(ValueError):
+            stream_merge_parquet([self.write("a.parquet", 0, 4)], dst, max_buffered_row_groups=0)
@@ -0,0 +1,100 @@
+# coding: utf-8
+
+__all__ = ["ExternalFilesMirrorTest"]
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from azh.io.mirror import ExternalFilesMirror, iter_external_files
+
+
+class ExternalFilesMirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "mirror")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def source(self, name, content):
+        path = os.path.join(self.tmp, "afs", name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def read(self, path):
+        with open(path, "r") as f:
+            return f.read()
+
+    def test_sync_resolve(self):
+        src = self.source("electron.json.gz", "electron")
+        mirror = ExternalFilesMirror(self.root)
+        self.assertEqual(mirror.sync({"electron_sf": (src, "v1")}), {})
+
+        local = mirror.resolve(src, "v1", verify=True)
+        self.assertEqual(os.path.basename(local), "electron.json.gz")
+        self.assertEqual(self.read(local), "electron")
+        self.assertIsNone(mirror.resolve(src, "v2"))
+
+        # changed content without a version change is an error
+        self.source("electron.json.gz", "changed")
+        errors = mirror.sync({"electron_sf": (src, "v1")}, refresh=True)
+        self.assertEqual(list(errors), [f"{src}@v1"])
+
+    def test_offline(self):
+        src = self.source("muon.json.gz", "muon")
+        errors = ExternalFilesMirror(self.root).sync({"muon_sf": (src, "v1")}, offline=True)
+        self.assertEqual(list(errors), [f"{src}@v1"])
+
+    def test_manifest_merge(self):
+        electron = self.source("electron.json.gz", "electron")
+        muon = self.source("muon.json.gz", "muon")
+
+        # two mirrors read the manifest before either of them syncs, as concurrent jobs would
+        first = ExternalFilesMirror(self.root)
+        second = ExternalFilesMirror(self.root)
+        self.assertEqual(first.manifest, {})
+        self.assertEqual(second.manifest, {})
+
+        self.assertEqual(first.sync({"electron_sf": (electron, "v1")}), {})
+        self.assertEqual(second.sync({"muon_sf": (muon, "v1")}), {})
+
+        # the second sync keeps the entry written by the first one
+        with open(os.path.join(self.root, "manifest.json"), "r") as f:
+            entries = json.load(f)["entries"]
+        self.assertEqual(sorted(entries), [f"{electron}@v1", f"{muon}@v1"])
+        self.assertEqual(sorted(second.manifest), sorted(entries))
+
+        reader = ExternalFilesMirror(self.root)
+        self.assertEqual(self.read(reader.resolve(electron, "v1")), "electron")
+        self.assertEqual(self.read(reader.resolve(muon, "v1")), "muon")
+
+    def test_rewrite(self):
+        electron = self.source("electron.json.gz", "electron")
+        lumi = self.source("lumi.json", "lumi")
+        missing = os.path.join(self.tmp, "afs", "missing.json")
+        external_files = {
+            "electron_sf": (electron, "v1"),
+            "lumi": {"golden": lumi, "missing": missing},
+        }
+
+        mirror = ExternalFilesMirror(self.root)
+        self.assertEqual(mirror.sync({"electron_sf": (electron, "v1"), "lumi": lumi}), {})
+        self.assertIsNotNone(mirror.resolve(lumi, ""))
+
+        rewritten = mirror.rewrite(external_files)
+        self.assertEqual(rewritten["electron_sf"], (mirror.resolve(electron, "v1"), "v1"))
+        self.assertEqual(rewritten["lumi"]["golden"], mirror.resolve(lumi, ""))
+        self.assertEqual(rewritten["lumi"]["missing"], missing)
+
+        # plain paths stay plain paths
+        self.assertEqual(
+            [entry for _, entry in iter_external_files(rewritten["lumi"])],
+            [(mirror.resolve(lumi, ""), ""), (missing, "")],
+        )
+        self.assertEqual(external_files["lumi"]["golden"], lumi)
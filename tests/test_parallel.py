@@ -0,0 +1,167 @@
+# coding: utf-8
+
+__all__ = ["MergeStatsTest", "ChunkPoolTest", "ChunkLookaheadTest"]
+
+import functools
+import unittest
+from collections import defaultdict, namedtuple
+
+import numpy as np
+import awkward as ak
+
+from azh.io.parallel import (
+    ChunkPool, ChunkLookahead, pooled_calls, merge_stats, share_array, attach_array,
+)
+
+
+ChunkPosition = namedtuple(
+    "ChunkPosition",
+    ["index", "entry_start", "entry_stop", "max_chunk_size"],
+)
+
+
+def scale_events(events, factor=2.0, stats=None):
+    # stand-in for a selector accumulating stats, or a producer when called without them
+    if stats is not None:
+        stats["num_events"] += len(events)
+        stats["sum_x"] += float(ak.sum(events.x))
+        per_process = stats.setdefault("per_process", defaultdict(float))
+        per_process[int(events.process_id[0])] += len(events)
+    return ak.with_field(events, events.x * factor, "y")
+
+
+def make_scale(factor):
+    return functools.partial(scale_events, factor=factor)
+
+
+def make_events(start, stop):
+    return ak.Array({
+        "x": np.arange(start, stop, dtype=np.float64),
+        "process_id": np.full(stop - start, start % 3, dtype=np.int64),
+    })
+
+
+class Selector(object):
+
+    def __call__(self, events, stats, **kwargs):
+        return scale_events(events, stats=stats)
+
+
+class MergeStatsTest(unittest.TestCase):
+
+    def test_merge(self):
+        stats = {"num_events": 3, "sum_mc_weight": 1.5, "per_process": {1: 2.0}}
+        update = {"num_events": 2, "per_process": {1: 1.0, 2: 4.0}, "num_events_selected": 1}
+        merged = merge_stats(stats, update)
+
+        self.assertIs(merged, stats)
+        self.assertEqual(stats, {
+            "num_events": 5,
+            "sum_mc_weight": 1.5,
+            "per_process": {1: 3.0, 2: 4.0},
+            "num_events_selected": 1,
+        })
+
+    def test_defaultdict(self):
+        stats = defaultdict(float)
+        for i in range(3):
+            merge_stats(stats, {"num_events": i, "nested": {"a": 1.0}})
+        self.assertEqual(stats["num_events"], 3)
+        self.assertEqual(stats["nested"], {"a": 3.0})
+
+
+class ChunkPoolTest(unittest.TestCase):
+
+    def test_share_attach(self):
+        events = make_events(0, 5)
+        attached = attach_array(share_array(events))
+        self.assertEqual(attached.to_list(), events.to_list())
+
+    def test_map_order(self):
+        chunks = [make_events(10 * i, 10 * i + 10) for i in range(6)]
+        with ChunkPool(functools.partial(make_scale, 3.0), n_workers=2, max_pending=3) as pool:
+            results = list(pool.map(chunks))
+
+        self.assertEqual(len(results), 6)
+        for chunk, result in zip(chunks, results):
+            self.assertEqual(result.y.to_list(), (chunk.x * 3.0).to_list())
+
+    def test_map_stats(self):
+        chunks = [make_events(10 * i, 10 * i + 10) for i in range(4)]
+        stats = defaultdict(float)
+        with ChunkPool(functools.partial(make_scale, 1.0), n_workers=2) as pool:
+            list(pool.map(chunks, stats=stats))
+
+        self.assertEqual(stats["num_events"], 40)
+        self.assertEqual(stats["sum_x"], sum(range(40)))
+        self.assertEqual(dict(stats["per_process"]), {0: 20, 1: 10, 2: 10})
+
+    def test_map_none(self):
+        chunks = [make_events(0, 3), None, make_events(3, 5)]
+        with ChunkPool(functools.partial(make_scale, 1.0), n_workers=2) as pool:
+            results = list(pool.map(chunks, return_stats=True))
+
+        self.assertEqual(results[1], (None, None))
+        self.assertEqual(results[2][0].y.to_list(), [3.0, 4.0])
+        self.assertEqual(results[2][1]["num_events"], 2)
+
+
+class ChunkLookaheadTest(unittest.TestCase):
+
+    def iter_chunks(self, n_chunks, size=5):
+        # mimics a ChunkedIOHandler with two sources
+        for i in range(n_chunks):
+            start = i * size
+            events = make_events(start, start + size)
+            columns = ak.Array({"z": np.ones(size)})
+            yield [events, columns], ChunkPosition(i, start, start + size, size)
+
+    def prepare(self, chunk):
+        events, columns = chunk
+        return ak.with_field(events, columns.z, "z") if len(events) else None
+
+    def test_loop(self):
+        orig_call = Selector.__call__
+        selector = Selector()
+        other = Selector()
+        stats = defaultdict(float)
+        local_stats = defaultdict(float)
+
+        with ChunkPool(functools.partial(make_scale, 2.0), n_workers=2, max_pending=2) as pool:
+            lookahead = ChunkLookahead(pool, self.iter_chunks(5), self.prepare, stats=True)
+            with pooled_calls(selector, lookahead):
+                indices = []
+                for (events, columns), pos in lookahead:
+                    indices.append(pos.index)
+                    result = selector(self.prepare((events, columns)), stats)
+                    self.assertEqual(result.y.to_list(), (events.x * 2.0).to_list())
+                    self.assertIn("z", result.fields)
+
+                    # other instances and repeated calls are computed locally
+                    other(events, local_stats)
+                    self.assertEqual(selector(events, local_stats).y.to_list(), result.y.to_list())
+
+        self.assertEqual(indices, list(range(5)))
+        self.assertEqual(stats["num_events"], 25)
+        self.assertEqual(stats["sum_x"], sum(range(25)))
+        self.assertEqual(local_stats["num_events"], 50)
+
+        # the original call is restored
+        self.assertIs(Selector.__call__, orig_call)
+
+    def test_skipped_chunks(self):
+        selector = Selector()
+        stats = defaultdict(float)
+
+        def prepare(chunk):
+            # the second chunk is left to the loop
+            return None if chunk[0].x[0] == 5 else self.prepare(chunk)
+
+        with ChunkPool(functools.partial(make_scale, 2.0), n_workers=2) as pool:
+            lookahead = ChunkLookahead(pool, self.iter_chunks(3), prepare, stats=True)
+            with pooled_calls(selector, lookahead):
+                for (events, columns), pos in lookahead:
+                    result = selector(self.prepare((events, columns)), stats)
+                    self.assertEqual(result.y.to_list(), (events.x * 2.0).to_list())
+
+        self.assertEqual(stats["num_events"], 15)
@@ -0,0 +1,40 @@
+# coding: utf-8
+
+__all__ = ["ParquetWriterTest"]
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import awkward as ak
+
+from azh.io.parquet import read_row_group_stats
+
+
+class ParquetWriterTest(unittest.TestCase):
+
+    def test_row_group_stats(self):
+        import columnflow.columnar_util
+        from azh.columnflow_patches import patch_parquet_writer
+
+        patch_parquet_writer()
+
+        events = ak.Array({
+            "process_id": np.repeat([1, 2, 3], 100),
+            "m_z": np.linspace(60.0, 120.0, 300),
+            "Jet": ak.unflatten(np.arange(600, dtype=np.float32), np.full(300, 2)),
+        })
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "events.parquet")
+            columnflow.columnar_util.sorted_ak_to_parquet(events, path, row_group_size=100)
+            stats = read_row_group_stats(path, ["process_id", "m_z"])
+
+            # the written file reads back unchanged
+            self.assertEqual(ak.from_parquet(path).tolist(), events.tolist())
+
+        self.assertEqual([n_rows for n_rows, _ in stats], [100, 100, 100])
+        self.assertEqual([s["process_id"] for _, s in stats], [(1, 1), (2, 2), (3, 3)])
+        self.assertAlmostEqual(stats[0][1]["m_z"][0], 60.0)
+        self.assertAlmostEqual(stats[2][1]["m_z"][1], 120.0)
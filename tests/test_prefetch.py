@@ -0,0 +1,149 @@
+# coding: utf-8
+
+__all__ = ["PrefetcherTest", "StageAreaTest"]
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from azh.io.prefetch import Prefetcher, StageArea, fetch_source
+
+
+class PrefetchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.tmp, "src")
+        self.stage_dir = os.path.join(self.tmp, "stage")
+        os.makedirs(self.src_dir)
+
+        self.sources = []
+        for i in range(4):
+            path = os.path.join(self.src_dir, f"nano_{i}.root")
+            with open(path, "w") as f:
+                f.write(str(i) * (i + 1))
+            self.sources.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def staged_files(self):
+        return sorted(os.listdir(self.stage_dir)) if os.path.exists(self.stage_dir) else []
+
+
+class PrefetcherTest(PrefetchTestCase):
+
+    def test_order_and_content(self):
+        contents = []
+        for src, path in Prefetcher(self.sources, self.stage_dir, n_ahead=2):
+            self.assertNotEqual(os.path.dirname(path), self.src_dir)
+            with open(path) as f:
+                contents.append((os.path.basename(src), f.read()))
+
+        self.assertEqual(contents, [(f"nano_{i}.root", str(i) * (i + 1)) for i in range(4)])
+        self.assertEqual(self.staged_files(), [])
+
+    def test_n_ahead(self):
+        max_staged = []
+
+        def fetch(src, dst):
+            max_staged.append(len(self.staged_files()))
+            fetch_source(src, dst)
+
+        for _ in Prefetcher(self.sources, self.stage_dir, n_ahead=2, fetch=fetch):
+            self.assertLessEqual(len(self.staged_files()), 2)
+        self.assertLessEqual(max(max_staged), 1)
+
+    def test_max_bytes(self):
+        # only one file at a time once the staged bytes exceed the limit
+        for _ in Prefetcher(self.sources, self.stage_dir, n_ahead=4, max_bytes=1):
+            self.assertEqual(len(self.staged_files()), 1)
+
+    def test_no_cleanup(self):
+        list(Prefetcher(self.sources, self.stage_dir, cleanup=False))
+        self.assertEqual(len(self.staged_files()), 4)
+
+    def test_fetch_error(self):
+        def fetch(src, dst):
+            if src.endswith("nano_2.root"):
+                with open(dst, "w") as f:
+                    f.write("partial")
+                raise IOError("fetch failed")
+            fetch_source(src, dst)
+
+        seen = []
+        with self.assertRaises(IOError):
+            for src, _ in Prefetcher(self.sources, self.stage_dir, fetch=fetch):
+                seen.append(os.path.basename(src))
+
+        self.assertEqual(seen, ["nano_0.root", "nano_1.root"])
+        self.assertEqual(self.staged_files(), [])
+
+    def test_early_stop(self):
+        staged = iter(Prefetcher(self.sources, self.stage_dir, n_ahead=3))
+        next(staged)
+        staged.close()
+        self.assertEqual(self.staged_files(), [])
+
+
+class StageAreaTest(PrefetchTestCase):
+
+    def test_stage_and_claim(self):
+        area = StageArea(self.stage_dir)
+        self.assertTrue(area.stage(lambda: [(src, src) for src in self.sources[:2]]))
+        area.wait()
+
+        path = area.claim(self.sources[0])
+        self.assertIsNotNone(path)
+        with open(path) as f:
+            self.assertEqual(f.read(), "0")
+        os.remove(path)
+
+        # claimed files are gone, unstaged files cannot be claimed
+        self.assertIsNone(area.claim(self.sources[0]))
+        self.assertIsNone(area.claim(self.sources[3]))
+        self.assertEqual(self.staged_files(), [os.path.basename(area.path(self.sources[1]))])
+
+    def test_shared_directory(self):
+        # files staged by one area are found by another one using the same directory
+        area = StageArea(self.stage_dir)
+        area.stage(lambda: [(self.sources[1], self.sources[1])])
+        area.wait()
+        self.assertIsNotNone(StageArea(self.stage_dir).claim(self.sources[1]))
+
+    def test_busy(self):
+        release = threading.Event()
+
+        def fetch(src, dst):
+            release.wait()
+            fetch_source(src, dst)
+
+        area = StageArea(self.stage_dir, fetch=fetch)
+        self.assertTrue(area.stage(lambda: [(self.sources[0], self.sources[0])]))
+        self.assertFalse(area.stage(lambda: [(self.sources[1], self.sources[1])]))
+
+        # nothing is visible before the fetch completed
+        self.assertIsNone(area.claim(self.sources[0]))
+        release.set()
+        area.wait()
+        self.assertIsNotNone(area.claim(self.sources[0]))
+
+    def test_max_bytes(self):
+        area = StageArea(self.stage_dir, max_bytes=1)
+        area.stage(lambda: [(src, src) for src in self.sources])
+        area.wait()
+        self.assertEqual(len(self.staged_files()), 1)
+
+    def test_fetch_error(self):
+        def fetch(src, dst):
+            with open(dst, "w") as f:
+                f.write("partial")
+            raise IOError("fetch failed")
+
+        area = StageArea(self.stage_dir, fetch=fetch)
+        area.stage(lambda: [(self.sources[0], self.sources[0])])
+        area.wait()
+        self.assertIsNone(area.claim(self.sources[0]))
+        self.assertEqual(self.staged_files(), [])
@@ -0,0 +1,63 @@
+# coding: utf-8
+
+__all__ = ["ColumnRoutingIndexTest"]
+
+import unittest
+
+import order as od
+
+from azh.config.routing import get_routing_index, invalidate_routing_index
+
+
+class ColumnRoutingIndexTest(unittest.TestCase):
+
+    def make_config(self):
+        campaign = od.Campaign("test_campaign", 1)
+        config = od.Config(name="test_config", id=1, campaign=campaign)
+        config.x.event_weights = {"normalization_weight": [], "muon_weight": []}
+        config.x.keep_columns = {
+            "cf.ReduceEvents": {"run", "event", "Jet.pt", "pdf_weight*"},
+        }
+        config.add_shift(name="nominal", id=0)
+        for i, direction in enumerate(["up", "down"]):
+            shift_inst = config.add_shift(name=f"muon_{direction}", id=1 + i, type="shape")
+            shift_inst.x.column_aliases = {"muon_weight": f"muon_weight_{direction}"}
+        return config
+
+    def test_keep(self):
+        index = get_routing_index(self.make_config())
+
+        self.assertTrue(index.keeps("cf.ReduceEvents", "run"))
+        self.assertTrue(index.keeps("cf.ReduceEvents", "pdf_weight_up"))
+        self.assertFalse(index.keeps("cf.ReduceEvents", "Jet.eta"))
+        self.assertFalse(index.keeps("cf.SelectEvents", "run"))
+        self.assertEqual(
+            index.resolve_keep("cf.ReduceEvents", ["event", "Jet.pt", "Jet.phi", "pdf_weight"]),
+            {"event", "Jet.pt", "pdf_weight"},
+        )
+
+    def test_aliases(self):
+        index = get_routing_index(self.make_config())
+
+        self.assertEqual(index.resolve("muon_weight", "muon_up"), "muon_weight_up")
+        self.assertEqual(index.resolve("muon_weight", "nominal"), "muon_weight")
+        self.assertEqual(index.shifts_aliasing("muon_weight"), {"muon_up", "muon_down"})
+        self.assertEqual(index.weight_columns(), {"normalization_weight", "muon_weight"})
+
+    def test_cache(self):
+        config = self.make_config()
+        index = get_routing_index(config)
+        self.assertIs(get_routing_index(config), index)
+
+        # adding a shift rebuilds the index
+        shift_inst = config.add_shift(name="pu_up", id=10, type="shape")
+        shift_inst.x.column_aliases = {"pu_weight": "pu_weight_up"}
+        index2 = get_routing_index(config)
+        self.assertIsNot(index2, index)
+        self.assertEqual(index2.resolve("pu_weight", "pu_up"), "pu_weight_up")
+
+        # other changes require explicit invalidation
+        config.x.event_weights["pu_weight"] = []
+        self.assertNotIn("pu_weight", get_routing_index(config).weight_columns())
+        invalidate_routing_index(config)
+        self.assertIn("pu_weight", get_routing_index(config).weight_columns())
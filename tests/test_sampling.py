@@ -0,0 +1,55 @@
+# coding: utf-8
+
+__all__ = ["SamplingTest"]
+
+import unittest
+
+import numpy as np
+
+from azh.io.sampling import active_sampling, get_active_sampling, sampled_entries
+
+
+class SamplingTest(unittest.TestCase):
+
+    def test_sampled_entries(self):
+        self.assertEqual(sampled_entries(1000, None), 1000)
+        self.assertEqual(sampled_entries(1000, 1.0), 1000)
+        self.assertEqual(sampled_entries(1000, 0.01), 10)
+        self.assertEqual(sampled_entries(1001, 0.01), 11)
+        self.assertEqual(sampled_entries(10, 0.01), 1)
+        self.assertEqual(sampled_entries(0, 0.01), 0)
+
+        # deterministic and stratified, i.e., each file contributes its fraction
+        sizes = [120000, 98765, 5]
+        first = [sampled_entries(n, 0.05) for n in sizes]
+        self.assertEqual(first, [sampled_entries(n, 0.05) for n in sizes])
+        self.assertEqual(first, [6000, 4939, 1])
+
+    def test_active_sampling(self):
+        self.assertIsNone(get_active_sampling())
+        with active_sampling(0.1):
+            self.assertEqual(get_active_sampling(), 0.1)
+            with active_sampling(None):
+                self.assertIsNone(get_active_sampling())
+            self.assertEqual(get_active_sampling(), 0.1)
+        self.assertIsNone(get_active_sampling())
+
+        # fractions of at least 1 disable the sampling
+        with active_sampling(1.0) as fraction:
+            self.assertIsNone(fraction)
+
+    def test_weight_rescaling(self):
+        # normalization weights are derived from the stats of read events only, so the sampled
+        # yield matches the full yield in expectation
+        rng = np.random.default_rng(42)
+        xs_lumi = 1234.5
+        mc_weight = rng.normal(1.0, 0.1, size=200000)
+
+        n = sampled_entries(len(mc_weight), 0.1)
+        sampled = mc_weight[:n]
+        norm_full = xs_lumi / mc_weight.sum()
+        norm_sampled = xs_lumi / sampled.sum()
+
+        self.assertAlmostEqual(norm_sampled / norm_full, len(mc_weight) / n, delta=0.05)
+        self.assertAlmostEqual((sampled * norm_sampled).sum(), xs_lumi)
+        self.assertAlmostEqual((mc_weight * norm_full).sum(), xs_lumi)
@@ -0,0 +1,163 @@
+# coding: utf-8
+
+__all__ = ["MaskToRangesTest", "SelectionIndexTest", "ReadSelectedChunkTest"]
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import namedtuple
+
+import numpy as np
+import awkward as ak
+
+from azh.util import mask_to_ranges
+from azh.io.selection_index import (
+    SelectionIndex, coalesce_ranges, expand_indices, read_selected_chunk,
+)
+
+
+ChunkPosition = namedtuple("ChunkPosition", ["index", "entry_start", "entry_stop", "max_chunk_size"])
+
+
+class MaskToRangesTest(unittest.TestCase):
+
+    def test_ranges(self):
+        mask = np.array([0, 1, 1, 0, 0, 1, 0, 1, 1, 1], dtype=bool)
+        self.assertEqual(mask_to_ranges(mask).tolist(), [[1, 3], [5, 6], [7, 10]])
+
+    def test_edges(self):
+        self.assertEqual(mask_to_ranges(np.ones(4, dtype=bool)).tolist(), [[0, 4]])
+        self.assertEqual(mask_to_ranges(np.zeros(4, dtype=bool)).shape, (0, 2))
+        self.assertEqual(mask_to_ranges(np.zeros(0, dtype=bool)).shape, (0, 2))
+
+    def test_roundtrip(self):
+        mask = np.random.default_rng(7).random(1000) < 0.2
+        index = SelectionIndex.from_mask(mask)
+        self.assertEqual(index.n_entries, 1000)
+        self.assertEqual(index.n_selected, mask.sum())
+        np.testing.assert_array_equal(index.mask(), mask)
+        np.testing.assert_array_equal(index.entries(), np.flatnonzero(mask))
+
+
+class SelectionIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mask = np.zeros(30, dtype=bool)
+        self.mask[[2, 3, 4, 8, 15, 16, 27]] = True
+        self.index = SelectionIndex.from_mask(self.mask)
+
+    def test_clip(self):
+        self.assertEqual(self.index.clip(3, 16).tolist(), [[3, 5], [8, 9], [15, 16]])
+        self.assertEqual(self.index.clip(9, 15).shape, (0, 2))
+
+    def test_mask(self):
+        np.testing.assert_array_equal(self.index.mask(3, 16), self.mask[3:16])
+        np.testing.assert_array_equal(self.index.mask(10, 30), self.mask[10:])
+
+    def test_coalesce_gap(self):
+        ranges = self.index.ranges
+        self.assertEqual(coalesce_ranges(ranges).tolist(), ranges.tolist())
+        self.assertEqual(
+            coalesce_ranges(ranges, max_gap=4).tolist(),
+            [[2, 9], [15, 17], [27, 28]],
+        )
+
+    def test_coalesce_clusters(self):
+        # ranges in the same or adjacent clusters are merged, empty clusters split them
+        offsets = np.array([0, 10, 20, 30])
+        self.assertEqual(coalesce_ranges(self.index.ranges, offsets=offsets).tolist(), [[2, 28]])
+        offsets = np.array([0, 10, 20, 25, 30])
+        self.assertEqual(
+            coalesce_ranges(self.index.ranges, offsets=offsets).tolist(),
+            [[2, 17], [27, 28]],
+        )
+        offsets = np.array([0, 5, 10, 15, 20, 25, 30])
+        self.assertEqual(
+            coalesce_ranges(self.index.ranges, offsets=offsets).tolist(),
+            [[2, 9], [15, 17], [27, 28]],
+        )
+
+    def test_save_load(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "index.npz")
+            self.index.save(path)
+            index = SelectionIndex.load(path)
+        finally:
+            shutil.rmtree(tmp)
+
+        self.assertEqual(index.n_entries, 30)
+        np.testing.assert_array_equal(index.ranges, self.index.ranges)
+
+
+class ReadSelectedChunkTest(unittest.TestCase):
+
+    def setUp(self):
+        n = 40
+        counts = np.arange(n) % 3
+        self.events = ak.Array({
+            "event": np.arange(n),
+            "Jet": ak.zip({"pt": ak.unflatten(np.arange(counts.sum(), dtype=np.float32), counts)}),
+        })
+        self.mask = np.zeros(n, dtype=bool)
+        self.mask[[3, 4, 12, 13, 14, 31]] = True
+        self.index = SelectionIndex.from_mask(self.mask)
+        self.offsets = np.arange(0, n + 1, 5)
+        self.reads = []
+
+    def read(self, pos):
+        self.reads.append((pos.entry_start, pos.entry_stop))
+        return self.events[pos.entry_start:pos.entry_stop]
+
+    def test_expand_indices(self):
+        mask = np.array([0, 1, 1, 0, 0, 1, 0], dtype=bool)
+        self.assertEqual(expand_indices(mask, [[1, 3], [5, 6]]).tolist(), [0, 0, 1, 0, 0, 2, 0])
+        self.assertEqual(expand_indices(mask, [[0, 7]]).tolist(), [1, 1, 2, 1, 1, 5, 1])
+        self.assertEqual(expand_indices(np.zeros(3, dtype=bool), [[0, 1]]).tolist(), [0, 0, 0])
+
+    def check(self, chunk, pos):
+        mask = self.mask[pos.entry_start:pos.entry_stop]
+        self.assertEqual(len(chunk), pos.entry_stop - pos.entry_start)
+        expected = self.events[pos.entry_start:pos.entry_stop][mask]
+        self.assertEqual(chunk[mask].to_list(), expected.to_list())
+
+    def test_clusters(self):
+        pos = ChunkPosition(0, 0, 20, 20)
+        chunk = read_selected_chunk(self.read, pos, self.index, offsets=self.offsets)
+        self.check(chunk, pos)
+
+        # clusters 0-5 and 10-15 are read, unselected entries repeat the first selected one
+        self.assertEqual(self.reads, [(3, 5), (12, 15)])
+        self.assertEqual(chunk.event[0], 3)
+
+    def test_full_read(self):
+        pos = ChunkPosition(1, 20, 40, 20)
+        chunk = read_selected_chunk(self.read, pos, self.index)
+        self.check(chunk, pos)
+        self.assertEqual(self.reads, [(20, 40)])
+        self.assertEqual(set(chunk.event[~self.mask[20:]].to_list()), {31})
+
+    def test_alignment(self):
+        # sources read per cluster and entirely have identical structures
+        pos = ChunkPosition(0, 0, 20, 20)
+        by_clusters = read_selected_chunk(self.read, pos, self.index, offsets=self.offsets)
+        full = read_selected_chunk(self.read, pos, self.index)
+        self.assertEqual(by_clusters.to_list(), full.to_list())
+
+    def test_no_selected_entries(self):
+        pos = ChunkPosition(0, 20, 30, 10)
+        chunk = read_selected_chunk(self.read, pos, self.index, offsets=self.offsets)
+        self.assertEqual(self.reads, [(20, 21)])
+        self.assertEqual(chunk.event.to_list(), 10 * [20])
+        self.assertEqual(
+            chunk.to_list(),
+            read_selected_chunk(self.read, pos, self.index).to_list(),
+        )
+
+    def test_all_selected(self):
+        index = SelectionIndex.from_mask(np.ones(40, dtype=bool))
+        pos = ChunkPosition(0, 0, 20, 20)
+        chunk = read_selected_chunk(self.read, pos, index, offsets=self.offsets)
+        self.assertEqual(self.reads, [(0, 20)])
+        self.assertEqual(chunk.to_list(), self.events[:20].to_list())
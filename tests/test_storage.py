@@ -0,0 +1,101 @@
+# coding: utf-8
+
+__all__ = ["ColumnStoragePolicyTest"]
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import awkward as ak
+
+from azh.io.storage import ColumnStoragePolicy, upcast
+from azh.io.merge import stream_merge_parquet
+
+
+class ColumnStoragePolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = ColumnStoragePolicy([
+            ("*.pdgId", {"dtype": "int8"}),
+            ("*.eta", {"mantissa_bits": 10}),
+            ("*weight*", {"dtype": "float32", "codec": "zstd", "level": 9}),
+            ("*", {"codec": "lz4"}),
+        ])
+
+    def make_events(self, n, offset=0):
+        counts = np.full(n, 2)
+        return ak.Array({
+            "event": np.arange(offset, offset + n, dtype=np.int64),
+            "mc_weight": np.linspace(0.5, 1.5, n),
+            "Muon": ak.zip({
+                "pdgId": ak.unflatten(np.tile([13, -13], n).astype(np.int32), counts),
+                "eta": ak.unflatten(np.linspace(-2.4, 2.4, 2 * n).astype(np.float32), counts),
+            }),
+        })
+
+    def write(self, events, path):
+        ak.to_parquet(
+            self.policy.apply(events),
+            path,
+            row_group_size=10,
+            **self.policy.writer_kwargs(events),
+        )
+
+    def test_lookup(self):
+        self.assertEqual(self.policy.lookup("Muon.pdgId"), {"dtype": "int8", "codec": "lz4"})
+        self.assertEqual(
+            self.policy.lookup("mc_weight"),
+            {"dtype": "float32", "codec": "zstd", "level": 9},
+        )
+        self.assertEqual(self.policy.lookup("event"), {"codec": "lz4"})
+
+    def test_upcast(self):
+        events = self.make_events(20)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "events.parquet")
+            self.write(events, path)
+            stored = ak.from_parquet(path)
+
+        # narrowed on disk, restored when read
+        self.assertEqual(stored.Muon.pdgId.layout.content.dtype, np.int8)
+        restored = upcast(stored)
+        self.assertEqual(restored.Muon.pdgId.layout.content.dtype, np.int32)
+        self.assertEqual(restored.Muon.pdgId.tolist(), events.Muon.pdgId.tolist())
+        self.assertEqual(restored.mc_weight.layout.dtype, np.float32)
+        self.assertEqual(restored.event.tolist(), events.event.tolist())
+        np.testing.assert_allclose(
+            ak.flatten(restored.Muon.eta).to_numpy(),
+            ak.flatten(events.Muon.eta).to_numpy(),
+            rtol=2**-10,
+        )
+
+    def test_merge_round_trip(self):
+        import pyarrow.parquet as pq
+
+        events = [self.make_events(15), self.make_events(7, offset=15)]
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, f"events_{i}.parquet") for i in range(len(events))]
+            for arr, path in zip(events, paths):
+                self.write(arr, path)
+
+            dst = os.path.join(tmp, "merged.parquet")
+            n_rows = stream_merge_parquet(paths, dst, row_group_size=20, policy=self.policy)
+            self.assertEqual(n_rows, 22)
+
+            # per-column codecs of the policy are kept
+            md = pq.ParquetFile(dst).metadata
+            for i in range(md.num_row_groups):
+                for j in range(md.num_columns):
+                    col = md.row_group(i).column(j)
+                    expected = "ZSTD" if "weight" in col.path_in_schema else "LZ4"
+                    self.assertIn(expected, col.compression.upper())
+
+            merged = upcast(ak.from_parquet(dst))
+
+        self.assertEqual(merged.event.tolist(), list(range(22)))
+        self.assertEqual(merged.Muon.pdgId.layout.content.dtype, np.int32)
+        self.assertEqual(
+            merged.Muon.pdgId.tolist(),
+            events[0].Muon.pdgId.tolist() + events[1].Muon.pdgId.tolist(),
+        )
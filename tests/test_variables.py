@@ -0,0 +1,59 @@
+# coding: utf-8
+
+__all__ = ["VariablePlanTest"]
+
+import unittest
+
+import numpy as np
+import awkward as ak
+import order as od
+
+from azh.histogramming.variables import VariablePlan
+
+
+class VariablePlanTest(unittest.TestCase):
+
+    def make_events(self):
+        return ak.Array({
+            "Jet": [
+                {"pt": [50.0, 40.0, 30.0], "eta": [0.1, -0.2, 0.3]},
+                {"pt": [60.0], "eta": [1.5]},
+                {"pt": [], "eta": []},
+            ],
+            "n_jet": [3, 1, 0],
+        })
+
+    def make_variables(self):
+        return [
+            od.Variable(name="jet1_pt", id=1, expression="Jet.pt[:,0]", binning=(10, 0, 100)),
+            od.Variable(name="jet2_pt", id=2, expression="Jet.pt[:,1]", binning=(10, 0, 100)),
+            od.Variable(name="jet2_eta", id=3, expression="Jet.eta[:,1]", binning=(10, -3, 3)),
+            od.Variable(name="n_jet", id=4, expression="n_jet", binning=(5, -0.5, 4.5)),
+            od.Variable(
+                name="ht",
+                id=5,
+                expression=lambda events: ak.sum(events.Jet.pt, axis=1),
+                binning=(10, 0, 200),
+                aux={"inputs": ["Jet.pt"]},
+            ),
+        ]
+
+    def test_columns(self):
+        plan = VariablePlan(self.make_variables())
+
+        self.assertEqual(plan.columns, {"Jet.pt", "Jet.eta", "n_jet"})
+        self.assertEqual(plan.pad_sizes, {"Jet.pt": 2, "Jet.eta": 2})
+
+    def test_values(self):
+        variable_insts = self.make_variables()
+        plan = VariablePlan(variable_insts)
+        values = plan(self.make_events())
+
+        self.assertEqual(list(values), [v.name for v in variable_insts])
+
+        null = variable_insts[0].null_value
+        np.testing.assert_array_equal(values["jet1_pt"], [50.0, 60.0, null])
+        np.testing.assert_array_equal(values["jet2_pt"], [40.0, null, null])
+        np.testing.assert_array_equal(values["jet2_eta"], [-0.2, null, null])
+        np.testing.assert_array_equal(np.asarray(values["n_jet"]), [3, 1, 0])
+        np.testing.assert_array_equal(np.asarray(values["ht"]), [120.0, 60.0, 0.0])
@@ -0,0 +1,68 @@
+# coding: utf-8
+
+__all__ = ["WeightShiftTest"]
+
+import unittest
+
+import numpy as np
+import awkward as ak
+import order as od
+
+from azh.histogramming.weights import is_weight_only_shift, get_weight_only_shifts, weight_rows
+
+
+class WeightShiftTest(unittest.TestCase):
+
+    def setUp(self):
+        campaign = od.Campaign("test_campaign", 1)
+        self.config_inst = config_inst = od.Config(name="test_weights", id=2, campaign=campaign)
+        self.dataset_inst = config_inst.add_dataset(name="tt", id=1, is_data=False)
+        config_inst.x.event_weights = {"normalization_weight": [], "muon_weight": []}
+
+        config_inst.add_shift(name="nominal", id=0)
+        for i, direction in enumerate(["up", "down"]):
+            shift_inst = config_inst.add_shift(name=f"muon_{direction}", id=1 + i, type="shape")
+            shift_inst.x.column_aliases = {"muon_weight": f"muon_weight_{direction}"}
+            shift_inst = config_inst.add_shift(name=f"jec_{direction}", id=3 + i, type="shape")
+            shift_inst.x.column_aliases_selection_dependent = {"Jet.pt": f"Jet.pt_jec_{direction}"}
+        config_inst.add_shift(
+            name="tune_up",
+            id=5,
+            type="shape",
+            tags={"disjoint_from_nominal"},
+        )
+
+        self.events = ak.Array({
+            "normalization_weight": [2.0, 2.0, 2.0],
+            "muon_weight": [1.0, 0.9, 1.1],
+            "muon_weight_up": [1.1, 1.0, 1.2],
+            "muon_weight_down": [0.9, 0.8, 1.0],
+        })
+
+    def test_weight_only(self):
+        get = self.config_inst.get_shift
+        args = (self.config_inst, self.dataset_inst)
+
+        self.assertTrue(is_weight_only_shift(*args, get("muon_up"), {"Jet.pt"}))
+        self.assertFalse(is_weight_only_shift(*args, get("nominal"), {"Jet.pt"}))
+        self.assertFalse(is_weight_only_shift(*args, get("jec_up"), {"Jet.pt"}))
+        self.assertFalse(is_weight_only_shift(*args, get("tune_up"), {"Jet.pt"}))
+
+        # shifts aliasing a column that is also histogrammed change the variable
+        self.assertFalse(is_weight_only_shift(*args, get("muon_up"), {"muon_weight"}))
+
+        self.assertEqual(get_weight_only_shifts(*args, {"Jet.pt"}), ["muon_up", "muon_down"])
+
+    def test_weight_rows(self):
+        shift_names = ["muon_up", "muon_down"]
+        rows = weight_rows(self.events, self.config_inst, self.dataset_inst, shift_names)
+
+        np.testing.assert_allclose(rows, [
+            [2.0, 1.8, 2.2],
+            [2.2, 2.0, 2.4],
+            [1.8, 1.6, 2.0],
+        ])
+
+        # shifts not aliasing any weight column are rejected
+        with self.assertRaises(ValueError):
+            weight_rows(self.events, self.config_inst, self.dataset_inst, ["tune_up"])
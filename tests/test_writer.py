@@ -0,0 +1,187 @@
+# coding: utf-8
+
+__all__ = ["BackgroundWriterTest", "WithBackgroundWriterTest"]
+
+import threading
+import time
+import unittest
+
+from azh.io.writer import (
+    BackgroundWriter, active_writer, get_active_writer, write, with_background_writer,
+)
+
+
+class BackgroundWriterTest(unittest.TestCase):
+
+    def test_order(self):
+        written = []
+
+        def slow_write(i):
+            time.sleep(0.002 * (i % 3))
+            written.append(i)
+
+        with BackgroundWriter(max_pending=2) as writer:
+            for i in range(10):
+                writer.submit(slow_write, i)
+
+        # all writes are done when the context exits
+        self.assertEqual(written, list(range(10)))
+        self.assertEqual(writer.n_written, 10)
+
+    def test_flush(self):
+        written = []
+        with BackgroundWriter(max_pending=4) as writer:
+            for i in range(3):
+                writer.submit(written.append, i)
+            writer.flush()
+            self.assertEqual(written, [0, 1, 2])
+
+    def test_back_pressure(self):
+        release = threading.Event()
+        submitted = []
+
+        writer = BackgroundWriter(max_pending=1)
+        writer.submit(release.wait)
+
+        def submit():
+            # one write is running, one is waiting, so the third submission blocks
+            for i in range(2):
+                writer.submit(submitted.append, i)
+                submitted.append(f"submitted {i}")
+
+        thread = threading.Thread(target=submit)
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(submitted, ["submitted 0"])
+
+        release.set()
+        thread.join()
+        writer.close()
+        self.assertEqual(submitted[-1], 1)
+
+    def test_error_on_flush(self):
+        def fail():
+            raise IOError("write failed")
+
+        written = []
+        writer = BackgroundWriter()
+        writer.submit(fail)
+        writer.submit(written.append, 1)
+        with self.assertRaises(IOError):
+            writer.flush()
+        writer.close()
+
+        # writes following a failed write are skipped
+        self.assertEqual(written, [])
+
+    def test_error_on_submit(self):
+        def fail():
+            raise IOError("write failed")
+
+        writer = BackgroundWriter()
+        writer.submit(fail)
+        writer._queue.join()
+        with self.assertRaises(IOError):
+            writer.submit(lambda: None)
+        writer.close()
+
+    def test_error_on_exit(self):
+        def fail():
+            raise IOError("write failed")
+
+        with self.assertRaises(IOError):
+            with BackgroundWriter() as writer:
+                writer.submit(fail)
+
+    def test_exception_not_masked(self):
+        def fail():
+            raise IOError("write failed")
+
+        with self.assertRaises(ValueError):
+            with BackgroundWriter() as writer:
+                writer.submit(fail)
+                writer._queue.join()
+                raise ValueError("computation failed")
+
+    def test_active_writer(self):
+        written = []
+
+        # without an active writer, writes happen immediately
+        write(written.append, 0)
+        self.assertEqual(written, [0])
+
+        with BackgroundWriter() as writer:
+            with active_writer(writer):
+                self.assertIs(get_active_writer(), writer)
+                write(written.append, 1)
+                writer.flush()
+                self.assertEqual(written, [0, 1])
+            self.assertIsNone(get_active_writer())
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            BackgroundWriter(max_pending=0)
+
+
+class WithBackgroundWriterTest(unittest.TestCase):
+
+    def outer(self, func, events):
+        # stand-in for decorators such as safe_output that finalize or remove outputs
+        def wrapper(*args, **kwargs):
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                events.append("remove outputs")
+                raise
+            events.append("finalize outputs")
+            return result
+        return wrapper
+
+    def test_writes_done_before_return(self):
+        events = []
+
+        def slow_write(i):
+            time.sleep(0.01)
+            events.append(f"write {i}")
+
+        def body(n):
+            self.assertIsNotNone(get_active_writer())
+            for i in range(n):
+                write(slow_write, i)
+            events.append("body done")
+            return n
+
+        run = self.outer(with_background_writer(body, max_pending=2), events)
+        self.assertEqual(run(3), 3)
+
+        self.assertEqual(events[-1], "finalize outputs")
+        self.assertEqual(sorted(events[:-1]), ["body done", "write 0", "write 1", "write 2"])
+        self.assertIsNone(get_active_writer())
+
+    def test_write_error_propagates(self):
+        events = []
+
+        def fail():
+            time.sleep(0.01)
+            raise IOError("write failed")
+
+        def body():
+            write(fail)
+            events.append("body done")
+
+        run = self.outer(with_background_writer(body), events)
+        with self.assertRaises(IOError):
+            run()
+        self.assertEqual(events, ["body done", "remove outputs"])
+
+    def test_body_error_propagates(self):
+        events = []
+
+        def body():
+            write(events.append, "write")
+            raise ValueError("computation failed")
+
+        run = self.outer(with_background_writer(body), events)
+        with self.assertRaises(ValueError):
+            run()
+        self.assertEqual(events[-1], "remove outputs")